@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Time Clock App - Startup Import Benchmark
+
+Imports each app module in a fresh interpreter with `python -X importtime`
+and reports the import time per module (median over several runs), so
+changes that pull more modules into the startup path show up.
+
+Run:     python bench_startup.py --output startup.json
+Compare: python bench_startup.py --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Module -> what importing it stands for
+TARGETS = {
+    'timeclock_core': 'headless core (storage, engine, reports)',
+    'timeclock_gui_enhanced': 'Tkinter app up to its first window',
+    'main': 'Kivy app up to its first screen',
+}
+
+
+def import_times(module):
+    """{module: (self us, cumulative us)} for one fresh `import module`"""
+    # Installed apps run from cached bytecode, so let the warm-up run write it
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=HERE, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        last_line = (result.stderr.strip().splitlines() or ['import failed'])[-1]
+        raise ImportError(last_line)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def bench_module(module, repeat):
+    """Median self / cumulative import time per module over `repeat` fresh imports"""
+    import_times(module)  # Warm up: compile .pyc files and the OS file cache
+    runs = [import_times(module) for _ in range(repeat)]
+    names = set().union(*runs)
+    modules = {}
+    for name in names:
+        samples = [run[name] for run in runs if name in run]
+        modules[name] = {
+            'self_ms': round(statistics.median(s[0] for s in samples) / 1000, 3),
+            'cumulative_ms': round(statistics.median(s[1] for s in samples) / 1000, 3),
+        }
+    return {
+        'total_ms': modules.get(module, {}).get('cumulative_ms', 0.0),
+        'module_count': len(modules),
+        'modules': modules,
+    }
+
+
+def run(targets, repeat=5):
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'targets': {},
+    }
+    for module in targets:
+        print(f"Timing import of {module}...", flush=True)
+        try:
+            report['targets'][module] = bench_module(module, repeat)
+        except ImportError as e:
+            report['targets'][module] = {'error': str(e)}
+    return report
+
+
+def print_results(report, top=15):
+    for module, result in report['targets'].items():
+        print(f"\n{module} ({TARGETS.get(module, '')})")
+        if 'error' in result:
+            print(f"  not importable here: {result['error']}")
+            continue
+        print(f"  total {result['total_ms']:.1f} ms, {result['module_count']} modules")
+        slowest = sorted(result['modules'].items(), key=lambda item: -item[1]['self_ms'])[:top]
+        for name, timing in slowest:
+            print(f"  {name:<40} self {timing['self_ms']:>8.3f} ms"
+                  f"  cumulative {timing['cumulative_ms']:>8.3f} ms")
+
+
+def compare(baseline, current, threshold):
+    """Targets whose total import time grew past threshold (ratio), and newly imported modules"""
+    regressions = []
+    for module, result in current['targets'].items():
+        old = baseline.get('targets', {}).get(module)
+        if not old or 'error' in old or 'error' in result or old['total_ms'] <= 0:
+            continue
+        ratio = result['total_ms'] / old['total_ms']
+        added = sorted(set(result['modules']) - set(old['modules']))
+        if ratio > threshold:
+            regressions.append((module, old['total_ms'], result['total_ms'], ratio, added))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the apps' startup imports")
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help="comma separated modules to import")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list")
+    parser.add_argument('--output', help="write results JSON to this file")
+    parser.add_argument('--compare', help="baseline results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args(argv)
+
+    targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    report = run(targets, args.repeat)
+    print_results(report, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\nRegressions (> {args.threshold:.2f}x baseline):")
+            for module, before, after, ratio, added in regressions:
+                print(f"  {module}: {before:.1f} -> {after:.1f} ms ({ratio:.2f}x)")
+                if added:
+                    print(f"    newly imported: {', '.join(added)}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Time Clock App - Benchmark Suite (Non-GUI)
+
+Generates a deterministic synthetic workload (users x days x shifts x notes)
+in a temporary data directory and times the core operations against it at
+several data sizes. Results are written as JSON so runs can be compared.
+
+Run:     python bench_timeclock.py --sizes small,medium --output bench.json
+Compare: python bench_timeclock.py --compare bench.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from timeclock_core import TimeClockEngine, export_csv, open_storage
+from timeclock_core.payroll import payroll, payroll_periods
+from timeclock_core.reports import CSV_HEADER
+
+# name -> (users, days of history, max shifts per day)
+SIZES = {
+    'small': (5, 30, 2),
+    'medium': (50, 365, 2),
+    'large': (200, 3 * 365, 3),
+}
+
+NOTES = [
+    '', '', '', 'Opening shift', 'Closing shift', 'Inventory count',
+    'Covered for a coworker', 'Training new hire', 'Delivery received',
+    'Register balanced, left late', 'Doctor appointment at lunch',
+]
+
+# The last generated day; a Friday so "this week" has history in it
+END_DATE = date(2025, 11, 14)
+NOW = datetime.combine(END_DATE, datetime.min.time()) + timedelta(hours=18)
+
+
+def generate_history(rng, days, max_shifts, end=END_DATE):
+    """One user's punches, oldest first (history entry dicts)"""
+    entries = []
+    for offset in range(days - 1, -1, -1):
+        day = end - timedelta(days=offset)
+        if day.weekday() >= 5 and rng.random() < 0.7:
+            continue  # Most weekends off
+        start = datetime.combine(day, datetime.min.time()) + timedelta(
+            hours=6, minutes=rng.randrange(0, 180, 5))
+        for _ in range(rng.randint(1, max_shifts)):
+            clock_in = start
+            clock_out = clock_in + timedelta(minutes=rng.randrange(120, 300, 5))
+            entries.append({
+                'clock_in': clock_in.isoformat(),
+                'clock_out': clock_out.isoformat(),
+                'duration_seconds': (clock_out - clock_in).total_seconds(),
+                'date': day.strftime('%Y-%m-%d'),
+                'note': rng.choice(NOTES),
+                'id': f"{rng.getrandbits(128):032X}"  # Unique string ids, as the app writes
+            })
+            start = clock_out + timedelta(minutes=rng.randrange(30, 90, 5))
+    return entries
+
+
+def generate_dataset(storage, users, days, max_shifts, seed=0):
+    """Fill storage with users x days x shifts punches; returns the punch count"""
+    rng = random.Random(seed)
+    names = [f"employee{i:03d}" for i in range(users)]
+    storage.save_users({name: {'created': '2022-01-01T09:00:00', 'total_hours': 0}
+                        for name in names})
+    punches = 0
+    for name in names:
+        history = generate_history(rng, days, max_shifts)
+        storage.replace_history(name, history)
+        storage.save_user_state(name, {'status': 'clocked_out', 'total_time_seconds': 0})
+        punches += len(history)
+    return punches
+
+
+def timed(func, repeat, setup=None):
+    """Run func `repeat` times (setup before each, untimed); returns timings in ms"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3)}
+
+
+def bench_size(name, backend, repeat, seed):
+    """Generate one data size and time every operation on it"""
+    users, days, max_shifts = SIZES[name]
+    data_dir = tempfile.mkdtemp(prefix=f"timeclock_bench_{name}_")
+    try:
+        storage = open_storage(backend, data_dir)
+        generate_start = time.perf_counter()
+        punches = generate_dataset(storage, users, days, max_shifts, seed)
+        generate_ms = (time.perf_counter() - generate_start) * 1000
+        storage.close()
+
+        # Operations run the way a front end does: one engine, one selected user
+        engine = TimeClockEngine(open_storage(backend, data_dir))
+        user = 'employee000'
+
+        def load():
+            engine.load_users()
+            engine.select_user(user)
+
+        def clock_cycle():
+            engine.clock_in('Benchmark', now=NOW)
+            engine.clock_out('In: Benchmark', now=NOW + timedelta(hours=1))
+
+        def export():
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(engine.csv_rows())
+
+        # What the apps do before their first screen: status and cached totals only
+        lazy = TimeClockEngine(open_storage(backend, data_dir), lazy=True)
+
+        def first_screen():
+            lazy.load_users()
+            lazy.select_user(user)
+            lazy.today_hours(NOW)
+            lazy.week_hours(NOW)
+
+        results = {'load': timed(load, repeat)}
+        results['first_screen'] = timed(first_screen, repeat)
+        lazy.storage.close()
+        user_punches = len(engine.history)
+        results['save'] = timed(engine.save_history, repeat)
+        results['clock_out'] = timed(clock_cycle, repeat)
+        results['today_total'] = timed(lambda: engine.today_hours(NOW), repeat)
+        results['week_total'] = timed(lambda: engine.week_hours(NOW), repeat)
+        results['report'] = timed(lambda: engine.hours_report(NOW), repeat,
+                                  setup=engine._reports.clear)
+        results['report_cached'] = timed(lambda: engine.hours_report(NOW), repeat)
+        results['csv_export'] = timed(export, repeat)
+        # Every user's punches for the last year, streamed from storage to a file
+        year_ago = END_DATE - timedelta(days=364)
+        export_path = os.path.join(data_dir, 'export.csv')
+        results['csv_export_all'] = timed(
+            lambda: export_csv(engine.storage, export_path, engine.users, year_ago, END_DATE), 1)
+
+        # All users' current week, previous week and last year, one range read each
+        periods = payroll_periods(END_DATE, year_ago, END_DATE)
+        results['payroll_all'] = timed(lambda: payroll(engine.storage, engine.users, periods), 1)
+
+        # Destructive: put the full history back before each run
+        original = engine.history.to_dicts()
+
+        def restore():
+            engine.storage.replace_history(user, original)
+            engine.select_user(user)
+
+        results['reset_weekly'] = timed(lambda: engine.archive_previous_weeks(NOW), repeat,
+                                        setup=restore)
+        engine.storage.close()
+
+        return {
+            'users': users,
+            'days': days,
+            'max_shifts': max_shifts,
+            'punches': punches,
+            'user_punches': user_punches,
+            'generate_ms': round(generate_ms, 3),
+            'results': results,
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def run(sizes, backend='json', repeat=5, seed=0):
+    """Benchmark each named size; returns the JSON-ready results document"""
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'repeat': repeat,
+        'seed': seed,
+        'sizes': {},
+    }
+    for name in sizes:
+        print(f"Benchmarking {name} ({backend})...", flush=True)
+        report['sizes'][name] = bench_size(name, backend, repeat, seed)
+    return report
+
+
+def compare(baseline, current, threshold, floor_ms=0.05):
+    """Operations slower than baseline by more than threshold (ratio); returns the list
+
+    Operations faster than floor_ms in both runs are timer noise and skipped.
+    """
+    regressions = []
+    for name, size in current['sizes'].items():
+        old = baseline.get('sizes', {}).get(name)
+        if not old:
+            continue
+        for op, timing in size['results'].items():
+            before = old['results'].get(op)
+            if not before or max(before['median_ms'], timing['median_ms']) < floor_ms:
+                continue
+            ratio = timing['median_ms'] / before['median_ms']
+            if ratio > threshold:
+                regressions.append((name, op, before['median_ms'], timing['median_ms'], ratio))
+    return regressions
+
+
+def print_results(report):
+    for name, size in report['sizes'].items():
+        print(f"\n{name}: {size['users']} users x {size['days']} days "
+              f"({size['punches']} punches, {size['user_punches']} for the benchmarked user)")
+        for op, timing in size['results'].items():
+            print(f"  {op:<14} {timing['median_ms']:>10.3f} ms  (min {timing['min_ms']:.3f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the time clock core")
+    parser.add_argument('--sizes', default='small,medium',
+                        help=f"comma separated, from: {', '.join(SIZES)}")
+    parser.add_argument('--backend', default='json', choices=['json', 'sqlite'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results JSON to this file")
+    parser.add_argument('--compare', help="baseline results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args(argv)
+
+    sizes = [name.strip() for name in args.sizes.split(',') if name.strip()]
+    unknown = [name for name in sizes if name not in SIZES]
+    if unknown:
+        parser.error(f"unknown size: {', '.join(unknown)}")
+
+    report = run(sizes, args.backend, args.repeat, args.seed)
+    print_results(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\nRegressions (> {args.threshold:.2f}x baseline):")
+            for name, op, before, after, ratio in regressions:
+                print(f"  {name}/{op}: {before:.3f} -> {after:.3f} ms ({ratio:.2f}x)")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,275 +4,123 @@ Simplified version of timeclock_gui_enhanced.py adapted for mobile
 """
 
 import kivy
+from kivy.config import Config
+from kivy.utils import platform as kivy_platform
+
+# Set window size for testing on desktop (before the window is created,
+# so the first screen is not drawn twice)
+if kivy_platform not in ('android', 'ios'):
+    Config.set('graphics', 'width', '400')
+    Config.set('graphics', 'height', '700')
+
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
-from kivy.uix.popup import Popup
+from kivy.uix.screenmanager import NoTransition, Screen, ScreenManager
 from kivy.uix.scrollview import ScrollView
-from kivy.core.window import Window
 import datetime
-import json
-import os
 
-# Set window size for testing on desktop
-Window.size = (400, 700)
+from timeclock_core import (CumulativeColumn, TimeClockEngine, WriteBehindStorage,
+                            format_hours_minutes, format_timedelta, open_storage,
+                            parse_punch_times)
+from timeclock_core.profiling import instrument
+from timeclock_core.reports import format_decimal_hours
+from timeclock_core.sync import changes_from_env
+from timeclock_timers import TimerRegistry
 
 
 class TimeClockApp(App):
+    # Screen name -> method that builds it (once) and returns (layout, refresh)
+    SCREENS = {
+        'first_user': 'create_first_user_screen',
+        'user_selection': 'create_user_selection_screen',
+        'main': 'create_main_screen',
+        'history': 'create_history_screen',
+        'archive': 'create_archive_screen',
+        'print': 'create_print_screen',
+        'diagnostics': 'create_diagnostics_screen',
+    }
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         
-        # File paths
-        self.data_file = 'timeclock_data.json'
-        self.history_file = 'timeclock_history.json'
-        self.users_file = 'timeclock_users.json'
-        self.weekly_archive_file = 'timeclock_weekly_archive.json'
-        
-        # State variables
-        self.current_user = None
-        self.current_status = 'clocked_out'
-        self.clock_in_time = None
-        self.clock_in_note = None
-        self.total_time_today = datetime.timedelta()
-        self.history = []
-        self.users = {}
-        self.weekly_archive = {}
+        # Users, clock status, punches and totals live in the headless engine.
+        # Storage (JSON files or SQLite, see TIMECLOCK_STORAGE) is written from
+        # a background thread so punches never wait on the disk. Closed weeks
+        # are archived when a user is selected and when a new week starts.
+        # Lazy: the first screen shows cached totals while history loads in the background
+        # Punches and note edits are logged for syncing with the desktop app (if set up)
+        self.engine = TimeClockEngine(WriteBehindStorage(open_storage()), auto_rollover=True,
+                                      lazy=True, changes=changes_from_env())
+        instrument(self.engine)  # Call timings, only with TIMECLOCK_PROFILE set
+        self.timers = TimerRegistry(Clock)  # Scheduled callbacks, cancelled with their screen
+        self.screens = ScreenManager(transition=NoTransition())
+        self.screen_refresh = {}  # Screen name -> callable that updates it before it is shown
+        self.report_all_users = False  # Print screen shows the payroll sheet for every user
         
         # Load existing data
-        self.load_users()
-        self.load_history()
-        self.load_weekly_archive()
-    
-    def load_users(self):
-        """Load users from file"""
-        if os.path.exists(self.users_file):
-            try:
-                with open(self.users_file, 'r') as f:
-                    self.users = json.load(f)
-            except:
-                self.users = {}
-    
-    def save_users(self):
-        """Save users to file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
-    
-    def load_history(self):
-        """Load history from file"""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    all_history = json.load(f)
-                    self.history = all_history.get(self.current_user, []) if self.current_user else []
-            except:
-                self.history = []
-        else:
-            self.history = []
-    
-    def save_history(self):
-        """Save history to file"""
-        all_history = {}
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    all_history = json.load(f)
-            except:
-                pass
-        
-        all_history[self.current_user] = self.history
-        
-        with open(self.history_file, 'w') as f:
-            json.dump(all_history, f, indent=2)
-    
-    def load_weekly_archive(self):
-        """Load weekly archive from file"""
-        if os.path.exists(self.weekly_archive_file):
-            try:
-                with open(self.weekly_archive_file, 'r') as f:
-                    self.weekly_archive = json.load(f)
-            except:
-                self.weekly_archive = {}
-        else:
-            self.weekly_archive = {}
-    
-    def save_weekly_archive(self):
-        """Save weekly archive to file"""
-        with open(self.weekly_archive_file, 'w') as f:
-            json.dump(self.weekly_archive, f, indent=2)
-    
-    def add_to_weekly_archive(self, week_end_date, total_hours, entries_count):
-        """Add a week's total to the archive"""
-        if self.current_user not in self.weekly_archive:
-            self.weekly_archive[self.current_user] = []
-        
-        week_entry = {
-            'week_end': week_end_date,
-            'total_hours': total_hours,
-            'entries_count': entries_count,
-            'archived_date': datetime.datetime.now().isoformat()
-        }
-        self.weekly_archive[self.current_user].append(week_entry)
-        self.save_weekly_archive()
-    
-    def load_user_data(self):
-        """Load current user's data"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    user_data = data.get(self.current_user, {})
-                    
-                    if user_data.get('status') == 'clocked_in':
-                        self.current_status = 'clocked_in'
-                        self.clock_in_time = datetime.datetime.fromisoformat(
-                            user_data['clock_in_time'])
-                        self.clock_in_note = user_data.get('clock_in_note')
-                    else:
-                        self.current_status = 'clocked_out'
-                        self.clock_in_note = None
-                    
-                    if 'total_time_seconds' in user_data:
-                        self.total_time_today = datetime.timedelta(
-                            seconds=user_data['total_time_seconds'])
-            except:
-                self.current_status = 'clocked_out'
-    
-    def save_user_data(self):
-        """Save current user's data"""
-        all_data = {}
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    all_data = json.load(f)
-            except:
-                pass
-        
-        user_data = {
-            'status': self.current_status,
-            'total_time_seconds': self.total_time_today.total_seconds()
-        }
-        if self.current_status == 'clocked_in':
-            user_data['clock_in_time'] = self.clock_in_time.isoformat()
-            if self.clock_in_note:
-                user_data['clock_in_note'] = self.clock_in_note
-        
-        all_data[self.current_user] = user_data
-        
-        with open(self.data_file, 'w') as f:
-            json.dump(all_data, f, indent=2)
-    
-    def add_history_entry(self, clock_in, clock_out, duration, note=""):
-        """Add entry to history"""
-        if note:
-            words = note.split()
-            if len(words) > 20:
-                note = " ".join(words[:20])
-        
-        entry = {
-            'clock_in': clock_in.isoformat(),
-            'clock_out': clock_out.isoformat(),
-            'duration_seconds': duration.total_seconds(),
-            'date': clock_in.strftime('%Y-%m-%d'),
-            'note': note,
-            'id': len(self.history)
-        }
-        self.history.append(entry)
-        self.save_history()
-    
-    def format_timedelta(self, td):
-        """Format timedelta to readable string"""
-        total_seconds = int(td.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-    
-    def format_hours(self, td):
-        """Format timedelta to hours decimal (e.g. 7.5 hours)"""
-        total_seconds = td.total_seconds()
-        hours = total_seconds / 3600
-        return f"{hours:.1f}"
-    
-    def format_hours_minutes(self, td):
-        """Format timedelta to hours and minutes (e.g. 7h 30m)"""
-        total_seconds = int(td.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        return f"{hours}h {minutes}m"
-    
-    def get_today_hours(self):
-        """Get total hours clocked in today"""
-        today = datetime.datetime.now().date()
-        today_total = datetime.timedelta()
-        
-        for entry in self.history:
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            if clock_in.date() == today:
-                duration = datetime.timedelta(seconds=entry['duration_seconds'])
-                today_total += duration
-        
-        # Add current session if clocked in
-        if self.current_status == 'clocked_in':
-            current_session = datetime.datetime.now() - self.clock_in_time
-            today_total += current_session
-        
-        return today_total
-    
-    def get_weekly_hours(self):
-        """Get total hours clocked in this week (last 7 days)"""
-        today = datetime.datetime.now().date()
-        week_start = today - datetime.timedelta(days=today.weekday())  # Monday
-        week_total = datetime.timedelta()
-        
-        for entry in self.history:
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            if week_start <= clock_in.date() <= today:
-                duration = datetime.timedelta(seconds=entry['duration_seconds'])
-                week_total += duration
-        
-        # Add current session if clocked in
-        if self.current_status == 'clocked_in':
-            current_session = datetime.datetime.now() - self.clock_in_time
-            week_total += current_session
-        
-        return week_total
-    
-    def get_daily_breakdown(self):
-        """Get hours per day for the week"""
-        today = datetime.datetime.now().date()
-        week_start = today - datetime.timedelta(days=today.weekday())  # Monday
-        daily_hours = {}
-        
-        # Initialize all days
-        for i in range(7):
-            day = week_start + datetime.timedelta(days=i)
-            daily_hours[day.strftime('%a')] = datetime.timedelta()
-        
-        # Sum up entries
-        for entry in self.history:
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            if week_start <= clock_in.date() <= today:
-                day_name = clock_in.strftime('%a')
-                duration = datetime.timedelta(seconds=entry['duration_seconds'])
-                daily_hours[day_name] += duration
-        
-        # Add current session if clocked in
-        if self.current_status == 'clocked_in':
-            current_session = datetime.datetime.now() - self.clock_in_time
-            today_name = today.strftime('%a')
-            daily_hours[today_name] += current_session
-        
-        return daily_hours
-    
+        self.engine.load_users()
+    
+    def show_screen(self, name):
+        """Switch to a screen, building it only the first time it is shown"""
+        if not self.screens.has_screen(name):
+            layout, refresh = getattr(self, self.SCREENS[name])()
+            screen = Screen(name=name)
+            screen.add_widget(layout)
+            self.screens.add_widget(screen)
+            self.screen_refresh[name] = refresh
+        
+        # The screen being left stops its timers until it is shown again
+        current = self.screens.current_screen
+        if current is not None and current.name != name:
+            self.timers.release(current)
+        
+        screen = self.screens.get_screen(name)
+        if self.screen_refresh[name]:
+            self.screen_refresh[name](screen)
+        self.screens.current = name
+    
+    def on_stop(self):
+        """Cancel every scheduled callback and finish queued saves when the app closes"""
+        self.timers.release_all()
+        self.sync_devices()
+        self.engine.storage.close()
+
+    def on_pause(self):
+        """Finish queued saves when Android backgrounds the app (it may be killed)"""
+        self.sync_devices()
+        self.engine.storage.flush()
+        return True
+    
+    def sync_devices(self):
+        """Exchange punches with other devices through TIMECLOCK_SYNC_DIR, if set"""
+        try:
+            return self.engine.sync_folder()
+        except Exception as e:
+            print(f"Sync failed: {e}")
+            return 0
+
+    def sync_in_background(self):
+        """Sync from the prefetch thread, then redraw the current screen on the UI thread"""
+        if self.sync_devices():
+            Clock.schedule_once(lambda dt: self.refresh_current_screen())
+
+    def refresh_current_screen(self):
+        name = self.screens.current
+        if self.screen_refresh.get(name):
+            self.screen_refresh[name](self.screens.current_screen)
+
     def build(self):
         """Build the main UI"""
-        if not self.users:
-            return self.create_first_user_screen()
+        if not self.engine.users:
+            self.show_screen('first_user')
         else:
-            return self.show_user_selection_screen()
+            self.show_screen('user_selection')
+        return self.screens
     
     def create_first_user_screen(self):
         """Screen to create first user"""
@@ -289,18 +137,12 @@ class TimeClockApp(App):
         layout.add_widget(username_input)
         
         def create_user():
-            if username_input.text.strip():
-                self.users[username_input.text] = {
-                    'created': datetime.datetime.now().isoformat(),
-                    'total_hours': 0
-                }
-                self.current_user = username_input.text
-                self.save_users()
-                self.load_user_data()
-                self.root.clear_widgets()
-                self.root.add_widget(self.create_main_screen())
-            else:
-                self.show_popup('Error', 'Username is required!')
+            try:
+                username = self.engine.add_user(username_input.text)
+            except ValueError as e:
+                self.show_popup('Error', str(e))
+                return
+            self.select_user(username)
         
         create_btn = Button(text='Create Account', size_hint_y=0.2)
         create_btn.bind(on_press=lambda x: create_user())
@@ -308,9 +150,13 @@ class TimeClockApp(App):
         
         layout.add_widget(Label(size_hint_y=0.4))  # Spacer
         
-        return layout
+        return layout, None
     
     def show_user_selection_screen(self):
+        """Go to the user selection screen"""
+        self.show_screen('user_selection')
+    
+    def create_user_selection_screen(self):
         """Screen to select user - Modern purple, black, white theme"""
         from kivy.graphics import Color, Rectangle
         
@@ -350,8 +196,9 @@ class TimeClockApp(App):
         
         # User list with purple buttons and options
         user_list = GridLayout(cols=1, spacing=10, size_hint_y=0.65)
+        shown_users = []  # Names the rows were built for
         
-        for username in self.users.keys():
+        def add_user_row(username):
             # Container for user button and options
             user_container = BoxLayout(size_hint_y=None, height=60, spacing=5)
             
@@ -391,6 +238,15 @@ class TimeClockApp(App):
             
             user_list.add_widget(user_container)
         
+        def refresh(screen):
+            # Rows are only rebuilt after a user is added, renamed or deleted
+            if shown_users == list(self.engine.users):
+                return
+            shown_users[:] = list(self.engine.users)
+            user_list.clear_widgets()
+            for username in shown_users:
+                add_user_row(username)
+        
         scroll = ScrollView(size_hint=(1, 0.65))
         scroll.add_widget(user_list)
         layout.add_widget(scroll)
@@ -412,18 +268,26 @@ class TimeClockApp(App):
         
         layout.add_widget(bottom_layout)
         
-        return layout
+        return layout, refresh
     
     def select_user(self, username):
         """Select a user"""
-        self.current_user = username
-        self.load_user_data()
-        self.load_history()
-        self.root.clear_widgets()
-        self.root.add_widget(self.create_main_screen())
+        try:
+            self.engine.select_user(username)
+        except Exception as e:
+            # Damaged files are restored from backup by storage; this means both failed
+            self.show_popup('Error', f'Could not load history: {e}')
+        # Syncing waits on the disk (or a network folder), so it runs before
+        # the history read on the prefetch thread rather than here
+        self.engine.prefetch(on_error=lambda e: Clock.schedule_once(
+            lambda dt: self.show_popup('Error', f'Could not load history: {e}')),
+            before=self.sync_in_background)
+        self.show_screen('main')
     
     def show_new_user_dialog(self, instance):
         """Show dialog to create new user"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         username_input = TextInput(
@@ -435,18 +299,15 @@ class TimeClockApp(App):
         btn_layout = BoxLayout(size_hint_y=0.3, spacing=10)
         
         def create():
-            if username_input.text.strip():
-                if username_input.text in self.users:
-                    self.show_popup('Error', 'User already exists!')
-                else:
-                    self.users[username_input.text] = {
-                        'created': datetime.datetime.now().isoformat(),
-                        'total_hours': 0
-                    }
-                    self.save_users()
-                    popup.dismiss()
-                    self.root.clear_widgets()
-                    self.root.add_widget(self.show_user_selection_screen())
+            if not username_input.text.strip():
+                return
+            try:
+                self.engine.add_user(username_input.text)
+            except ValueError as e:
+                self.show_popup('Error', str(e))
+                return
+            popup.dismiss()
+            self.show_user_selection_screen()
         
         btn_layout.add_widget(Button(text='Create', on_press=lambda x: create()))
         btn_layout.add_widget(Button(text='Cancel', on_press=lambda x: popup.dismiss()))
@@ -457,6 +318,8 @@ class TimeClockApp(App):
     
     def show_edit_user_dialog(self, username):
         """Show dialog to edit username"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         new_name_input = TextInput(
@@ -470,21 +333,15 @@ class TimeClockApp(App):
         btn_layout = BoxLayout(size_hint_y=0.3, spacing=10)
         
         def update_name():
-            new_name = new_name_input.text.strip()
-            if not new_name:
-                self.show_popup('Error', 'Username cannot be empty!')
-                return
-            if new_name in self.users and new_name != username:
-                self.show_popup('Error', 'Username already exists!')
+            try:
+                new_name = self.engine.rename_user(username, new_name_input.text)
+            except ValueError as e:
+                self.show_popup('Error', str(e))
                 return
             
-            # Update user data
-            self.users[new_name] = self.users.pop(username)
-            self.save_users()
             self.show_popup('Success', f'Username changed to {new_name}')
             popup.dismiss()
-            self.root.clear_widgets()
-            self.root.add_widget(self.show_user_selection_screen())
+            self.show_user_selection_screen()
         
         btn_layout.add_widget(Button(text='Save', on_press=lambda x: update_name()))
         btn_layout.add_widget(Button(text='Cancel', on_press=lambda x: popup.dismiss()))
@@ -495,6 +352,8 @@ class TimeClockApp(App):
     
     def show_delete_user_dialog(self, username):
         """Show confirmation dialog to delete user"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         content.add_widget(Label(
@@ -505,18 +364,12 @@ class TimeClockApp(App):
         btn_layout = BoxLayout(size_hint_y=0.4, spacing=10)
         
         def delete_user():
-            del self.users[username]
-            self.save_users()
-            
-            # Also delete user's history files if they exist
-            user_history_file = f'timeclock_history_{username}.json'
-            if os.path.exists(user_history_file):
-                os.remove(user_history_file)
+            # Also deletes the user's shard files (history, session data, archive)
+            self.engine.delete_user(username)
             
             self.show_popup('Success', f'User {username} deleted')
             popup.dismiss()
-            self.root.clear_widgets()
-            self.root.add_widget(self.show_user_selection_screen())
+            self.show_user_selection_screen()
         
         btn_layout.add_widget(Button(text='Delete', background_color=(0.8, 0, 0, 1), on_press=lambda x: delete_user()))
         btn_layout.add_widget(Button(text='Cancel', on_press=lambda x: popup.dismiss()))
@@ -531,6 +384,8 @@ class TimeClockApp(App):
     
     def show_missed_punch_dialog(self):
         """Show dialog to add missed punch entry - 24 hour clock"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         # Date input
@@ -579,47 +434,20 @@ class TimeClockApp(App):
                 clock_out_str = clock_out_input.text.strip()
                 note = note_input.text.strip()
                 
-                # Validate date format
-                date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-                
-                # Parse times
-                clock_in_time_parts = clock_in_str.split(':')
-                clock_out_time_parts = clock_out_str.split(':')
-                
-                if len(clock_in_time_parts) != 2 or len(clock_out_time_parts) != 2:
-                    self.show_popup('Error', 'Times must be in HH:MM format')
-                    return
-                
-                # Create datetime objects
-                clock_in_dt = datetime.datetime.combine(
-                    date_obj,
-                    datetime.time(int(clock_in_time_parts[0]), int(clock_in_time_parts[1]))
-                )
-                clock_out_dt = datetime.datetime.combine(
-                    date_obj,
-                    datetime.time(int(clock_out_time_parts[0]), int(clock_out_time_parts[1]))
-                )
-                
-                # Validate times
-                if clock_out_dt <= clock_in_dt:
-                    self.show_popup('Error', 'Clock out time must be after clock in time')
-                    return
-                
-                # Calculate session time
-                session_time = clock_out_dt - clock_in_dt
+                # Validate the date and HH:MM times (raises ValueError)
+                clock_in_dt, clock_out_dt = parse_punch_times(date_str, clock_in_str, clock_out_str)
                 
                 # Add to history
-                self.add_history_entry(clock_in_dt, clock_out_dt, session_time, f"[MISSED] {note}")
+                punch = self.engine.add_punch(clock_in_dt, clock_out_dt, f"[MISSED] {note}")
                 
-                session_display = self.format_hours_minutes(session_time)
+                session_display = format_hours_minutes(datetime.timedelta(seconds=punch.duration))
                 self.show_popup(
                     'Success',
                     f'Missed punch added!\nDate: {date_str}\nTime: {session_display}'
                 )
                 
                 popup.dismiss()
-                self.root.clear_widgets()
-                self.root.add_widget(self.create_main_screen())
+                self.show_screen('main')
                 
             except ValueError as e:
                 self.show_popup('Error', f'Invalid input: {str(e)}')
@@ -635,15 +463,21 @@ class TimeClockApp(App):
     
     def create_main_screen(self):
         """Create main application screen"""
-        from kivy.clock import Clock
-        
         layout = BoxLayout(orientation='vertical', padding=10, spacing=5)
         
-        # Header
-        header = Label(text=f'⏰ {self.current_user}', size_hint_y=0.08, 
+        # Header (set for the current user in refresh)
+        header = Label(text='', size_hint_y=0.08, 
                       font_size='20sp', bold=True)
         layout.add_widget(header)
         
+        def on_header_touch(label, touch):
+            # Hidden: triple-tap the header for call timings (TIMECLOCK_PROFILE only)
+            if self.engine.profiler and label.collide_point(*touch.pos) and touch.is_triple_tap:
+                self.show_screen('diagnostics')
+                return True
+        
+        header.bind(on_touch_down=on_header_touch)
+        
         # Current time (will be updated by timer)
         current_time = Label(
             text=datetime.datetime.now().strftime('%I:%M:%S %p'),
@@ -653,7 +487,7 @@ class TimeClockApp(App):
         layout.add_widget(current_time)
         
         # Status (will be updated by timer)
-        status_text = '🟢 CLOCKED IN' if self.current_status == 'clocked_in' else '🔴 CLOCKED OUT'
+        status_text = '🟢 CLOCKED IN' if self.engine.clocked_in else '🔴 CLOCKED OUT'
         status = Label(text=status_text, size_hint_y=0.08, font_size='16sp', bold=True)
         layout.add_widget(status)
         
@@ -692,18 +526,15 @@ class TimeClockApp(App):
         )
         
         def on_clock_in():
-            if self.current_status == 'clocked_in':
-                self.show_popup('Error', 'Already clocked in!')
+            try:
+                clock_in_time = self.engine.clock_in(notes_input.text.strip())
+            except ValueError as e:
+                self.show_popup('Error', str(e))
                 return
             
-            self.current_status = 'clocked_in'
-            self.clock_in_time = datetime.datetime.now()
-            self.clock_in_note = notes_input.text.strip()
-            self.save_user_data()
-            self.show_popup('Success', f'Clocked in at {self.clock_in_time.strftime("%I:%M:%S %p")}')
+            self.show_popup('Success', f'Clocked in at {clock_in_time.strftime("%I:%M:%S %p")}')
             notes_input.text = ''
-            self.root.clear_widgets()
-            self.root.add_widget(self.create_main_screen())
+            update_display(0)
         
         clock_in_btn.bind(on_press=lambda x: on_clock_in())
         button_layout.add_widget(clock_in_btn)
@@ -715,29 +546,21 @@ class TimeClockApp(App):
         )
         
         def on_clock_out():
-            if self.current_status == 'clocked_out':
+            if not self.engine.clocked_in:
                 self.show_popup('Error', 'Already clocked out!')
                 return
             
-            clock_out_time = datetime.datetime.now()
-            session_time = clock_out_time - self.clock_in_time
-            self.total_time_today += session_time
-            
             note = notes_input.text.strip()
-            if self.clock_in_note:
-                note = f"In: {self.clock_in_note} | Out: {note}" if note else f"In: {self.clock_in_note}"
+            clock_in_note = self.engine.clock_in_note
+            if clock_in_note:
+                note = f"In: {clock_in_note} | Out: {note}" if note else f"In: {clock_in_note}"
             
-            self.add_history_entry(self.clock_in_time, clock_out_time, session_time, note)
-            
-            self.current_status = 'clocked_out'
-            self.clock_in_note = None
-            self.save_user_data()
+            punch = self.engine.clock_out(note)
             
             self.show_popup('Success', 
-                          f'Clocked out\nSession: {self.format_timedelta(session_time)}')
+                          f'Clocked out\nSession: {format_timedelta(datetime.timedelta(seconds=punch.duration))}')
             notes_input.text = ''
-            self.root.clear_widgets()
-            self.root.add_widget(self.create_main_screen())
+            update_display(0)
         
         clock_out_btn.bind(on_press=lambda x: on_clock_out())
         button_layout.add_widget(clock_out_btn)
@@ -771,147 +594,171 @@ class TimeClockApp(App):
         # Timer to update labels every second
         def update_display(dt):
             try:
+                # Archive last week once Monday arrives (no-op otherwise)
+                self.engine.check_rollover()
+                
                 # Update time
                 current_time.text = datetime.datetime.now().strftime('%I:%M:%S %p')
                 
                 # Update status
-                status_text = '🟢 CLOCKED IN' if self.current_status == 'clocked_in' else '🔴 CLOCKED OUT'
+                status_text = '🟢 CLOCKED IN' if self.engine.clocked_in else '🔴 CLOCKED OUT'
                 status.text = status_text
                 
                 # Update hours display
-                today_hours = self.get_today_hours()
-                weekly_hours = self.get_weekly_hours()
-                today_display = self.format_hours_minutes(today_hours)
-                weekly_display = self.format_hours_minutes(weekly_hours)
+                today_hours = self.engine.today_hours()
+                weekly_hours = self.engine.week_hours()
+                today_display = format_hours_minutes(today_hours)
+                weekly_display = format_hours_minutes(weekly_hours)
                 stats_label.text = f"Today: {today_display} | Week: {weekly_display}"
                 
                 # Update time info
-                time_info.text = f'Total today: {self.format_timedelta(today_hours)}'
+                time_info.text = f'Total today: {format_timedelta(today_hours)}'
             except:
                 pass
         
-        # Schedule the update to run every 1 second
-        Clock.schedule_interval(update_display, 1)
+        shown_user = [None]
         
-        return layout
+        def refresh(screen):
+            # Only the user-dependent widgets change when switching users
+            if shown_user[0] != self.engine.current_user:
+                shown_user[0] = self.engine.current_user
+                header.text = f'⏰ {self.engine.current_user}'
+                notes_input.text = ''
+            update_display(0)
+            
+            # Schedule the update to run every 1 second, for as long as this screen is shown
+            self.timers.release(screen)
+            self.timers.schedule_interval(screen, update_display, 1)
+        
+        return layout, refresh
     
     def show_history_screen(self):
+        """Go to the history screen"""
+        self.show_screen('history')
+    
+    def create_history_screen(self):
         """Show history in a scrollable list with cumulative total hours"""
+        from timeclock_lists import LazyRecycleView
+
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         layout.add_widget(Label(text='Time Clock History', size_hint_y=0.1, 
                                font_size='18sp', bold=True))
         
-        history_list = GridLayout(cols=1, spacing=5, size_hint_y=0.8)
+        rows = LazyRecycleView(0, None, 100, size_hint=(1, 0.8))
+        layout.add_widget(rows)
+        shown = {}  # Punch store and length the rows were set up for
+        
+        def refresh(screen):
+            punches = self.engine.history
+            count = len(punches)
+            if shown.get('punches') is punches and shown.get('count') == count:
+                return
+            shown.update(punches=punches, count=count)
+            rows.set_rows(count, self.history_row_text(punches, count))
         
-        # Sort history by date (oldest first to calculate cumulative totals)
-        sorted_history = sorted(self.history, key=lambda x: x['clock_in'])
+        back_btn = Button(text='Back', size_hint_y=0.1)
+        back_btn.bind(on_press=lambda x: self.show_screen('main'))
+        layout.add_widget(back_btn)
+        
+        return layout, refresh
+    
+    def history_row_text(self, punches, count):
+        """Row text callable for the history list (newest first)"""
+        # The punch store is sorted by clock in; rows are displayed newest first
+        def punch_at(row):
+            return punches[count - 1 - row]
         
-        cumulative_total = datetime.timedelta()
+        # Total down to each row, only computed as far as the list is scrolled
+        cumulative = CumulativeColumn(count, lambda row: punch_at(row).duration)
         
-        # Reverse for display (newest first) but calculate cumulative from oldest
-        for entry in reversed(sorted_history):
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            clock_out = datetime.datetime.fromisoformat(entry['clock_out'])
-            duration = datetime.timedelta(seconds=entry['duration_seconds'])
-            cumulative_total += duration
+        def row_text(row):
+            punch = punch_at(row)
+            clock_in = punch.clock_in_dt
+            clock_out = punch.clock_out_dt
+            duration = datetime.timedelta(seconds=punch.duration)
             
-            session_time_display = self.format_hours_minutes(duration)
-            cumulative_time_display = self.format_hours_minutes(cumulative_total)
+            session_time_display = format_hours_minutes(duration)
+            cumulative_time_display = format_hours_minutes(
+                datetime.timedelta(seconds=cumulative[row]))
             
             entry_text = f"{clock_in.strftime('%Y-%m-%d')}\nIn: {clock_in.strftime('%I:%M %p')} → Out: {clock_out.strftime('%I:%M %p')}\nSession: {session_time_display} | Total: {cumulative_time_display}"
-            if entry.get('note'):
-                entry_text += f"\nNote: {entry['note']}"
-            
-            history_list.add_widget(Label(
-                text=entry_text,
-                size_hint_y=None,
-                height=100,
-                markup=True
-            ))
-        
-        scroll = ScrollView(size_hint=(1, 0.8))
-        scroll.add_widget(history_list)
-        layout.add_widget(scroll)
-        
-        back_btn = Button(text='Back', size_hint_y=0.1)
-        back_btn.bind(on_press=lambda x: (self.root.clear_widgets(), 
-                                          self.root.add_widget(self.create_main_screen())))
-        layout.add_widget(back_btn)
+            if punch.note:
+                entry_text += f"\nNote: {punch.note}"
+            return entry_text
         
-        self.root.clear_widgets()
-        self.root.add_widget(layout)
+        return row_text
     
     def show_archive_screen(self):
+        """Go to the previous weeks archive screen"""
+        self.show_screen('archive')
+    
+    def create_archive_screen(self):
         """Show archived previous weeks data"""
+        from timeclock_lists import LazyRecycleView
+
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         layout.add_widget(Label(text='Previous Weeks Archive', size_hint_y=0.1, 
                                font_size='18sp', bold=True))
         
-        archive_list = GridLayout(cols=1, spacing=5, size_hint_y=0.8)
-        
-        # Get archived weeks for current user
-        user_archive = self.weekly_archive.get(self.current_user, [])
+        # Holds either the empty message or the list, whichever applies
+        body = BoxLayout(size_hint_y=0.8)
+        layout.add_widget(body)
+        empty_label = Label(
+            text='No previous weeks archived yet.\n\nUse "Reset Weekly" to archive data.'
+        )
+        rows = LazyRecycleView(0, None, 90)
+        shown = {}  # Archive list and length the rows were set up for
         
-        if not user_archive:
-            archive_list.add_widget(Label(
-                text='No previous weeks archived yet.\n\nUse "Reset Weekly" to archive data.',
-                size_hint_y=None,
-                height=100
-            ))
-        else:
-            # Sort by week_end date (newest first)
-            sorted_archive = sorted(user_archive, key=lambda x: x['week_end'], reverse=True)
+        def refresh(screen):
+            # Get archived weeks for current user
+            user_archive = self.engine.archive
+            if shown.get('archive') is user_archive and shown.get('count') == len(user_archive):
+                return
+            shown.update(archive=user_archive, count=len(user_archive))
+            
+            body.clear_widgets()
+            if not user_archive:
+                body.add_widget(empty_label)
+                return
             
-            for week in sorted_archive:
+            # The archive is kept in week_end order; list it newest first
+            def row_text(row):
+                week = user_archive.newest(row)
                 week_end = datetime.datetime.fromisoformat(week['week_end']).date()
-                total_hours = week['total_hours']
                 entries_count = week['entries_count']
                 archived_date = datetime.datetime.fromisoformat(week['archived_date'])
                 
-                # Convert total_hours (decimal) to hours and minutes
-                hours = int(total_hours)
-                minutes = int((total_hours - hours) * 60)
-                
-                entry_text = (
+                return (
                     f"Week Ended: {week_end.strftime('%Y-%m-%d (%A)')}\n"
-                    f"Total: {hours}h {minutes}m | Entries: {entries_count}\n"
+                    f"Total: {format_decimal_hours(week['total_hours'])} | Entries: {entries_count}\n"
                     f"Archived: {archived_date.strftime('%Y-%m-%d %I:%M %p')}"
                 )
-                
-                archive_list.add_widget(Label(
-                    text=entry_text,
-                    size_hint_y=None,
-                    height=90,
-                    markup=True
-                ))
-        
-        scroll = ScrollView(size_hint=(1, 0.8))
-        scroll.add_widget(archive_list)
-        layout.add_widget(scroll)
+            
+            rows.set_rows(len(user_archive), row_text)
+            body.add_widget(rows)
         
         back_btn = Button(text='Back', size_hint_y=0.1)
-        back_btn.bind(on_press=lambda x: (self.root.clear_widgets(), 
-                                          self.root.add_widget(self.create_main_screen())))
+        back_btn.bind(on_press=lambda x: self.show_screen('main'))
         layout.add_widget(back_btn)
         
-        self.root.clear_widgets()
-        self.root.add_widget(layout)
+        return layout, refresh
     
     def show_print_screen(self):
+        """Go to the printable hours report screen"""
+        self.show_screen('print')
+    
+    def create_print_screen(self):
         """Show printable hours report for current and previous week"""
         layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         layout.add_widget(Label(text='Hours Report', size_hint_y=0.08, 
                                font_size='18sp', bold=True))
         
-        # Generate report content
-        report_text = self.generate_hours_report()
-        
-        # Display report in a scrollable text area
+        # Display report in a scrollable text area (filled in by refresh)
         report_display = Label(
-            text=report_text,
+            text='',
             size_hint_y=0.8,
             markup=True,
             valign='top',
@@ -923,7 +770,18 @@ class TimeClockApp(App):
         layout.add_widget(scroll)
         
         # Buttons for print actions
-        button_layout = GridLayout(cols=2, spacing=10, size_hint_y=0.12)
+        button_layout = GridLayout(cols=3, spacing=10, size_hint_y=0.12)
+        
+        # Switch between this user's report and the all-employee payroll sheet
+        scope_btn = Button(text='All Employees')
+        
+        def toggle_scope(btn):
+            self.report_all_users = not self.report_all_users
+            btn.text = 'This User' if self.report_all_users else 'All Employees'
+            report_display.text = self.generate_hours_report()
+        
+        scope_btn.bind(on_press=toggle_scope)
+        button_layout.add_widget(scope_btn)
         
         print_btn = Button(text='Print (System)')
         print_btn.bind(on_press=lambda x: self.print_report())
@@ -936,73 +794,65 @@ class TimeClockApp(App):
         layout.add_widget(button_layout)
         
         back_btn = Button(text='Back', size_hint_y=0.1)
-        back_btn.bind(on_press=lambda x: (self.root.clear_widgets(), 
-                                          self.root.add_widget(self.create_main_screen())))
+        back_btn.bind(on_press=lambda x: self.show_screen('main'))
         layout.add_widget(back_btn)
         
-        self.root.clear_widgets()
-        self.root.add_widget(layout)
+        def refresh(screen):
+            # Generate report content (includes the running session)
+            report_display.text = self.generate_hours_report()
+        
+        return layout, refresh
     
-    def generate_hours_report(self):
-        """Generate a text report of current and previous week hours"""
-        today = datetime.datetime.now().date()
-        week_start = today - datetime.timedelta(days=today.weekday())  # Monday
-        week_end = week_start + datetime.timedelta(days=6)  # Sunday
-        
-        # Get current week hours
-        current_week_duration = self.get_weekly_hours()
-        current_week_display = self.format_hours_minutes(current_week_duration)
-        
-        # Get previous week hours from archive
-        user_archive = self.weekly_archive.get(self.current_user, [])
-        previous_week_hours = "No data"
-        previous_week_display = ""
-        
-        if user_archive:
-            # Get most recent archived week
-            sorted_archive = sorted(user_archive, key=lambda x: x['week_end'], reverse=True)
-            if sorted_archive:
-                recent_week = sorted_archive[0]
-                previous_week_end = datetime.datetime.fromisoformat(recent_week['week_end']).date()
-                total_hours_decimal = recent_week['total_hours']
-                
-                # Convert to hours and minutes
-                hours = int(total_hours_decimal)
-                minutes = int((total_hours_decimal - hours) * 60)
-                previous_week_display = f"{hours}h {minutes}m"
-        
-        # Generate report with ASCII characters (no special Unicode)
-        report = (
-            f"=======================================\n"
-            f"        HOURS WORKED REPORT\n"
-            f"         User: {self.current_user}\n"
-            f"    Printed: {datetime.datetime.now().strftime('%Y-%m-%d %I:%M %p')}\n"
-            f"=======================================\n\n"
-            f"CURRENT WEEK\n"
-            f"Period: {week_start.strftime('%a, %b %d')} - {week_end.strftime('%a, %b %d')}\n"
-            f"Hours Worked: {current_week_display}\n\n"
-            f"---------------------------------------\n"
-            f"PREVIOUS WEEK\n"
-        )
+    def create_diagnostics_screen(self):
+        """Show call counts and timings recorded with TIMECLOCK_PROFILE"""
+        from timeclock_core.profiling import format_text
         
-        if user_archive and sorted_archive:
-            recent_week = sorted_archive[0]
-            previous_week_end = datetime.datetime.fromisoformat(recent_week['week_end']).date()
-            previous_week_start = previous_week_end - datetime.timedelta(days=6)
-            
-            report += (
-                f"Period: {previous_week_start.strftime('%a, %b %d')} - {previous_week_end.strftime('%a, %b %d')}\n"
-                f"Hours Worked: {previous_week_display}\n"
-            )
-        else:
-            report += f"No previous week data available.\n"
+        layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
-        report += (
-            f"---------------------------------------\n"
-            f"=======================================\n"
-        )
+        layout.add_widget(Label(text='Diagnostics', size_hint_y=0.08, 
+                               font_size='18sp', bold=True))
+        
+        stats_display = Label(text='', size_hint_y=None, font_name='RobotoMono-Regular',
+                              font_size='11sp', valign='top', halign='left')
+        stats_display.bind(
+            width=lambda label, width: setattr(label, 'text_size', (width, None)),
+            texture_size=lambda label, size: setattr(label, 'height', size[1]))
+        scroll = ScrollView(size_hint=(1, 0.72))
+        scroll.add_widget(stats_display)
+        layout.add_widget(scroll)
+        
+        def show_stats():
+            stats_display.text = format_text(self.engine.profiler.rows())
+        
+        def save_stats():
+            try:
+                path = self.engine.profiler.dump()
+                self.show_popup('Saved', f'Timings written to\n{path}')
+            except Exception as e:
+                self.show_popup('Error', f'Could not save timings: {e}')
         
-        return report
+        def reset_stats():
+            self.engine.profiler.reset()
+            show_stats()
+        
+        button_layout = GridLayout(cols=3, spacing=10, size_hint_y=0.1)
+        button_layout.add_widget(Button(text='Refresh', on_press=lambda x: show_stats()))
+        button_layout.add_widget(Button(text='Save', on_press=lambda x: save_stats()))
+        button_layout.add_widget(Button(text='Reset', on_press=lambda x: reset_stats()))
+        layout.add_widget(button_layout)
+        
+        back_btn = Button(text='Back', size_hint_y=0.1)
+        back_btn.bind(on_press=lambda x: self.show_screen('main'))
+        layout.add_widget(back_btn)
+        
+        return layout, lambda screen: show_stats()
+    
+    def generate_hours_report(self):
+        """Generate a text report of current and previous week hours"""
+        if self.report_all_users:
+            # Every user's totals from one range read each; no user switching
+            return self.engine.payroll_report()
+        return self.engine.hours_report()
     
     def print_report(self):
         """Print the hours report - opens system print dialog"""
@@ -1069,75 +919,27 @@ class TimeClockApp(App):
     
     def reset_weekly_hours(self):
         """Reset weekly hours - archive completed week (Mon-Sun), keep current week and daily hours"""
-        # Get the start of the current week (Monday)
-        today = datetime.datetime.now().date()
-        week_start = today - datetime.timedelta(days=today.weekday())  # Monday of this week
-        
-        # Calculate week end (Sunday of this week)
-        week_end = week_start + datetime.timedelta(days=6)  # Sunday
-        
-        # Get ALL entries this week (Monday through today)
-        current_week_entries = [
-            entry for entry in self.history
-            if datetime.datetime.fromisoformat(entry['clock_in']).date() >= week_start
-        ]
-        
-        # Get current session if clocked in
-        current_session_duration = datetime.timedelta()
-        if self.current_status == 'clocked_in' and self.clock_in_time:
-            current_session_duration = datetime.datetime.now() - self.clock_in_time
-        
-        # Calculate current week total (entries + current session)
-        week_total_seconds = sum(entry.get('duration_seconds', 0) for entry in current_week_entries)
-        week_total_seconds += current_session_duration.total_seconds()
-        week_total_duration = datetime.timedelta(seconds=week_total_seconds)
-        
-        # Get entries from previous weeks (before this week's Monday)
-        previous_weeks_entries = [
-            entry for entry in self.history
-            if datetime.datetime.fromisoformat(entry['clock_in']).date() < week_start
-        ]
-        
-        # Calculate total hours for the previous week(s) being archived
-        if previous_weeks_entries:
-            total_seconds = sum(entry.get('duration_seconds', 0) for entry in previous_weeks_entries)
-            total_hours = round(total_seconds / 3600, 2)
-            
-            # Archive uses the END date of the week being archived (previous Sunday)
-            prev_week_end = (week_start - datetime.timedelta(days=1)).isoformat()
-            
-            # Add to archive before removing entries
-            self.add_to_weekly_archive(prev_week_end, total_hours, len(previous_weeks_entries))
-        
-        # Filter history to keep only current week entries (Mon onwards)
-        original_count = len(self.history)
-        self.history = [
-            entry for entry in self.history
-            if datetime.datetime.fromisoformat(entry['clock_in']).date() >= week_start
-        ]
-        removed_count = original_count - len(self.history)
-        
-        # Save the updated history
-        self.save_history()
+        summary = self.engine.archive_previous_weeks()
         
         # Show summary with current week total and week range
-        current_week_display = self.format_hours_minutes(week_total_duration)
-        week_range = f"{week_start.strftime('%a %b %d')} - {week_end.strftime('%a %b %d')}"
+        current_week_display = format_hours_minutes(summary['week_total'])
+        week_range = f"{summary['week_start'].strftime('%a %b %d')} - {summary['week_end'].strftime('%a %b %d')}"
         self.show_popup(
             'Weekly Hours Reset',
             f'Week: {week_range}\n'
             f'This Week Total: {current_week_display}\n\n'
-            f'Archived: {removed_count} entries from previous weeks\n'
-            f'Kept: {len(self.history)} entries from current week'
+            f'Archived: {summary["archived"]} entries in {summary["weeks"]} previous weeks\n'
+            f'Kept: {summary["kept"]} entries from current week'
         )
     
     def switch_user(self):
         """Switch to different user"""
-        self.root.clear_widgets()
-        self.root.add_widget(self.show_user_selection_screen())
+        self.show_user_selection_screen()
     
     def show_popup(self, title, message):
         """Show a popup message"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         content.add_widget(Label(text=message))
         
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Time Clock App - Payroll Report
+
+Current week, previous week and an optional custom period for every user,
+computed in one pass over storage (see timeclock_core/payroll.py).
+
+Run: python payroll_report.py --format csv --from 2025-11-01 --to 2025-11-30
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from timeclock_core import open_storage
+from timeclock_core.payroll import FORMATS, payroll, payroll_periods, render
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Payroll report for every time clock user")
+    parser.add_argument('--format', default='text', choices=FORMATS)
+    parser.add_argument('--from', dest='start', help="custom period start (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='end', help="custom period end (YYYY-MM-DD)")
+    parser.add_argument('--week-of', help="a day in the 'current' week (default: today)")
+    parser.add_argument('--users', help="comma separated (default: all users)")
+    parser.add_argument('--workers', type=int, default=1, help="processes to spread users over")
+    parser.add_argument('--storage', default=None, choices=['json', 'sqlite'],
+                        help="backend (default: TIMECLOCK_STORAGE or json)")
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        start = datetime.date.fromisoformat(args.start) if args.start else None
+        end = datetime.date.fromisoformat(args.end) if args.end else None
+        today = datetime.date.fromisoformat(args.week_of) if args.week_of else None
+    except ValueError as e:
+        parser.error(f"invalid date: {e}")
+    users = [u.strip() for u in args.users.split(',')] if args.users else None
+
+    storage = open_storage(args.storage, args.data_dir)
+    try:
+        periods = payroll_periods(today, start, end)
+        rows = payroll(storage, users, periods, args.workers, args.storage, args.data_dir)
+    finally:
+        storage.close()
+
+    report = render(rows, periods, args.format)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
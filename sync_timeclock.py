@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Time Clock App - Device Sync
+
+Exchanges punches added or edited since the last sync with another copy
+of the app (see timeclock_core/sync.py), through a shared folder or one
+TCP connection.
+
+Run: python sync_timeclock.py --folder /media/usb/timeclock
+     python sync_timeclock.py --serve --host 0.0.0.0 --secret S   (on the office PC)
+     python sync_timeclock.py --connect 192.168.1.20 --secret S
+
+--serve listens on 127.0.0.1 unless --host says otherwise; any other
+address needs a shared secret (--secret or TIMECLOCK_SYNC_SECRET) that
+the connecting device must also give.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from timeclock_core import open_storage
+from timeclock_core.sync import (DEFAULT_PORT, SECRET_VAR, ChangeLog, is_loopback, serve_once,
+                                 sync_folder, sync_socket)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync punches with another time clock device")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--folder', help="shared folder to drop and pick up sync files")
+    mode.add_argument('--serve', action='store_true', help="wait for one device to connect")
+    mode.add_argument('--connect', metavar='HOST', help="sync with a device running --serve")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on with --serve")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--secret', default=os.environ.get(SECRET_VAR),
+                        help=f"shared secret for socket sync (default: {SECRET_VAR})")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds to wait for the peer")
+    parser.add_argument('--storage', default=None, choices=['json', 'sqlite'],
+                        help="backend (default: TIMECLOCK_STORAGE or json)")
+    parser.add_argument('--data-dir', default='.')
+    args = parser.parse_args(argv)
+    if args.serve and not args.secret and not is_loopback(args.host):
+        parser.error(f"--serve on {args.host} needs --secret (or {SECRET_VAR})")
+
+    storage = open_storage(args.storage, args.data_dir)
+    log = ChangeLog(args.data_dir)
+    try:
+        if args.folder:
+            applied = sync_folder(log, storage, args.folder)
+        elif args.serve:
+            print(f"Waiting for a device on port {args.port}...", flush=True)
+            applied = serve_once(log, storage, args.host, args.port, args.timeout,
+                                 secret=args.secret)
+        else:
+            applied = sync_socket(log, storage, args.connect, args.port, args.timeout,
+                                  secret=args.secret)
+    except OSError as e:
+        print(f"Sync failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        storage.close()
+
+    print(f"Applied {applied} change{'s' if applied != 1 else ''} from other devices")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,26 @@ import tempfile
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_startup
+import bench_timeclock
+from timeclock_core import fileio
+from timeclock_core import payroll
+from timeclock_core import profiling
+from timeclock_core import sync
+from timeclock_core.archive import ArchiveIndex
+from timeclock_core.export import ExportCancelled, export_csv
+from timeclock_core.engine import TimeClockEngine, parse_punch_times, parse_time
+from timeclock_core.fileio import read_json, write_json_atomic
+from timeclock_core.journal import HistoryJournal
+from timeclock_core.persist import WriteBehindStorage
+from timeclock_core.punches import Punch, PunchStore
+from timeclock_core.reports import HistoryPager, format_hours_minutes, hours_report
+from timeclock_core.storage import JsonStorage, SqliteStorage, open_storage
+from timeclock_core.totals import CumulativeColumn, DayIndex, RunningTotals
+from timeclock_timers import TimerRegistry
+
 # Color codes for output
 GREEN = '\033[92m'
 RED = '\033[91m'
@@ -24,6 +44,25 @@ RESET = '\033[0m'
 BOLD = '\033[1m'
 
 
+def _kiosk_worker(data_dir, kiosk, punches):
+    """One kiosk process punching against a shared data directory"""
+    storage = JsonStorage(data_dir)
+    users = storage.load_users()
+    users[f"kiosk{kiosk}"] = {"created": "2025-11-01", "total_hours": 0}
+    storage.save_users(users)
+    for i in range(punches):
+        start = datetime(2025, 11, 10, 8) + timedelta(minutes=kiosk * 1000 + i)
+        entry = {"clock_in": start.isoformat(),
+                 "clock_out": (start + timedelta(minutes=30)).isoformat(),
+                 "duration_seconds": 1800, "date": start.strftime('%Y-%m-%d'),
+                 "note": f"kiosk {kiosk}", "id": i}
+        storage.append_history("shared", entry)
+        storage.append_history(f"kiosk{kiosk}", entry)
+        state = storage.load_user_state("shared")
+        state[f"kiosk{kiosk}"] = i
+        storage.save_user_state("shared", state)
+
+
 class TimeClockTester:
     """Test suite for Time Clock App logic"""
     
@@ -138,14 +177,9 @@ class TimeClockTester:
     
     def test_format_hours_to_hm(self):
         """Test formatting hours to H:MM format"""
-        def format_hours_minutes(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            return f"{hours}h {minutes}m"
-        
-        self.assert_equal(format_hours_minutes(28800), "8h 0m", "Format 8 hours")
-        self.assert_equal(format_hours_minutes(27000), "7h 30m", "Format 7.5 hours")
-        self.assert_equal(format_hours_minutes(146700), "40h 45m", "Format 40h 45m")
+        self.assert_equal(format_hours_minutes(timedelta(seconds=28800)), "8h 0m", "Format 8 hours")
+        self.assert_equal(format_hours_minutes(timedelta(seconds=27000)), "7h 30m", "Format 7.5 hours")
+        self.assert_equal(format_hours_minutes(timedelta(seconds=146700)), "40h 45m", "Format 40h 45m")
     
     # ==================== Weekly Totals Tests ====================
     
@@ -263,36 +297,21 @@ class TimeClockTester:
         print(f"\n{BOLD}[7. Missed Punch Feature]{RESET}")
         
         # Parse 24-hour format
-        def parse_24h_time(time_str):
-            """Parse HH:MM to minutes since midnight"""
-            parts = time_str.split(":")
-            hours = int(parts[0])
-            minutes = int(parts[1])
-            return hours * 60 + minutes
+        clock_in, clock_out = parse_punch_times("2025-11-10", "08:30", "17:15")
         
-        clock_in = "08:30"  # 8:30 AM
-        clock_out = "17:15"  # 5:15 PM
-        
-        in_minutes = parse_24h_time(clock_in)
-        out_minutes = parse_24h_time(clock_out)
-        duration_minutes = out_minutes - in_minutes
-        
-        self.assert_equal(in_minutes, 510, "8:30 AM = 510 minutes")
-        self.assert_equal(out_minutes, 1035, "5:15 PM = 1035 minutes")
-        self.assert_equal(duration_minutes, 525, "Duration = 8 hours 45 minutes")
+        self.assert_equal(clock_in, datetime(2025, 11, 10, 8, 30), "8:30 AM parsed")
+        self.assert_equal(clock_out, datetime(2025, 11, 10, 17, 15), "5:15 PM parsed")
+        self.assert_equal((clock_out - clock_in).total_seconds() // 60, 525,
+                          "Duration = 8 hours 45 minutes")
     
     def test_missed_punch_validation(self):
         """Test missed punch input validation"""
         def validate_time(time_str):
             """Validate HH:MM format"""
-            parts = time_str.split(":")
-            if len(parts) != 2:
-                return False
             try:
-                h = int(parts[0])
-                m = int(parts[1])
-                return 0 <= h < 24 and 0 <= m < 60
-            except:
+                parse_time(time_str)
+                return True
+            except ValueError:
                 return False
         
         self.assert_true(validate_time("08:30"), "Valid time 08:30")
@@ -302,6 +321,13 @@ class TimeClockTester:
         self.assert_equal(validate_time("24:00"), False, "Invalid time 24:00")
         self.assert_equal(validate_time("08:60"), False, "Invalid time 08:60")
         self.assert_equal(validate_time("25:00"), False, "Invalid time 25:00")
+        
+        try:
+            parse_punch_times("2025-11-10", "17:00", "09:00")
+            rejected = False
+        except ValueError:
+            rejected = True
+        self.assert_true(rejected, "Clock out before clock in rejected")
     
     # ==================== Archive Tests ====================
     
@@ -350,27 +376,1457 @@ class TimeClockTester:
         """Test generating text report"""
         print(f"\n{BOLD}[9. Report Generation]{RESET}")
         
-        today = datetime.now().strftime("%B %d, %Y")
-        report = f"""
-╔════════════════════════════════╗
-║   TIME CLOCK REPORT - ALICE    ║
-╚════════════════════════════════╝
+        previous = {"week_end": "2025-11-09", "total_hours": 38.5}
+        report = hours_report("alice", datetime(2025, 11, 10).date(), timedelta(hours=42.5),
+                              previous, now=datetime(2025, 11, 14, 17, 0))
+        
+        self.assert_true("HOURS WORKED REPORT" in report, "Report contains header")
+        self.assert_true("User: alice" in report, "Report names the user")
+        self.assert_true("Period: Mon, Nov 10 - Sun, Nov 16" in report, "Current week period")
+        self.assert_true("Hours Worked: 42h 30m" in report, "Report contains weekly total")
+        self.assert_true("Period: Mon, Nov 03 - Sun, Nov 09" in report, "Previous week period")
+        self.assert_true("Hours Worked: 38h 30m" in report, "Previous week total")
+        
+        report = hours_report("alice", datetime(2025, 11, 10).date(), timedelta())
+        self.assert_true("No previous week data available." in report, "Report without archive")
+    
+    # ==================== Punch Journal Tests ====================
+    
+    def test_punch_journal(self):
+        """Test append-only journal replays on top of the snapshot"""
+        print(f"\n{BOLD}[10. Punch Journal]{RESET}")
+        
+        history_file = os.path.join(self.test_dir, "journal_history.json")
+        with open(history_file, 'w') as f:
+            json.dump({"bob": [{"clock_in": "2025-11-10T08:00:00",
+                                "clock_out": "2025-11-10T16:00:00",
+                                "duration_seconds": 28800}]}, f)
+        
+        journal = HistoryJournal(history_file, compact_every=100)
+        journal.append("alice", {"clock_in": "2025-11-16T08:00:00",
+                                 "clock_out": "2025-11-16T12:00:00",
+                                 "duration_seconds": 14400})
+        
+        with open(history_file, 'r') as f:
+            snapshot = json.load(f)
+        self.assert_true("alice" not in snapshot, "Punch does not rewrite snapshot")
+        self.assert_equal(len(journal.load("alice")), 1, "Journaled punch is loaded")
+        self.assert_equal(len(journal.load("bob")), 1, "Other users untouched")
+        
+        # Torn trailing line from a crash mid-append is ignored
+        with open(journal.journal_file, 'a') as f:
+            f.write('{"user": "alice", "entr')
+        self.assert_equal(len(HistoryJournal(history_file).load("alice")), 1,
+                          "Torn journal line skipped")
+
+        # The next append (after a restart) must not land on the torn fragment
+        reopened = HistoryJournal(history_file, compact_every=100)
+        reopened.append("alice", {"clock_in": "2025-11-17T08:00:00",
+                                  "clock_out": "2025-11-17T12:00:00",
+                                  "duration_seconds": 14400})
+        self.assert_equal(len(HistoryJournal(history_file).load("alice")), 2,
+                          "Punch appended after a torn line is replayed")
+        with open(journal.journal_file, 'r') as f:
+            lines = f.read().splitlines()
+        self.assert_true(all(line.endswith('}') for line in lines),
+                         "Torn fragment cut off before appending")
 
-Report Generated: {today}
+    def test_journal_compaction(self):
+        """Test journal is folded into the snapshot once it grows"""
+        history_file = os.path.join(self.test_dir, "compact_history.json")
+        journal = HistoryJournal(history_file, compact_every=3)
+        
+        for day in range(1, 6):
+            journal.append("alice", {"clock_in": f"2025-11-0{day}T08:00:00",
+                                     "clock_out": f"2025-11-0{day}T16:00:00",
+                                     "duration_seconds": 28800})
+        
+        with open(history_file, 'r') as f:
+            snapshot = json.load(f)
+        self.assert_equal(len(snapshot["alice"]), 3, "Snapshot compacted after 3 punches")
+        self.assert_equal(len(journal.load("alice")), 5, "Snapshot + journal hold all punches")
+        
+        # Re-appending an already compacted record must not duplicate it
+        with open(journal.journal_file, 'a') as f:
+            f.write(json.dumps({"user": "alice", "entry": snapshot["alice"][0]}) + "\n")
+        self.assert_equal(len(journal.load("alice")), 5, "Replayed duplicates ignored")
+        
+        journal.rewrite("alice", journal.load("alice")[:2])
+        self.assert_equal(len(journal.load("alice")), 2, "Rewrite replaces user history")
+    
+    # ==================== Storage Backend Tests ====================
+    
+    def _make_entry(self, clock_in, hours, note=""):
+        start = datetime.fromisoformat(clock_in)
+        return {
+            "clock_in": start.isoformat(),
+            "clock_out": (start + timedelta(hours=hours)).isoformat(),
+            "duration_seconds": hours * 3600,
+            "date": start.strftime('%Y-%m-%d'),
+            "note": note,
+            "id": 0
+        }
+    
+    def _range_seconds(self, storage, user, start, end):
+        return sum(e["duration_seconds"] for e in storage.history_between(user, start, end))
+    
+    def test_json_storage_range_queries(self):
+        """Test date-range totals on the JSON backend"""
+        print(f"\n{BOLD}[11. Storage Backends]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        storage = JsonStorage(data_dir)
+        storage.save_users({"alice": {"created": "2025-11-01", "total_hours": 0}})
+        for day, hours in [(10, 8), (11, 4), (12, 6), (17, 3)]:
+            storage.append_history("alice", self._make_entry(f"2025-11-{day}T08:00:00", hours))
+        
+        self.assert_equal(self._range_seconds(storage, "alice", "2025-11-10", "2025-11-16") / 3600,
+                          18.0, "JSON week total (8+4+6)")
+        self.assert_equal([e["clock_in"][:10] for e in
+                           storage.history_between("alice", "2025-11-11", "2025-11-11")],
+                          ["2025-11-11"], "JSON single day")
+        self.assert_equal(len(JsonStorage(data_dir).load_history("alice")), 4,
+                          "JSON history persisted")
+    
+    def test_sqlite_storage_import(self):
+        """Test SQLite backend imports the JSON files on first start"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        source = JsonStorage(data_dir)
+        source.save_users({"alice": {"created": "2025-11-01", "total_hours": 0}})
+        source.save_user_state("alice", {"status": "clocked_out", "total_time_seconds": 0})
+        for day, hours in [(3, 7), (10, 8), (11, 4)]:
+            source.append_history("alice", self._make_entry(f"2025-11-{day:02d}T08:00:00", hours))
+        source.append_archive("alice", {"week_end": "2025-11-09", "total_hours": 7.0,
+                                        "entries_count": 1, "archived_date": "2025-11-10"})
+        
+        db_file = os.path.join(data_dir, "timeclock.db")
+        storage = SqliteStorage(db_file, import_from=JsonStorage(data_dir))
+        self.assert_equal(list(storage.load_users()), ["alice"], "Users imported")
+        self.assert_equal(len(storage.load_history("alice")), 3, "History imported")
+        self.assert_equal(storage.load_archive("alice")[0]["total_hours"], 7.0, "Archive imported")
+        self.assert_equal(self._range_seconds(storage, "alice", "2025-11-10", "2025-11-16") / 3600,
+                          12.0, "SQLite week total (8+4)")
+        self.assert_equal(len(storage.history_between("alice", None, "2025-11-09")), 1,
+                          "SQLite entries before week start")
+        
+        storage.append_history("alice", self._make_entry("2025-11-12T08:00:00", 2))
+        storage.close()
+        
+        # A second start must not import the JSON files again
+        storage = SqliteStorage(db_file, import_from=JsonStorage(data_dir))
+        self.assert_equal(len(storage.load_history("alice")), 4, "Import runs only once")
+        plan = " ".join(str(row) for row in storage.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM history WHERE user = ? AND clock_in >= ?",
+            ("alice", "2025-11-10")))
+        self.assert_true("idx_history_user_clock_in" in plan, "Range query uses index")
+        storage.close()
+        
+        import timeclock_core.storage as storage_module
+        json_storage = storage_module.JsonStorage
+        opened = []
+        storage_module.JsonStorage = lambda *args: opened.append(args) or json_storage(*args)
+        try:
+            open_storage("sqlite", data_dir).close()
+        finally:
+            storage_module.JsonStorage = json_storage
+        self.assert_equal(opened, [], "JSON store not opened once imported")
+    
+    def test_sharded_storage_migration(self):
+        """Test combined JSON files are split into per-user shards"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        with open(os.path.join(data_dir, "timeclock_history.json"), 'w') as f:
+            json.dump({"alice": [self._make_entry("2025-11-10T08:00:00", 8)],
+                       "bob smith": [self._make_entry("2025-11-10T09:00:00", 4)]}, f)
+        with open(os.path.join(data_dir, "timeclock_data.json"), 'w') as f:
+            json.dump({"alice": {"status": "clocked_out", "total_time_seconds": 0}}, f)
+        
+        storage = JsonStorage(data_dir)
+        files = sorted(os.listdir(data_dir))
+        self.assert_true("timeclock_history_alice.json" in files, "Alice shard written")
+        self.assert_true("timeclock_history_bob_smith.json" in files, "Unsafe name sanitised")
+        self.assert_true("timeclock_history.json" not in files, "Combined history moved aside")
+        self.assert_equal(storage.load_user_state("alice")["status"], "clocked_out",
+                          "Session data migrated")
+        
+        bob_shard = os.path.join(data_dir, "timeclock_history_bob_smith.json")
+        bob_mtime = os.stat(bob_shard).st_mtime_ns
+        storage.append_history("alice", self._make_entry("2025-11-11T08:00:00", 8))
+        storage.replace_history("alice", storage.load_history("alice"))
+        self.assert_equal(os.stat(bob_shard).st_mtime_ns, bob_mtime,
+                          "Alice's punches never touch Bob's shard")
+        self.assert_equal(len(JsonStorage(data_dir).load_history("alice")), 2,
+                          "Shard reloads after restart")
+        
+        storage.delete_user("bob smith")
+        self.assert_true(not os.path.exists(bob_shard), "Deleting a user removes the shard")
+    
+    def test_sharded_reads_register_nobody(self):
+        """Test reading an unknown user's data leaves the manifest alone"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        storage = JsonStorage(data_dir)
+        manifest = os.path.join(data_dir, "timeclock_manifest.json")
+        before = read_json(manifest, {})
+        mtime = os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else None
+        
+        today = datetime(2025, 11, 19).date()
+        periods = payroll.payroll_periods(today, datetime(2025, 11, 3).date(), today)
+        self.assert_equal((storage.load_user_state("ghost"), storage.load_history("ghost"),
+                           storage.load_archive("ghost"), storage.history_between("ghost")),
+                          ({}, [], [], []), "Unknown user reads as empty")
+        self.assert_equal(payroll.user_payroll(storage, "ghost", periods)["period"], 0,
+                          "Payroll of an unknown user")
+        self.assert_equal(read_json(manifest, {}), before, "Manifest unchanged")
+        self.assert_equal(os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else None,
+                          mtime, "Manifest not rewritten")
+        
+        storage.save_user_state("ghost", {"status": "clocked_out"})
+        self.assert_true("ghost" in read_json(manifest, {})["users"], "Registered on first write")
+    
+    # ==================== Running Totals Tests ====================
+    
+    def test_running_totals(self):
+        """Test incremental today/week totals"""
+        print(f"\n{BOLD}[12. Running Totals]{RESET}")
+        
+        today = datetime(2025, 11, 13).date()  # Thursday
+        totals = RunningTotals(PunchStore.from_dicts([
+            self._make_entry("2025-11-09T08:00:00", 5),   # Previous Sunday
+            self._make_entry("2025-11-10T08:00:00", 8),   # Monday
+            self._make_entry("2025-11-13T08:00:00", 4),   # Today
+        ]))
+        self.assert_equal(totals.today_seconds(today) / 3600, 4.0, "Today total")
+        self.assert_equal(totals.week_seconds(today) / 3600, 12.0, "Week total (Mon-Thu)")
+        
+        # Clock out and a back-dated missed punch update the cached sums
+        totals.add(Punch.from_dict(self._make_entry("2025-11-13T13:00:00", 2)))
+        totals.add(Punch.from_dict(self._make_entry("2025-11-11T08:00:00", 3)))
+        totals.add(Punch.from_dict(self._make_entry("2025-11-08T08:00:00", 6)))  # Last week
+        self.assert_equal(totals.today_seconds(today) / 3600, 6.0, "Today after clock out")
+        self.assert_equal(totals.week_seconds(today) / 3600, 17.0, "Week after missed punch")
+        
+        # Day rollover recomputes from the day buckets
+        self.assert_equal(totals.today_seconds(today + timedelta(days=1)), 0.0,
+                          "New day starts at zero")
+        self.assert_equal(totals.week_seconds(today + timedelta(days=4)) / 3600, 0.0,
+                          "New week starts at zero")
+        self.assert_equal(totals.week_seconds(today) / 3600, 17.0, "Week sums recomputed")
+    
+    # ==================== Punch Store Tests ====================
+    
+    def test_punch_round_trip(self):
+        """Test punches parse once and serialise back unchanged"""
+        print(f"\n{BOLD}[13. Punch Store]{RESET}")
+        
+        entry = dict(self._make_entry("2025-11-16T10:40:39.522323", 8, "Regular shift"),
+                     id="01JC0000000000000000000000")
+        punch = Punch.from_dict(entry)
+        self.assert_equal(punch.to_dict(), entry, "Punch round-trips to the stored format")
+        legacy = Punch.from_dict(dict(entry, id=0), "alice")
+        self.assert_equal(legacy.id, Punch.from_dict(dict(entry, id=3), "alice").id,
+                          "Old list-position ids replaced by a stable id")
+        self.assert_equal(punch.date.isoformat(), "2025-11-16", "Punch day from epoch seconds")
+        self.assert_true(not hasattr(punch, '__dict__'), "Punch uses __slots__")
+        
+        other = Punch.from_dict(self._make_entry("2025-11-17T08:00:00", 1, "Regular " + "shift"))
+        self.assert_true(other.note is punch.note, "Repeated notes are interned")
+    
+    def test_punch_store_ranges(self):
+        """Test the sorted store answers date ranges by bisecting"""
+        store = PunchStore.from_dicts([
+            self._make_entry("2025-11-12T08:00:00", 6),
+            self._make_entry("2025-11-03T08:00:00", 7),
+        ])
+        store.add(Punch.from_dict(self._make_entry("2025-11-10T23:30:00", 1)))  # Back-dated
+        store.add(Punch.from_dict(self._make_entry("2025-11-17T08:00:00", 2)))
+        
+        self.assert_equal([p.date.day for p in store], [3, 10, 12, 17], "Store kept sorted")
+        week = store.between(datetime(2025, 11, 10).date(), datetime(2025, 11, 16).date())
+        self.assert_equal(store.total_seconds(week) / 3600, 7.0, "Week range total (1+6)")
+        self.assert_equal(len(store.between(None, datetime(2025, 11, 9).date())), 1,
+                          "Entries before week start")
+        self.assert_equal(len(store.between(datetime(2025, 11, 17).date())), 1,
+                          "Entries from a day onwards")
+
+    
+    def test_history_pager(self):
+        """Test history view pages come newest first from a copy taken at open"""
+        store = PunchStore.from_dicts([self._make_entry(f"2025-11-{day:02d}T08:00:00", 1)
+                                       for day in range(1, 26)])
+        pager = HistoryPager(store, page_size=10)
+        first = pager.next_page()
+        self.assert_equal([values[0] for _, values in first[:2]], ["2025-11-25", "2025-11-24"],
+                          "Newest first")
+        
+        # A clock-out and a delete while the window is open
+        store.add(Punch.from_dict(self._make_entry("2025-11-26T08:00:00", 1)))
+        store.remove(store[0])
+        rows = first + pager.next_page() + pager.next_page()
+        self.assert_true(pager.done and pager.next_page() == [], "All pages shown")
+        ids = [punch_id for punch_id, _ in rows]
+        self.assert_equal((len(ids), len(set(ids))), (25, 25), "No row repeated or skipped")
+        self.assert_equal(rows[-1][1][0], "2025-11-01", "Oldest row last")
+    
+    # ==================== Day Index Tests ====================
+    
+    def test_day_index_ranges(self):
+        """Test Fenwick day index against a brute-force sum"""
+        print(f"\n{BOLD}[14. Day Index]{RESET}")
+        
+        import random
+        rng = random.Random(42)
+        days = {}
+        index = DayIndex()
+        for _ in range(500):
+            # Random order, including days before the current range (back-dating)
+            day = rng.randint(19000, 20000)
+            seconds = rng.choice([1800, 3600, 14400, 28800])
+            days[day] = days.get(day, 0) + seconds
+            index.add(day, seconds)
+        
+        mismatches = 0
+        for _ in range(200):
+            start = rng.randint(18990, 20010)
+            end = rng.randint(start, 20010)
+            expected = sum(s for d, s in days.items() if start <= d <= end)
+            if abs(index.range_seconds(start, end) - expected) > 1e-6:
+                mismatches += 1
+        self.assert_equal(mismatches, 0, "Range sums match brute force")
+        self.assert_equal(index.range_seconds(), float(sum(days.values())), "Open range is the total")
+        self.assert_equal(index.day_seconds(12345), 0.0, "Day outside the index is zero")
+        
+        index.add(19500, -days.get(19500, 0))
+        self.assert_equal(index.day_seconds(19500), 0.0, "Negative update removes a day")
+    
+    def test_totals_date_ranges(self):
+        """Test date-range totals through the running totals"""
+        totals = RunningTotals(PunchStore.from_dicts([
+            self._make_entry("2025-11-03T08:00:00", 7),
+            self._make_entry("2025-11-10T08:00:00", 8),
+            self._make_entry("2025-11-12T08:00:00", 6),
+        ]))
+        monday = datetime(2025, 11, 10).date()
+        self.assert_equal(totals.range_seconds(monday) / 3600, 14.0, "Week onwards (8+6)")
+        self.assert_equal(totals.range_seconds(None, monday - timedelta(days=1)) / 3600, 7.0,
+                          "Before week start")
+        self.assert_equal(totals.day_seconds(datetime(2025, 11, 12).date()) / 3600, 6.0,
+                          "Single day lookup")
+    
+    def test_lazy_cumulative_column(self):
+        """Test list totals are only computed as far as rows are shown"""
+        durations = [28800, 14400, 10800, 3600]
+        requested = []
+        
+        def value(row):
+            requested.append(row)
+            return durations[row]
+        
+        column = CumulativeColumn(len(durations), value)
+        self.assert_equal(column[1] / 3600, 12.0, "Total down to second row (8+4)")
+        self.assert_equal(requested, [0, 1], "Rows below the window not computed")
+        self.assert_equal(column[3] / 3600, 16.0, "Total down to last row")
+        self.assert_equal(column[0] / 3600, 8.0, "Earlier rows reuse computed sums")
+        self.assert_equal(requested, [0, 1, 2, 3], "Each row computed once")
+    
+    # ==================== Timer Lifecycle Tests ====================
+    
+    def test_timer_registry(self):
+        """Test screen timers are cancelled when the screen is replaced"""
+        print(f"\n{BOLD}[15. Timer Lifecycle]{RESET}")
+        
+        class FakeEvent:
+            def __init__(self):
+                self.is_triggered = True
+            
+            def cancel(self):
+                self.is_triggered = False
+        
+        class FakeClock:
+            def __init__(self):
+                self.events = []
+            
+            def schedule_interval(self, callback, interval):
+                self.events.append(FakeEvent())
+                return self.events[-1]
+            
+            schedule_once = schedule_interval
+        
+        clock = FakeClock()
+        timers = TimerRegistry(clock)
+        
+        # Rebuild the main screen 30 times, releasing the previous one each time
+        screen = None
+        for _ in range(30):
+            new_screen = object()
+            timers.schedule_interval(new_screen, lambda dt: None, 1)
+            if screen is not None:
+                timers.release(screen)
+            screen = new_screen
+        
+        self.assert_equal(timers.live_count, 1, "Only the visible screen's timer is live")
+        self.assert_equal(sum(e.is_triggered for e in clock.events), 1,
+                          "Replaced screens' timers cancelled")
+        
+        timers.release_all()
+        self.assert_equal(timers.live_count, 0, "No timers left after app stop")
+    
+    # ==================== Write-Behind Tests ====================
+    
+    def test_write_behind_storage(self):
+        """Test saves are queued, coalesced and flushed on close"""
+        print(f"\n{BOLD}[16. Write-Behind Persistence]{RESET}")
+        import threading
+        
+        class SlowStorage(JsonStorage):
+            """JSON store that blocks writes until released"""
+            def __init__(self, data_dir):
+                super().__init__(data_dir)
+                self.gate = threading.Event()
+                self.calls = []
+            
+            def save_user_state(self, user, state):
+                self.gate.wait()
+                self.calls.append('save_user_state')
+                super().save_user_state(user, state)
+            
+            def append_history(self, user, entry):
+                self.gate.wait()
+                self.calls.append('append_history')
+                super().append_history(user, entry)
+            
+            def replace_history(self, user, entries):
+                self.gate.wait()
+                self.calls.append('replace_history')
+                super().replace_history(user, entries)
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        slow = SlowStorage(data_dir)
+        storage = WriteBehindStorage(slow)
+        
+        # Every call returns while the disk is still blocked
+        storage.append_history("alice", self._make_entry("2025-11-10T08:00:00", 8))
+        for status in ("clocked_in", "clocked_out", "clocked_in"):
+            storage.save_user_state("alice", {"status": status})
+        storage.append_history("alice", self._make_entry("2025-11-11T08:00:00", 4))
+        self.assert_true(storage.pending_count >= 2, "Saves return before reaching disk")
+        
+        slow.gate.set()
+        storage.flush()
+        self.assert_equal(slow.calls.count('save_user_state'), 1,
+                          "Session saves coalesced to the newest")
+        self.assert_equal(storage.load_user_state("alice")["status"], "clocked_in",
+                          "Newest session state written")
+        self.assert_equal(len(storage.load_history("alice")), 2, "Both punches written")
+        
+        # A full rewrite supersedes punches still waiting in the queue
+        slow.gate.clear()
+        slow.calls.clear()
+        storage.append_history("alice", self._make_entry("2025-11-12T08:00:00", 2))
+        storage.append_history("alice", self._make_entry("2025-11-13T08:00:00", 2))
+        storage.replace_history("alice", [self._make_entry("2025-11-12T08:00:00", 2)])
+        slow.gate.set()
+        storage.close()
+        self.assert_true('append_history' not in slow.calls[1:],
+                         "Queued appends dropped in favour of the rewrite")
+        self.assert_equal(len(JsonStorage(data_dir).load_history("alice")), 1,
+                          "Close writes the queue out before exit")
+    
+    # ==================== Crash-Safe Write Tests ====================
+    
+    def test_atomic_json_writes(self):
+        """Test a damaged store is restored from its backup"""
+        print(f"\n{BOLD}[17. Crash-Safe Writes]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        path = os.path.join(data_dir, "timeclock_history_alice.json")
+        write_json_atomic(path, {"alice": [self._make_entry("2025-11-10T08:00:00", 8)]})
+        write_json_atomic(path, {"alice": [self._make_entry("2025-11-10T08:00:00", 8),
+                                           self._make_entry("2025-11-11T08:00:00", 4)]})
+        self.assert_true(not os.path.exists(path + ".tmp"), "No temp file left behind")
+        self.assert_equal(len(read_json(path + ".bak", {})["alice"]), 1,
+                          "Previous version kept as backup")
+        
+        # Simulate a write cut off by a crash
+        with open(path, 'w') as f:
+            f.write('{"alice": [{"clock_in": "2025-11-')
+        self.assert_equal(len(read_json(path, {})["alice"]), 1, "Truncated file falls back to backup")
+        self.assert_true(os.path.exists(path + ".corrupt"), "Damaged file preserved")
+        
+        # A crash between the two renames leaves only the backup
+        os.replace(path + ".bak", path + ".bak.keep")
+        write_json_atomic(path, {"alice": []})
+        os.replace(path, path + ".bak")
+        self.assert_equal(read_json(path, None), {"alice": []}, "Missing file read from backup")
+        self.assert_equal(read_json(os.path.join(data_dir, "missing.json"), {}), {},
+                          "Missing store gives the default")
+    
+    def test_batched_fsync(self):
+        """Test writes within the fsync window share one sync"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        synced = []
+        writable = []
+        real_fsync = os.fsync
+        def fake_fsync(fd):
+            synced.append(fd)
+            try:
+                os.write(fd, b"")
+                writable.append(True)
+            except OSError:
+                writable.append(False)
+        os.fsync = fake_fsync
+        batcher = fileio.fsync_batcher
+        window = batcher.window
+        try:
+            batcher.window = 0
+            journal = HistoryJournal(os.path.join(data_dir, "h.json"))
+            journal.append("alice", self._make_entry("2025-11-10T08:00:00", 8))
+            self.assert_equal(len(synced), 1, "Unbatched append syncs immediately")
+            
+            synced.clear()
+            batcher.window = 60
+            for day in range(10, 20):
+                journal.append("alice", self._make_entry(f"2025-11-{day}T08:00:00", 1))
+            self.assert_equal(len(synced), 0, "Burst of punches waits for the window")
+            batcher.flush()
+            self.assert_equal(len(synced), 1, "One sync for the whole burst")
+            self.assert_equal(writable[-1], True, "Synced through a writable descriptor (Windows)")
+            
+            synced.clear()
+            write_json_atomic(os.path.join(data_dir, "state.json"), {"alice": {}})
+            self.assert_equal(len(synced), 1, "Replaced file synced before its rename")
+        finally:
+            os.fsync = real_fsync
+            batcher.flush()
+            batcher.window = window
+    
+    # ==================== Concurrent Access Tests ====================
+    
+    def test_concurrent_instances_merge(self):
+        """Test two instances on one directory merge instead of overwriting"""
+        print(f"\n{BOLD}[18. Concurrent Access]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        kiosk_a = JsonStorage(data_dir)
+        kiosk_b = JsonStorage(data_dir)
+        kiosk_a.append_history("alice", self._make_entry("2025-11-10T08:00:00", 8, "monday"))
+        
+        # Kiosk A loads, kiosk B punches, then A edits a note and rewrites
+        entries = kiosk_a.load_history("alice")
+        kiosk_b.append_history("alice", self._make_entry("2025-11-11T08:00:00", 4))
+        entries[0]["note"] = "monday (edited)"
+        kiosk_a.replace_history("alice", entries)
+        
+        history = JsonStorage(data_dir).load_history("alice")
+        self.assert_equal(len(history), 2, "Other kiosk's punch survives a rewrite")
+        self.assert_equal(history[0]["note"], "monday (edited)", "Rewrite's own edit applied")
+        
+        # Both kiosks add a user from their own (stale) copy of the list
+        users_a = kiosk_a.load_users()
+        users_b = kiosk_b.load_users()
+        users_a["alice"] = {"created": "2025-11-01", "total_hours": 0}
+        users_b["bob"] = {"created": "2025-11-01", "total_hours": 0}
+        kiosk_a.save_users(users_a)
+        kiosk_b.save_users(users_b)
+        self.assert_equal(sorted(JsonStorage(data_dir).load_users()), ["alice", "bob"],
+                          "Users added on both kiosks kept")
+        
+        # Deleting a user on one kiosk is not undone by the other's next save
+        users_b = kiosk_b.load_users()
+        users_a = kiosk_a.load_users()
+        del users_a["bob"]
+        kiosk_a.save_users(users_a)
+        users_b["alice"]["total_hours"] = 12
+        kiosk_b.save_users(users_b)
+        users = JsonStorage(data_dir).load_users()
+        self.assert_equal(sorted(users), ["alice"], "Deleted user stays deleted")
+        self.assert_equal(users["alice"]["total_hours"], 12, "Later edit kept")
+
+        
+        # Punches and state saves are detected without rewriting the manifest
+        manifest = os.stat(kiosk_a.manifest_file)
+        state = kiosk_b.load_user_state("alice")
+        kiosk_a.save_user_state("alice", {"status": "clocked_in", "clock_in_time": "2025-11-12T08:00:00"})
+        kiosk_a.append_history("alice", self._make_entry("2025-11-12T08:00:00", 2))
+        self.assert_equal(os.stat(kiosk_a.manifest_file).st_mtime_ns, manifest.st_mtime_ns,
+                          "Saves leave the manifest alone")
+        kiosk_b.save_user_state("alice", dict(state, total_time_seconds=60))
+        self.assert_equal(JsonStorage(data_dir).load_user_state("alice").get("status"), "clocked_in",
+                          "Other kiosk's state save still merged")
+    
+    def test_parallel_kiosk_processes(self):
+        """Stress test: several processes punching into one directory"""
+        import multiprocessing
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        kiosks, punches = 4, 25
+        processes = [multiprocessing.Process(target=_kiosk_worker, args=(data_dir, k, punches))
+                     for k in range(kiosks)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(120)
+        self.assert_true(all(p.exitcode == 0 for p in processes), "All kiosk processes finished")
+        
+        storage = JsonStorage(data_dir)
+        self.assert_equal(len(storage.load_history("shared")), kiosks * punches,
+                          f"No lost punches ({kiosks} processes x {punches})")
+        self.assert_equal(sum(len(storage.load_history(f"kiosk{k}")) for k in range(kiosks)),
+                          kiosks * punches, "Per-kiosk shards complete")
+        self.assert_equal(sorted(storage.load_users()), [f"kiosk{k}" for k in range(kiosks)],
+                          "Every kiosk's user registered")
+        self.assert_equal(storage.load_user_state("shared"),
+                          {f"kiosk{k}": punches - 1 for k in range(kiosks)},
+                          "Concurrent state saves merged")
+    
+    # ==================== Core Engine Tests ====================
+    
+    def test_engine_clock_cycle(self):
+        """Test clocking in and out through the headless engine"""
+        print(f"\n{BOLD}[19. Core Engine]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        
+        start = datetime(2025, 11, 12, 8, 0)
+        engine.clock_in("opening", now=start)
+        self.assert_true(engine.clocked_in, "Clocked in")
+        self.assert_equal(engine.today_hours(start + timedelta(hours=2)), timedelta(hours=2),
+                          "Today includes the running session")
+        punch = engine.clock_out("In: opening", now=start + timedelta(hours=8))
+        self.assert_equal(punch.duration, 8 * 3600, "Punch duration recorded")
+        self.assert_equal(engine.week_hours(start + timedelta(hours=9)), timedelta(hours=8),
+                          "Week total from the day index")
+        
+        reloaded = TimeClockEngine(JsonStorage(data_dir))
+        reloaded.load_users()
+        reloaded.select_user("alice")
+        self.assert_equal(len(reloaded.history), 1, "Punch persisted")
+        self.assert_equal(reloaded.current_status, "clocked_out", "Status persisted")
+        
+        try:
+            engine.add_user("alice")
+            duplicate = False
+        except ValueError:
+            duplicate = True
+        self.assert_true(duplicate, "Duplicate user rejected")
+    
+    def test_engine_weekly_archive(self):
+        """Test archiving previous weeks and summaries through the engine"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        for day, hours in [(5, 8), (6, 7.5), (10, 4), (11, 6)]:
+            start = datetime(2025, 11, day, 8, 0)
+            engine.add_punch(start, start + timedelta(hours=hours))
+        
+        summary = engine.period_summary(7, today=datetime(2025, 11, 11).date())
+        self.assert_equal(summary["days_worked"], 4, "Summary days worked")
+        self.assert_equal(summary["total"], timedelta(hours=25.5), "Summary total")
+        
+        reset = engine.archive_previous_weeks(now=datetime(2025, 11, 12, 9, 0))
+        self.assert_equal(reset["archived"], 2, "Previous week punches archived")
+        self.assert_equal(reset["kept"], 2, "Current week punches kept")
+        self.assert_equal(engine.latest_archived_week()["week_end"], "2025-11-09",
+                          "Archive uses the previous Sunday")
+        self.assert_equal(engine.latest_archived_week()["total_hours"], 15.5, "Archived hours")
+        
+        report = engine.hours_report(now=datetime(2025, 11, 12, 9, 0))
+        self.assert_true("Hours Worked: 10h 0m" in report, "Report current week")
+        self.assert_true("Hours Worked: 15h 30m" in report, "Report previous week")
+        rows = list(engine.csv_rows())
+        self.assert_equal([row[1] for row in rows], ["2025-11-10", "2025-11-11"], "CSV rows")
+    
+    # ==================== Benchmark Harness Tests ====================
+    
+    def test_benchmark_generator(self):
+        """Test the synthetic workload is deterministic and loads back"""
+        print(f"\n{BOLD}[20. Benchmark Harness]{RESET}")
+        
+        first = bench_timeclock.generate_history(bench_timeclock.random.Random(7), 28, 2)
+        second = bench_timeclock.generate_history(bench_timeclock.random.Random(7), 28, 2)
+        self.assert_equal(first, second, "Same seed gives the same punches")
+        self.assert_true(all(e["clock_out"] > e["clock_in"] for e in first), "Punches well formed")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        punches = bench_timeclock.generate_dataset(JsonStorage(data_dir), 3, 14, 2, seed=1)
+        storage = JsonStorage(data_dir)
+        self.assert_equal(len(storage.load_users()), 3, "Generated users saved")
+        self.assert_equal(sum(len(storage.load_history(u)) for u in storage.load_users()),
+                          punches, "Generated punches saved")
+    
+    def test_benchmark_compare(self):
+        """Test regression detection between two result files"""
+        def result(median):
+            return {"sizes": {"small": {"results": {
+                "load": {"median_ms": median, "min_ms": median},
+                "week_total": {"median_ms": 0.002 * median, "min_ms": 0.001},
+            }}}}
+        
+        regressions = bench_timeclock.compare(result(10.0), result(20.0), 1.25)
+        self.assert_equal([r[1] for r in regressions], ["load"],
+                          "Slowdown flagged, timer noise ignored")
+        self.assert_equal(bench_timeclock.compare(result(10.0), result(11.0), 1.25), [],
+                          "Small change within threshold")
+    
+    # ==================== Streaming Export Tests ====================
+    
+    def test_history_chunks(self):
+        """Test chunked history reads match a full range read"""
+        print(f"\n{BOLD}[21. Streaming Export]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        json_store = JsonStorage(data_dir)
+        for day in range(3, 28):
+            json_store.append_history("alice", self._make_entry(f"2025-11-{day:02d}T08:00:00", 4))
+            json_store.append_history("alice", self._make_entry(f"2025-11-{day:02d}T08:00:00", 2))
+        sqlite_store = SqliteStorage(os.path.join(data_dir, "t.db"), import_from=json_store)
+        
+        for name, storage in [("JSON", json_store), ("SQLite", sqlite_store)]:
+            expected = storage.history_between("alice", "2025-11-05", "2025-11-20")
+            chunks = list(storage.history_chunks("alice", "2025-11-05", "2025-11-20", size=5))
+            self.assert_equal([e for chunk in chunks for e in chunk], expected,
+                              f"{name} chunks match the range read")
+            self.assert_true(all(len(chunk) <= 5 for chunk in chunks), f"{name} chunk size bounded")
+        sqlite_store.close()
+    
+    def test_streaming_export(self):
+        """Test the CSV export for several users, a date range and cancelling"""
+        import csv
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(WriteBehindStorage(JsonStorage(data_dir)))
+        for user, hours in [("alice", 8), ("bob", 6)]:
+            engine.add_user(user)
+            engine.select_user(user)
+            for day in range(10, 15):
+                start = datetime(2025, 11, day, 13, 30)
+                engine.add_punch(start, start + timedelta(hours=hours))
+        
+        path = os.path.join(data_dir, "export.csv")
+        job = engine.start_export(path, ["alice", "bob"], "2025-11-11", "2025-11-13")
+        job.join(10)
+        with open(path, newline='') as f:
+            rows = list(csv.reader(f))
+        self.assert_true(job.done and job.error is None, "Export job finished")
+        self.assert_equal(job.rows, 6, "Date range applied for every user")
+        self.assert_equal([row[0] for row in rows[1:]], ["alice"] * 3 + ["bob"] * 3,
+                          "Rows grouped by user")
+        engine.select_user("bob")
+        expected = [row for row in engine.csv_rows() if "2025-11-11" <= row[1] <= "2025-11-13"]
+        self.assert_equal(rows[4:], expected, "Rows match the in-memory export format")
+        
+        cancelled_path = os.path.join(data_dir, "cancelled.csv")
+        try:
+            export_csv(engine.storage, cancelled_path, ["alice"], cancelled=lambda: True)
+            cancelled = False
+        except ExportCancelled:
+            cancelled = True
+        self.assert_true(cancelled, "Export can be cancelled")
+        self.assert_true(not os.path.exists(cancelled_path)
+                         and not os.path.exists(cancelled_path + ".part"),
+                         "Cancelled export leaves no file")
+        engine.storage.close()
+    
+    # ==================== Payroll Tests ====================
+    
+    def test_payroll_single_pass(self):
+        """Test the all-user payroll matches per-user totals"""
+        print(f"\n{BOLD}[22. Payroll Report]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        storage = JsonStorage(data_dir)
+        bench_timeclock.generate_dataset(storage, 4, 60, 2, seed=3)
+        periods = payroll.payroll_periods(datetime(2025, 11, 12).date(),
+                                          datetime(2025, 10, 1).date(),
+                                          datetime(2025, 10, 31).date())
+        rows = payroll.payroll(storage, periods=periods)
+        
+        self.assert_equal([row["user"] for row in rows], sorted(storage.load_users()),
+                          "One row per user")
+        for row in rows[:2]:
+            for name, (start, end) in periods.items():
+                self.assert_equal(row[name], self._range_seconds(storage, row["user"], start, end),
+                                  f"{row['user']} {name} total")
+        
+        parallel = payroll.payroll(storage, periods=periods, workers=2,
+                                   kind="json", data_dir=data_dir)
+        self.assert_equal(parallel, rows, "Process pool gives the same rows")
+    
+    def test_payroll_formats(self):
+        """Test archived weeks and the text, CSV and JSON outputs"""
+        import csv
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        for user in ("alice", "bob"):
+            engine.add_user(user)
+            engine.select_user(user)
+            start = datetime(2025, 11, 5, 9, 0)
+            engine.add_punch(start, start + timedelta(hours=8))
+        engine.archive_previous_weeks(now=datetime(2025, 11, 12, 9, 0))
+        
+        today = datetime(2025, 11, 12).date()
+        periods = payroll.payroll_periods(today)
+        rows = payroll.payroll(engine.storage, periods=periods)
+        # Only bob (selected last) was reset; alice's week is still in history
+        self.assert_equal([row["previous_week"] for row in rows], [8 * 3600, 8 * 3600],
+                          "Previous week from history and from the archive")
+        
+        text = engine.payroll_report(today=today)
+        self.assert_true("PAYROLL REPORT" in text and "8h 0m" in text, "Text report")
+        table = list(csv.reader(engine.payroll_report("csv", today=today).splitlines()))
+        self.assert_equal(table[2][:3], ["bob", "0.00", "8.00"], "CSV report")
+        self.assert_equal(table[1][3], "1", "CSV punch count")
+        sheet = json.loads(engine.payroll_report("json", today=today))
+        self.assert_equal(sheet["periods"]["previous_week"]["end"], "2025-11-09", "JSON periods")
+        self.assert_equal(sheet["users"][1]["previous_week"], 8.0, "JSON hours")
 
-TODAY'S HOURS: 8.5h (8h 30m)
-WEEKLY TOTAL: 42.5h (42h 30m)
+    
+    def test_payroll_archived_weeks(self):
+        """Test a custom period counts weeks whose punches only survive as archive totals"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        storage = JsonStorage(data_dir)
+        storage.save_users({"alice": {"created": "2025-10-01", "total_hours": 0}})
+        # Reset by an older version: the punches are gone, only the totals remain
+        storage.extend_archive("alice", [
+            {"week_end": week_end, "total_hours": 40.0, "entries_count": 5,
+             "archived_date": "2025-11-20T09:00:00"}
+            for week_end in ("2025-11-02", "2025-11-09", "2025-11-16")])
+        storage.append_history("alice", self._make_entry("2025-11-18T08:00:00", 8))
+        
+        today = datetime(2025, 11, 19).date()
+        whole = payroll.payroll_periods(today, datetime(2025, 11, 3).date(),
+                                        datetime(2025, 11, 18).date())
+        row = payroll.user_payroll(storage, "alice", whole)
+        self.assert_equal(row["period"] / 3600, 88, "Whole archived weeks added to the period")
+        self.assert_equal(row["approximate"], [], "Not approximate")
+        self.assert_equal(row["previous_week"] / 3600, 40, "Previous week from the archive")
+        
+        partial = payroll.payroll_periods(today, datetime(2025, 11, 1).date(),
+                                          datetime(2025, 11, 12).date())
+        row = payroll.user_payroll(storage, "alice", partial)
+        self.assert_equal(row["period"] / 3600, 40, "Only the whole week counted")
+        self.assert_equal(row["approximate"], ["period"], "Partly covered weeks flagged")
+        self.assert_true("~" in payroll.format_text([row], partial), "Text marks the total")
+    
+    # ==================== Report Cache Tests ====================
+    
+    def test_report_cache(self):
+        """Test the hours report is reused until the data or the minute changes"""
+        print(f"\n{BOLD}[23. Report Cache]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        start = datetime(2025, 11, 10, 8, 0)
+        engine.add_punch(start, start + timedelta(hours=8))
+        
+        now = datetime(2025, 11, 12, 9, 30, 5)
+        first = engine.hours_report(now)
+        self.assert_true(engine.hours_report(now.replace(second=55)) is first,
+                         "Same minute reuses the report")
+        self.assert_true(engine.hours_report(now + timedelta(minutes=1)) is not first,
+                         "Next minute rebuilds it")
+        
+        engine.add_punch(start + timedelta(days=1), start + timedelta(days=1, hours=2))
+        self.assert_true("10h 0m" in engine.hours_report(now), "Punch invalidates the report")
+        
+        engine.clock_in(now=now)
+        self.assert_true("10h 0m" in engine.hours_report(now), "Clock in invalidates the report")
+        engine.clock_out(now=now + timedelta(hours=1))
+        
+        engine.archive_previous_weeks(now=datetime(2025, 11, 17, 9, 0))
+        report = engine.hours_report(datetime(2025, 11, 17, 9, 0))
+        self.assert_true("Hours Worked: 11h 0m" in report, "Weekly reset invalidates the report")
+        
+        engine.select_user("alice")
+        self.assert_true(engine.hours_report(datetime(2025, 11, 17, 9, 0)) is not report,
+                         "Reload invalidates the report")
+    
+    # ==================== Archive Index Tests ====================
+    
+    def test_archive_index(self):
+        """Test archived weeks stay ordered by week_end with O(1) latest lookup"""
+        print(f"\n{BOLD}[24. Archive Index]{RESET}")
+        
+        def week(end, hours=40.0):
+            return {"week_end": end, "total_hours": hours, "entries_count": 5,
+                    "archived_date": end + "T09:00:00"}
+        
+        index = ArchiveIndex([week("2025-11-09"), week("2025-10-26"), week("2025-11-02")])
+        self.assert_equal([w["week_end"] for w in index],
+                          ["2025-10-26", "2025-11-02", "2025-11-09"], "Unsorted input ordered once")
+        index.add(week("2025-10-19", 30.0))
+        index.add(week("2025-11-16", 35.0))
+        self.assert_equal(index.latest["week_end"], "2025-11-16", "Latest week")
+        self.assert_equal(index.newest(1)["week_end"], "2025-11-09", "Newest first access")
+        self.assert_equal([w["week_end"] for w in index.between("2025-10-20", "2025-11-09")],
+                          ["2025-10-26", "2025-11-02", "2025-11-09"], "Range by week_end")
+        self.assert_equal(ArchiveIndex().latest, None, "Empty archive has no latest week")
+    
+    def test_archive_persisted_in_order(self):
+        """Test both backends store and load the archive in week_end order"""
+        def week(end, hours):
+            return {"week_end": end, "total_hours": hours, "entries_count": 1,
+                    "archived_date": "2025-11-20T09:00:00"}
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        json_store = JsonStorage(data_dir)
+        
+        # A file saved out of order by an older version is repaired on the next append
+        write_json_atomic(os.path.join(data_dir, "timeclock_weekly_archive_alice.json"),
+                          {"alice": [week("2025-11-09", 40.0), week("2025-10-26", 38.0)]})
+        json_store.save_users({"alice": {"created": "2025-10-01", "total_hours": 0}})
+        json_store.append_archive("alice", week("2025-11-02", 20.0))
+        with open(os.path.join(data_dir, "timeclock_weekly_archive_alice.json")) as f:
+            stored = json.load(f)["alice"]
+        self.assert_equal([w["week_end"] for w in stored],
+                          ["2025-10-26", "2025-11-02", "2025-11-09"], "JSON archive stored sorted")
+        
+        sqlite_store = SqliteStorage(os.path.join(data_dir, "t.db"), import_from=json_store)
+        sqlite_store.append_archive("alice", week("2025-10-19", 10.0))
+        self.assert_equal([w["week_end"] for w in sqlite_store.load_archive("alice")],
+                          ["2025-10-19", "2025-10-26", "2025-11-02", "2025-11-09"],
+                          "SQLite archive loads sorted")
+        sqlite_store.close()
+    
+    # ==================== Weekly Rollover Tests ====================
+    
+    def test_weekly_rollover(self):
+        """Test each closed week is archived as its own record"""
+        print(f"\n{BOLD}[25. Weekly Rollover]{RESET}")
+        
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        # Sun Oct 26 (week ending Oct 26), Mon Oct 27 + Sun Nov 2, Wed Nov 12 (current week)
+        for day, hours in [((10, 26), 3), ((10, 27), 8), ((11, 2), 2), ((11, 12), 6)]:
+            start = datetime(2025, day[0], day[1], 9, 0)
+            engine.add_punch(start, start + timedelta(hours=hours))
+        
+        now = datetime(2025, 11, 12, 18, 0)
+        weeks = engine.check_rollover(now)
+        self.assert_equal([(w["week_end"], w["total_hours"], w["entries_count"]) for w in weeks],
+                          [("2025-10-26", 3.0, 1), ("2025-11-02", 10.0, 2)],
+                          "One record per closed week")
+        self.assert_equal(len(engine.history), 1, "Only the current week stays in history")
+        self.assert_equal(engine.check_rollover(now), None, "Nothing to do mid-week")
+        
+        # A missed punch back-dated into a closed week is archived on the next check
+        engine.add_punch(datetime(2025, 11, 1, 9, 0), datetime(2025, 11, 1, 13, 0))
+        engine.check_rollover(now)
+        self.assert_equal(engine.latest_archived_week()["total_hours"], 14.0,
+                          "Late punch added to its week's total")
+        
+        reloaded = TimeClockEngine(JsonStorage(data_dir))
+        reloaded.select_user("alice")
+        self.assert_equal([w["week_end"] for w in reloaded.archive],
+                          ["2025-10-26", "2025-11-02", "2025-11-02"], "Archive records persisted")
+        self.assert_equal(len(reloaded.history), 1, "Trimmed history persisted")
+    
+    def test_automatic_rollover(self):
+        """Test an engine with auto_rollover archives closed weeks when a user is selected"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        last_week = datetime.now() - timedelta(days=7)
+        engine.add_punch(last_week, last_week + timedelta(hours=1))
+        
+        auto = TimeClockEngine(JsonStorage(data_dir), auto_rollover=True)
+        auto.select_user("alice")
+        self.assert_equal((len(auto.history), len(auto.archive)), (0, 1),
+                          "Closed week archived at startup")
 
-Entry 1: 8:00 AM - 4:30 PM (8h 30m)
+    
+    def test_rollover_keeps_punches_for_ranges(self):
+        """Test rolled over punches stay readable by date-range exports and payroll"""
+        for kind in ("json", "sqlite"):
+            data_dir = tempfile.mkdtemp(dir=self.test_dir)
+            engine = TimeClockEngine(open_storage(kind, data_dir))
+            engine.add_user("alice")
+            engine.select_user("alice")
+            for start in (datetime(2025, 11, day, 8) for day in range(1, 23)):
+                engine.add_punch(start, start + timedelta(hours=4))
+            engine.roll_over_weeks(now=datetime(2025, 12, 3, 12))
+            
+            reloaded = TimeClockEngine(open_storage(kind, data_dir))
+            reloaded.select_user("alice")
+            self.assert_equal(len(reloaded.history), 0, f"{kind}: live history holds this week only")
+            path = os.path.join(data_dir, "november.csv")
+            rows = export_csv(reloaded.storage, path, ["alice"], "2025-11-01", "2025-11-30")
+            self.assert_equal(rows, 22, f"{kind}: rolled over punches exported")
+            periods = payroll.payroll_periods(datetime(2025, 12, 3).date(),
+                                              datetime(2025, 11, 1).date(),
+                                              datetime(2025, 11, 30).date())
+            row = payroll.user_payroll(reloaded.storage, "alice", periods)
+            self.assert_equal(row["period"] / 3600, 88, f"{kind}: payroll period counts them")
+    
+    def test_rollover_crash_between_writes(self):
+        """Test a rollover that failed after archiving is not archived twice on retry"""
+        for kind in ("json", "sqlite"):
+            data_dir = tempfile.mkdtemp(dir=self.test_dir)
+            engine = TimeClockEngine(open_storage(kind, data_dir))
+            engine.add_user("alice")
+            engine.select_user("alice")
+            start = datetime(2025, 11, 10, 9)
+            engine.add_punch(start, start + timedelta(hours=8))
+            
+            def crash(user, entries):
+                raise OSError("disk full")
+            engine.storage.retire_history = crash
+            try:
+                engine.roll_over_weeks(now=datetime(2025, 11, 19, 12))
+            except OSError:
+                pass
+            
+            reloaded = TimeClockEngine(open_storage(kind, data_dir))
+            reloaded.select_user("alice")
+            reloaded.roll_over_weeks(now=datetime(2025, 11, 19, 12))
+            self.assert_equal(len(reloaded.storage.load_archive("alice")), 1,
+                              f"{kind}: one archive record")
+            self.assert_equal(reloaded.latest_archived_week()["total_hours"], 8,
+                              f"{kind}: week counted once")
+            self.assert_equal(len(reloaded.history), 0, f"{kind}: punches retired on retry")
+    
+    # ==================== Startup Import Tests ====================
+    
+    def test_lazy_core_imports(self):
+        """Test importing the core leaves export and payroll until first use"""
+        print(f"\n{BOLD}[26. Startup Imports]{RESET}")
+        times = bench_startup.import_times('timeclock_core')
+        self.assert_true('timeclock_core.engine' in times, "Engine imported with the core")
+        self.assert_equal([name for name in ('csv', 'timeclock_core.export', 'timeclock_core.payroll')
+                           if name in times], [], "Export and payroll not imported at startup")
+        
+        import timeclock_core
+        self.assert_true(timeclock_core.export_csv is export_csv, "Lazy re-export resolves")
+    
+    def test_startup_compare(self):
+        """Test startup regression detection names the newly imported modules"""
+        def result(total, modules):
+            return {"targets": {"timeclock_core": {"total_ms": total, "modules": dict.fromkeys(modules, {})}}}
+        
+        regressions = bench_startup.compare(result(10.0, ["a"]), result(20.0, ["a", "csv"]), 1.25)
+        self.assert_equal([(r[0], r[4]) for r in regressions], [("timeclock_core", ["csv"])],
+                          "Slower import flagged with its new modules")
+        self.assert_equal(bench_startup.compare(result(10.0, ["a"]), result(11.0, ["a"]), 1.25), [],
+                          "Small change within threshold")
+    
+    # ==================== Deferred Loading Tests ====================
+    
+    def test_lazy_select_user(self):
+        """Test a lazy engine shows cached totals without reading history or archive"""
+        print(f"\n{BOLD}[27. Deferred Loading]{RESET}")
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        now = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        engine.clock_in(now=now - timedelta(hours=3))
+        engine.clock_out(now=now - timedelta(hours=1))
+        
+        class CountingStorage(JsonStorage):
+            reads = 0
+            
+            def load_history(self, user):
+                CountingStorage.reads += 1
+                return super().load_history(user)
+            
+            def load_archive(self, user):
+                CountingStorage.reads += 1
+                return super().load_archive(user)
+        
+        lazy = TimeClockEngine(CountingStorage(data_dir), lazy=True)
+        lazy.select_user("alice")
+        self.assert_equal(CountingStorage.reads, 0, "Select reads no history or archive")
+        self.assert_equal((lazy.today_hours(now), lazy.week_hours(now)),
+                          (engine.today_hours(now), engine.week_hours(now)), "Cached totals match")
+        
+        lazy.prefetch().join()
+        self.assert_true(lazy.history_loaded and lazy.archive_loaded, "Prefetch loads both")
+        self.assert_equal(len(lazy.history), 1, "Prefetched history")
+        self.assert_equal(lazy.week_hours(now), engine.week_hours(now), "Totals from history")
+    
+    def test_lazy_rollover_and_old_state(self):
+        """Test a lazy engine caches totals for old state files and rolls over from the cache"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        storage = JsonStorage(data_dir)
+        last_week = datetime.now() - timedelta(days=7)
+        storage.save_users({"alice": {"created": last_week.isoformat(), "total_hours": 0}})
+        storage.save_user_state("alice", {"status": "clocked_out", "total_time_seconds": 0})
+        storage.append_history("alice", self._make_entry(last_week.isoformat(), 2))
+        
+        lazy = TimeClockEngine(JsonStorage(data_dir), lazy=True)
+        lazy.select_user("alice")
+        self.assert_true("totals" in JsonStorage(data_dir).load_user_state("alice"),
+                         "Totals cached for a state saved without them")
+        
+        auto = TimeClockEngine(JsonStorage(data_dir), auto_rollover=True, lazy=True)
+        auto.select_user("alice")
+        self.assert_equal((len(auto.history), len(auto.archive)), (0, 1),
+                          "Closed week found from the cached first day")
+    
+    # ==================== Profiling Tests ====================
+    
+    def test_profiling_env(self):
+        """Test TIMECLOCK_PROFILE turns profiling on and picks the dump file"""
+        print(f"\n{BOLD}[28. Profiling]{RESET}")
+        self.assert_equal(profiling.from_env({}), None, "Off when unset")
+        self.assert_equal(profiling.from_env({"TIMECLOCK_PROFILE": "0"}), None, "Off when 0")
+        self.assert_equal(profiling.from_env({"TIMECLOCK_PROFILE": "1"}).path,
+                          profiling.DEFAULT_PATH, "Default dump file")
+        self.assert_equal(profiling.from_env({"TIMECLOCK_PROFILE": "calls.csv"}).path,
+                          "calls.csv", "Dump file from the variable")
+    
+    def test_profiling_records_calls(self):
+        """Test instrumented engine and storage calls are counted, timed and sized"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(WriteBehindStorage(JsonStorage(data_dir)))
+        profiler = profiling.instrument(engine, profiling.Profiler())
+        engine.add_user("alice")
+        engine.select_user("alice")
+        start = datetime(2025, 11, 10, 9, 0)
+        engine.clock_in(now=start)
+        engine.clock_out(now=start + timedelta(hours=8))
+        engine.week_hours(start + timedelta(hours=9))
+        engine.storage.flush()
+        
+        rows = {row["name"]: row for row in profiler.rows()}
+        self.assert_equal(rows["engine.add_punch"]["count"], 1, "Engine call counted")
+        self.assert_true(rows["storage.append_history"]["bytes_written"] > 0, "Bytes written")
+        self.assert_true("disk.append_history" in rows, "Backend write timed on the writer thread")
+        self.assert_equal(sum(rows["engine.week_hours"][c] for c in profiling.COLUMNS[7:]), 1,
+                          "Latency histogram")
+        
+        csv_path = profiler.dump(os.path.join(data_dir, "calls.csv"))
+        with open(csv_path) as f:
+            self.assert_equal(f.readline().strip().split(","), profiling.COLUMNS, "CSV dump header")
+        with open(profiler.dump(os.path.join(data_dir, "calls.json"))) as f:
+            self.assert_equal(len(json.load(f)["calls"]), len(rows), "JSON dump")
+    
+    # ==================== Sync Tests ====================
+    
+    def _sync_engine(self, kind="json"):
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        return TimeClockEngine(open_storage(kind, data_dir), changes=sync.ChangeLog(data_dir))
+    
+    def test_punch_ids_stable(self):
+        """Test punch ids stay unique after the weekly reset trims the history"""
+        print(f"\n{BOLD}[29. Device Sync]{RESET}")
+        engine = self._sync_engine()
+        engine.add_user("alice")
+        engine.select_user("alice")
+        now = datetime(2025, 11, 12, 12, 0)
+        first = engine.add_punch(now - timedelta(days=8, hours=2), now - timedelta(days=8))
+        engine.archive_previous_weeks(now)
+        second = engine.add_punch(now - timedelta(hours=2), now)
+        self.assert_true(isinstance(second.id, str) and second.id != first.id,
+                         "New id after reset")
+        legacy = {"clock_in": "2025-11-03T09:00:00", "clock_out": "2025-11-03T17:00:00", "id": 0}
+        self.assert_equal(sync.punch_id("alice", legacy), sync.punch_id("alice", dict(legacy)),
+                          "Legacy ids derived the same everywhere")
+    
+    def test_sync_folder_delta(self):
+        """Test folder sync sends only changes since each peer's watermark"""
+        phone, office = self._sync_engine(), self._sync_engine("sqlite")
+        folder = tempfile.mkdtemp(dir=self.test_dir)
+        phone.add_user("alice")
+        phone.select_user("alice")
+        start = datetime(2025, 11, 10, 9, 0)
+        phone.clock_in(now=start)
+        phone.clock_out(now=start + timedelta(hours=8))
+        
+        phone.sync_folder(folder)
+        self.assert_equal(office.sync_folder(folder), 1, "Punch applied on the other device")
+        office.select_user("alice")
+        self.assert_equal([p.duration for p in office.history], [28800], "Synced punch")
+        
+        office.edit_note(office.history[0], "fixed on the PC")
+        office.sync_folder(folder)
+        phone.sync_folder(folder)
+        self.assert_equal(phone.history[0].note, "fixed on the PC", "Edit synced back")
+        self.assert_equal(phone.changes.packet(office.changes.peer_id)["changes"], [],
+                          "Nothing resent once acknowledged")
+        self.assert_equal(office.sync_folder(folder) + phone.sync_folder(folder), 0,
+                          "Repeat sync applies nothing")
+    
+    def test_sync_socket_loopback(self):
+        """Test one sync exchange over a local socket in both directions"""
+        import threading
+        
+        server, client = self._sync_engine(), self._sync_engine()
+        start = datetime(2025, 11, 10, 9, 0)
+        for engine, user in ((server, "alice"), (client, "bob")):
+            engine.add_user(user)
+            engine.select_user(user)
+            engine.add_punch(start, start + timedelta(hours=4))
+        
+        ready = threading.Event()
+        port = []
+        result = []
+        thread = threading.Thread(target=lambda: result.append(sync.serve_once(
+            server.changes, server.storage, port=0, timeout=10,
+            ready=lambda p: (port.append(p), ready.set()))))
+        thread.start()
+        ready.wait(10)
+        applied = sync.sync_socket(client.changes, client.storage, port=port[0], timeout=10)
+        thread.join(10)
+        
+        self.assert_equal((applied, result), (1, [1]), "One punch each way")
+        self.assert_equal(sorted(client.storage.load_users()), ["alice", "bob"],
+                          "Unknown user created")
+        self.assert_equal((client.changes.packet(server.changes.peer_id)["changes"],
+                           server.changes.packet(client.changes.peer_id)["changes"]), ([], []),
+                          "Both watermarks advanced")
 
-─────────────────────────────────
-Total: 8.5 hours
-═════════════════════════════════
-        """
+    
+    def test_sync_socket_secret(self):
+        """Test socket sync off loopback needs a secret, and a wrong one applies nothing"""
+        import threading
+        
+        try:
+            sync.serve_once(None, None, host="0.0.0.0", port=0)
+            refused = False
+        except ValueError:
+            refused = True
+        self.assert_true(refused, "No secret, no listening beyond loopback")
+        
+        def exchange(server_secret, client_secret):
+            server, client = self._sync_engine(), self._sync_engine()
+            client.add_user("bob")
+            client.select_user("bob")
+            client.add_punch(datetime(2025, 11, 10, 9), datetime(2025, 11, 10, 13))
+            ready = threading.Event()
+            port, result = [], []
+            
+            def serve():
+                try:
+                    result.append(sync.serve_once(server.changes, server.storage, port=0,
+                                                  timeout=10, secret=server_secret,
+                                                  ready=lambda p: (port.append(p), ready.set())))
+                except (OSError, ValueError) as e:
+                    result.append(e)
+            thread = threading.Thread(target=serve)
+            thread.start()
+            ready.wait(10)
+            try:
+                sync.sync_socket(client.changes, client.storage, port=port[0], timeout=10,
+                                 secret=client_secret)
+            except OSError as e:
+                result.append(e)
+            thread.join(10)
+            return result[0], server.storage.load_users()
+        
+        result, users = exchange("s3cret", "s3cret")
+        self.assert_equal((result, list(users)), (1, ["bob"]), "Matching secrets sync")
+        result, users = exchange("s3cret", "guess")
+        self.assert_true(isinstance(result, OSError) and users == {},
+                         "Wrong secret rejected before any change")
+        result, users = exchange("s3cret", None)
+        self.assert_true(isinstance(result, PermissionError) and users == {},
+                         "Client without the secret rejected")
+    
+    def test_sync_log_setup_and_compaction(self):
+        """Test the change log only exists once sync is set up and is cut back once acknowledged"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        self.assert_equal(sync.changes_from_env(data_dir, {}), None, "No log without sync")
+        self.assert_true(sync.changes_from_env(data_dir, {sync.SYNC_DIR_VAR: data_dir}) is not None,
+                         "Log once a sync folder is set")
+        
+        phone, office = self._sync_engine(), self._sync_engine()
+        folder = tempfile.mkdtemp(dir=self.test_dir)
+        phone.add_user("alice")
+        phone.select_user("alice")
+        start = datetime(2025, 11, 10, 9, 0)
+        for day in range(3):
+            punch = phone.add_punch(start + timedelta(days=day), start + timedelta(days=day, hours=8))
+        phone.delete_punch(punch)
+        phone.sync_folder(folder)
+        office.sync_folder(folder)
+        phone.sync_folder(folder)
+        self.assert_equal(os.path.getsize(phone.changes.log_file), 0,
+                          "Acknowledged changes cut from the log")
+        
+        phone.add_punch(start + timedelta(days=4), start + timedelta(days=4, hours=2))
+        phone.sync_folder(folder)
+        self.assert_equal(office.sync_folder(folder), 1, "Offsets still line up after compaction")
+        office.select_user("alice")
+        self.assert_equal(len(office.history), 3, "Deleted punch stays deleted")
+        stale = {"user": "alice", "entry": punch.to_dict(), "modified": "2000-01-01T00:00:00",
+                 "origin": "old"}
+        self.assert_equal(phone.changes.apply_changes(phone.storage, [stale]), 0,
+                          "Compacted delete still blocks an older copy")
+    
+    def test_sync_refreshes_saved_totals(self):
+        """Test synced punches do not leave stale today/week totals saved for a lazy start"""
+        phone, office = self._sync_engine(), self._sync_engine()
+        folder = tempfile.mkdtemp(dir=self.test_dir)
+        start = datetime.now().replace(hour=1, minute=0, second=0, microsecond=0)
+        for engine, hours in ((office, {"bob": 1, "alice": 8}), (phone, {"alice": 2, "bob": 3})):
+            for user, length in hours.items():
+                engine.add_user(user)
+                engine.select_user(user)
+                engine.add_punch(start, start + timedelta(hours=length))
+                engine.save_user_data()
+        
+        phone.sync_folder(folder)
+        office.sync_folder(folder)
+        self.assert_equal(office.storage.load_user_state("alice")["totals"]["today_seconds"],
+                          10 * 3600, "Current user's saved totals recomputed")
+        self.assert_true("totals" not in office.storage.load_user_state("bob"),
+                         "Other user's saved totals dropped")
+        lazy = TimeClockEngine(office.storage, lazy=True)
+        lazy.select_user("bob")
+        self.assert_equal(lazy.today_hours().total_seconds(), 4 * 3600,
+                          "Lazy start counts the synced punch")
+    
+    def test_sync_reload_during_punch(self):
+        """Test a punch added while a background sync reloads the history is kept"""
+        import threading
+        import time
+        
+        phone, office = self._sync_engine(), self._sync_engine()
+        folder = tempfile.mkdtemp(dir=self.test_dir)
+        start = datetime(2025, 11, 10, 9, 0)
+        for engine in (phone, office):
+            engine.add_user("alice")
+            engine.select_user("alice")
+        phone.add_punch(start, start + timedelta(hours=8))
+        phone.sync_folder(folder)
+        office.history
+        
+        reading, release = threading.Event(), threading.Event()
+        load_history = office.storage.load_history
+        def slow_load(user):
+            entries = load_history(user)
+            reading.set()
+            release.wait(5)
+            return entries
+        office.storage.load_history = slow_load
+        sync_thread = threading.Thread(target=office.sync_folder, args=(folder,))
+        sync_thread.start()
+        reading.wait(5)
+        punch_thread = threading.Thread(target=office.add_punch,
+                                        args=(start + timedelta(days=1), start + timedelta(days=1, hours=2)))
+        punch_thread.start()
+        time.sleep(0.2)
+        release.set()
+        sync_thread.join()
+        punch_thread.join()
+        self.assert_equal(len(office.history), 2, "Punch kept after the reload")
+    
+    # ==================== Punch Id Tests ====================
+    
+    def test_punch_ids_sortable(self):
+        """Test ULID-style ids are unique and sort by creation time"""
+        print(f"\n{BOLD}[30. Punch Ids]{RESET}")
+        from timeclock_core.punches import new_punch_id
+        
+        ids = [new_punch_id(1700000000.0) for _ in range(1000)]
+        self.assert_equal(len(set(ids)), 1000, "No repeats within one millisecond")
+        self.assert_equal(ids, sorted(ids), "Monotonic within one millisecond")
+        later = new_punch_id(1800000000.0)
+        self.assert_true(len(later) == 26 and later > ids[-1], "Later ids sort after")
+    
+    def test_punch_index(self):
+        """Test finding, editing and deleting a punch by id"""
+        data_dir = tempfile.mkdtemp(dir=self.test_dir)
+        engine = TimeClockEngine(JsonStorage(data_dir))
+        engine.add_user("alice")
+        engine.select_user("alice")
+        start = datetime(2025, 11, 10, 9, 0)
+        punches = [engine.add_punch(start + timedelta(days=d), start + timedelta(days=d, hours=8))
+                   for d in range(3)]
+        # Same clock in as the middle punch, so removal has to find the right one
+        twin = engine.add_punch(start + timedelta(days=1), start + timedelta(days=1, hours=1))
         
-        self.assert_true("TIME CLOCK REPORT" in report, "Report contains header")
-        self.assert_true("TODAY'S HOURS" in report, "Report contains today's hours")
-        self.assert_true("WEEKLY TOTAL" in report, "Report contains weekly total")
+        self.assert_true(engine.find_punch(punches[1].id) is punches[1], "Found by id")
+        engine.edit_note(engine.find_punch(punches[1].id), "edited")
+        engine.delete_punch(twin)
+        self.assert_equal(engine.find_punch(twin.id), None, "Deleted from the index")
+        self.assert_equal(engine.totals.range_seconds() / 3600, 24.0, "Totals follow the delete")
+        
+        reloaded = TimeClockEngine(JsonStorage(data_dir))
+        reloaded.select_user("alice")
+        self.assert_equal([(p.id, p.note) for p in reloaded.history],
+                          [(p.id, p.note) for p in punches], "Ids and edit persisted")
+        
+        sqlite = SqliteStorage(os.path.join(data_dir, "ids.db"))
+        sqlite.append_history("alice", dict(punches[0].to_dict(), id="00000000000000000000000001"))
+        self.assert_equal(sqlite.load_history("alice")[0]["id"], "00000000000000000000000001",
+                          "All-digit id kept as text in SQLite")
+        sqlite.close()
+    
+    def test_sync_delete(self):
+        """Test a deleted punch is deleted on the other device too"""
+        phone, office = self._sync_engine(), self._sync_engine()
+        folder = tempfile.mkdtemp(dir=self.test_dir)
+        phone.add_user("alice")
+        phone.select_user("alice")
+        start = datetime(2025, 11, 10, 9, 0)
+        punch = phone.add_punch(start, start + timedelta(hours=8))
+        phone.sync_folder(folder)
+        office.sync_folder(folder)
+        
+        phone.delete_punch(punch)
+        phone.sync_folder(folder)
+        office.sync_folder(folder)
+        office.select_user("alice")
+        self.assert_equal(len(office.history), 0, "Delete synced")
+    
+    def test_sync_edits_rolled_over_punches(self):
+        """Test edits and deletes reach punches the other device already rolled over"""
+        for kind in ("json", "sqlite"):
+            phone, office = self._sync_engine(), self._sync_engine(kind)
+            folder = tempfile.mkdtemp(dir=self.test_dir)
+            phone.add_user("alice")
+            phone.select_user("alice")
+            start = datetime(2025, 11, 10, 9, 0)
+            kept = phone.add_punch(start, start + timedelta(hours=8))
+            dropped = phone.add_punch(start + timedelta(days=1), start + timedelta(days=1, hours=8))
+            phone.sync_folder(folder)
+            office.sync_folder(folder)
+            office.select_user("alice")
+            office.roll_over_weeks(now=datetime(2025, 11, 19, 12))
+            
+            phone.edit_note(phone.find_punch(kept.id), "fixed later")
+            phone.delete_punch(phone.find_punch(dropped.id))
+            phone.sync_folder(folder)
+            self.assert_equal(office.sync_folder(folder), 2, f"{kind}: both changes applied")
+            cold = office.storage.load_cold_history("alice")
+            self.assert_equal([(e["id"], e["note"]) for e in cold], [(kept.id, "fixed later")],
+                              f"{kind}: cold store edited")
+    
+    def test_duplicate_time_punches(self):
+        """Test punches sharing their clock times stay separate after a reload"""
+        start = datetime(2025, 11, 10, 9, 0)
+        for kind in ("json", "sqlite"):
+            data_dir = tempfile.mkdtemp(dir=self.test_dir)
+            engine = TimeClockEngine(open_storage(kind, data_dir))
+            engine.add_user("alice")
+            engine.select_user("alice")
+            engine.add_punch(start, start + timedelta(hours=9))
+            twin = engine.add_punch(start, start + timedelta(hours=9))
+            
+            reloaded = TimeClockEngine(open_storage(kind, data_dir))
+            reloaded.select_user("alice")
+            self.assert_equal(len(reloaded.history), 2, f"Both journaled punches replayed ({kind})")
+            reloaded.edit_note(reloaded.find_punch(twin.id), "entered twice")
+            
+            reloaded = TimeClockEngine(open_storage(kind, data_dir))
+            reloaded.select_user("alice")
+            self.assert_equal(len(reloaded.history), 2, f"Both punches kept ({kind})")
+            self.assert_equal(sum(p.duration for p in reloaded.history), 18 * 3600,
+                              f"18h after reload ({kind})")
+            
+            reloaded.storage.retire_history("alice", [reloaded.find_punch(twin.id).to_dict()])
+            self.assert_equal(len(reloaded.storage.load_history("alice")), 1,
+                              f"Retiring one twin keeps the other live ({kind})")
     
     # ==================== Summary ====================
     
@@ -405,6 +1861,101 @@ Total: 8.5 hours
             # Reports
             self.test_report_generation()
             
+            # Journal
+            self.test_punch_journal()
+            self.test_journal_compaction()
+            
+            # Storage
+            self.test_json_storage_range_queries()
+            self.test_sqlite_storage_import()
+            self.test_sharded_storage_migration()
+            self.test_sharded_reads_register_nobody()
+            
+            # Totals
+            self.test_running_totals()
+            
+            # Punch store
+            self.test_punch_round_trip()
+            self.test_punch_store_ranges()
+            self.test_history_pager()
+            
+            # Day index
+            self.test_day_index_ranges()
+            self.test_totals_date_ranges()
+            self.test_lazy_cumulative_column()
+            
+            # Timers
+            self.test_timer_registry()
+            
+            # Write-behind
+            self.test_write_behind_storage()
+            
+            # Crash-safe writes
+            self.test_atomic_json_writes()
+            self.test_batched_fsync()
+            
+            # Concurrent access
+            self.test_concurrent_instances_merge()
+            self.test_parallel_kiosk_processes()
+            
+            # Core engine
+            self.test_engine_clock_cycle()
+            self.test_engine_weekly_archive()
+            
+            # Benchmarks
+            self.test_benchmark_generator()
+            self.test_benchmark_compare()
+            
+            # Export
+            self.test_history_chunks()
+            self.test_streaming_export()
+            
+            # Payroll
+            self.test_payroll_single_pass()
+            self.test_payroll_formats()
+            self.test_payroll_archived_weeks()
+            
+            # Report cache
+            self.test_report_cache()
+            
+            # Archive index
+            self.test_archive_index()
+            self.test_archive_persisted_in_order()
+            
+            # Weekly rollover
+            self.test_weekly_rollover()
+            self.test_automatic_rollover()
+            self.test_rollover_keeps_punches_for_ranges()
+            self.test_rollover_crash_between_writes()
+            
+            # Startup imports
+            self.test_lazy_core_imports()
+            self.test_startup_compare()
+            
+            # Deferred loading
+            self.test_lazy_select_user()
+            self.test_lazy_rollover_and_old_state()
+            
+            # Profiling
+            self.test_profiling_env()
+            self.test_profiling_records_calls()
+            
+            # Device sync
+            self.test_punch_ids_stable()
+            self.test_sync_folder_delta()
+            self.test_sync_socket_loopback()
+            self.test_sync_socket_secret()
+            self.test_sync_log_setup_and_compaction()
+            self.test_sync_refreshes_saved_totals()
+            self.test_sync_reload_during_punch()
+            
+            # Punch ids
+            self.test_punch_ids_sortable()
+            self.test_punch_index()
+            self.test_sync_delete()
+            self.test_sync_edits_rolled_over_punches()
+            self.test_duplicate_time_punches()
+            
         except Exception as e:
             print(f"\n{RED}ERROR: {e}{RESET}")
             import traceback
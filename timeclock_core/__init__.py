@@ -0,0 +1,37 @@
+"""
+UI-free core of the time clock apps
+
+Storage backends, the punch model, running totals, the weekly archive and
+reports, plus TimeClockEngine, which ties them together for one front end.
+Nothing here imports Kivy or Tkinter, so the core can be tested and
+benchmarked on its own.
+
+Export (and the csv module behind it) is only imported on first use, since
+neither app needs it to show its first screen.
+"""
+
+from .archive import ArchiveIndex
+from .engine import TimeClockEngine, parse_punch_times, truncate_note
+from .persist import WriteBehindStorage
+from .punches import Punch, PunchStore
+from .reports import format_hours, format_hours_minutes, format_timedelta
+from .storage import JsonStorage, SqliteStorage, StorageBackend, open_storage
+from .totals import CumulativeColumn, DayIndex, RunningTotals
+
+__all__ = [
+    'ArchiveIndex',
+    'TimeClockEngine', 'parse_punch_times', 'truncate_note',
+    'ExportJob', 'export_csv',
+    'WriteBehindStorage',
+    'Punch', 'PunchStore',
+    'format_hours', 'format_hours_minutes', 'format_timedelta',
+    'JsonStorage', 'SqliteStorage', 'StorageBackend', 'open_storage',
+    'CumulativeColumn', 'DayIndex', 'RunningTotals',
+]
+
+
+def __getattr__(name):
+    if name in ('ExportJob', 'export_csv'):
+        from . import export
+        return getattr(export, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+"""
+Sorted weekly archive
+
+Archived weeks are kept (and persisted) in week_end order, oldest first,
+so the newest week is always the last one and a date range is two
+bisects. New weeks are inserted in place; a list loaded from storage is
+only sorted if an older version of the app saved it out of order.
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+def _week_end(week):
+    return week['week_end']
+
+
+def is_sorted(weeks):
+    """Whether weeks are already in week_end order"""
+    return all(weeks[i]['week_end'] <= weeks[i + 1]['week_end'] for i in range(len(weeks) - 1))
+
+
+def unarchived(stored, weeks):
+    """Weeks whose batch is not in stored yet (a rollover retried after a crash)"""
+    batches = {week.get('batch') for week in stored}
+    return [week for week in weeks if week.get('batch') is None or week['batch'] not in batches]
+
+
+def insert_week(weeks, week):
+    """Insert week into a week_end-ordered list (after equal week_ends); returns the list"""
+    if not is_sorted(weeks):
+        weeks.sort(key=_week_end)
+    index = bisect_right([w['week_end'] for w in weeks], week['week_end'])
+    weeks.insert(index, week)
+    return weeks
+
+
+class ArchiveIndex:
+    """A user's archived weeks, sorted by week_end (oldest first)"""
+
+    def __init__(self, weeks=()):
+        weeks = list(weeks)
+        if not is_sorted(weeks):
+            weeks.sort(key=_week_end)
+        self._weeks = weeks
+        self._ends = [week['week_end'] for week in weeks]
+
+    def to_list(self):
+        return list(self._weeks)
+
+    def __len__(self):
+        return len(self._weeks)
+
+    def __iter__(self):
+        return iter(self._weeks)
+
+    def __reversed__(self):
+        return reversed(self._weeks)
+
+    def __getitem__(self, index):
+        return self._weeks[index]
+
+    def add(self, week):
+        """Insert a week, keeping week_end order"""
+        index = bisect_right(self._ends, week['week_end'])
+        self._weeks.insert(index, week)
+        self._ends.insert(index, week['week_end'])
+        return week
+
+    @property
+    def latest(self):
+        """The week with the latest week_end (None if nothing is archived)"""
+        return self._weeks[-1] if self._weeks else None
+
+    def newest(self, index):
+        """The index-th week counting from the newest (0 = latest)"""
+        return self._weeks[-1 - index]
+
+    def between(self, start=None, end=None):
+        """Weeks with week_end between start and end (ISO dates, inclusive)"""
+        lo = bisect_left(self._ends, start) if start is not None else 0
+        hi = bisect_right(self._ends, end) if end is not None else len(self._ends)
+        return self._weeks[lo:hi]
@@ -0,0 +1,630 @@
+"""
+Headless time clock engine shared by the Kivy and Tkinter front ends
+
+TimeClockEngine holds one front end's session - the user list, the
+selected user's clock status, punches, running totals and weekly
+archive - and every operation on them. The front ends only collect input
+and display results, so totals, archiving and reports are computed (and
+cached) in one place, and the engine runs without Kivy or Tkinter.
+
+With lazy=True selecting a user reads only their clock status and the
+today/week totals cached with it; the history and archive are read the
+first time something needs them, or on a background thread started by
+prefetch(), so the first screen does not wait for them.
+"""
+
+import datetime
+import hashlib
+import os
+import threading
+
+from . import reports
+from .archive import ArchiveIndex, unarchived
+from .punches import Punch, PunchStore, day_from_number, new_punch_id, punch_id, to_epoch
+from .totals import RunningTotals
+
+NOTE_WORD_LIMIT = 20
+
+
+def truncate_note(note, limit=NOTE_WORD_LIMIT):
+    """Keep only the first `limit` words of a note"""
+    words = note.split()
+    if len(words) > limit:
+        return " ".join(words[:limit])
+    return note
+
+
+def parse_time(text):
+    """'HH:MM' (24 hour) -> datetime.time"""
+    parts = text.strip().split(':')
+    if len(parts) != 2:
+        raise ValueError('Times must be in HH:MM format')
+    return datetime.time(int(parts[0]), int(parts[1]))
+
+
+def parse_punch_times(date_text, clock_in_text, clock_out_text):
+    """Missed punch inputs (YYYY-MM-DD, HH:MM, HH:MM) -> (clock_in, clock_out)"""
+    day = datetime.datetime.strptime(date_text.strip(), '%Y-%m-%d').date()
+    clock_in = datetime.datetime.combine(day, parse_time(clock_in_text))
+    clock_out = datetime.datetime.combine(day, parse_time(clock_out_text))
+    if clock_out <= clock_in:
+        raise ValueError('Clock out time must be after clock in time')
+    return clock_in, clock_out
+
+
+def week_start(day):
+    """Monday of the week containing day"""
+    return day - datetime.timedelta(days=day.weekday())
+
+
+class TimeClockEngine:
+    """Users, clock status, punches, totals and archive for one front end"""
+
+    def __init__(self, storage, auto_rollover=False, lazy=False, changes=None):
+        self.storage = storage
+        self.changes = changes              # sync.ChangeLog recording punches for other devices
+        self.auto_rollover = auto_rollover  # Archive closed weeks on select and check_rollover()
+        self.lazy = lazy                    # Leave history / archive unread until needed
+        self.users = {}
+        self.current_user = None
+        self.current_status = 'clocked_out'
+        self.clock_in_time = None
+        self.clock_in_note = None
+        self.total_time_today = datetime.timedelta()
+        self._history = PunchStore()    # Selected user's punches, sorted by clock in
+        self._totals = RunningTotals()  # Day index over self.history
+        self._archive = ArchiveIndex()  # Selected user's archived weeks, by week_end
+        self._cached_totals = {}        # Totals saved with the user state, until history loads
+        self._load_lock = threading.RLock()  # Held while history / archive are read or punched
+
+        # Bumped on every change to history / archive; reports are cached per version
+        self.history_version = 0
+        self.archive_version = 0
+        self._reports = {}              # Report kind -> (cache key, text)
+        self.profiler = None            # Set by profiling.instrument() (TIMECLOCK_PROFILE)
+
+    # ---- users ----
+
+    def load_users(self):
+        """Load users from storage"""
+        try:
+            self.users = self.storage.load_users()
+        except Exception:
+            self.users = {}
+        return self.users
+
+    def save_users(self):
+        self.storage.save_users(self.users)
+
+    def add_user(self, name):
+        """Register a new user"""
+        name = name.strip()
+        if not name:
+            raise ValueError('Username is required!')
+        if name in self.users:
+            raise ValueError('User already exists!')
+        self.users[name] = {
+            'created': datetime.datetime.now().isoformat(),
+            'total_hours': 0
+        }
+        self.save_users()
+        return name
+
+    def rename_user(self, old_name, new_name):
+        """Change a username in the user list"""
+        new_name = new_name.strip()
+        if not new_name:
+            raise ValueError('Username cannot be empty!')
+        if new_name in self.users and new_name != old_name:
+            raise ValueError('Username already exists!')
+        self.users[new_name] = self.users.pop(old_name)
+        self.save_users()
+        return new_name
+
+    def delete_user(self, name):
+        """Remove a user and their session data, history and archive"""
+        del self.users[name]
+        self.save_users()
+        self.storage.delete_user(name)
+
+    def select_user(self, name):
+        """Make name the current user and load their data (only their status if lazy)"""
+        with self._load_lock:
+            self.current_user = name
+            self.load_user_data()
+            if not self.lazy:
+                self.load_archive()
+                self.load_history()
+            else:
+                self._history = self._totals = self._archive = None
+                self.history_version += 1
+                self.archive_version += 1
+                if not self._cached_totals:
+                    # Saved by an older version: read the history once and cache its totals
+                    self.history
+                    self.save_user_data()
+        if self.auto_rollover:
+            if self.lazy:
+                self.check_rollover()
+            else:
+                self.roll_over_weeks()
+
+    # ---- deferred loading ----
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._load('_history', self.load_history)
+        return self._history
+
+    @history.setter
+    def history(self, punches):
+        self._history = punches
+
+    @property
+    def totals(self):
+        if self._history is None:
+            self._load('_history', self.load_history)
+        return self._totals
+
+    @totals.setter
+    def totals(self, totals):
+        self._totals = totals
+
+    @property
+    def archive(self):
+        if self._archive is None:
+            self._load('_archive', self.load_archive)
+        return self._archive
+
+    @archive.setter
+    def archive(self, archive):
+        self._archive = archive
+
+    @property
+    def history_loaded(self):
+        return self._history is not None
+
+    @property
+    def archive_loaded(self):
+        return self._archive is not None
+
+    def _load(self, attribute, loader):
+        with self._load_lock:
+            # Another thread may have loaded it while this one waited
+            if getattr(self, attribute) is None:
+                loader()
+
+    def prefetch(self, on_error=None, before=None):
+        """Read the history and archive on a background thread; returns the thread
+
+        before(), if given, runs on that thread first (a device sync, say),
+        so the history read includes what it changed. on_error(exception) is
+        called from that thread if storage could not read them (the history
+        is then left empty, as select_user would).
+        """
+        def run():
+            try:
+                if before:
+                    before()
+                self.history
+                self.archive
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+        thread = threading.Thread(target=run, name='timeclock-prefetch', daemon=True)
+        thread.start()
+        return thread
+
+    # ---- session state ----
+
+    @property
+    def clocked_in(self):
+        return self.current_status == 'clocked_in'
+
+    def load_user_data(self):
+        """Load the current user's clock status"""
+        self.clock_in_note = None
+        try:
+            user_data = self.storage.load_user_state(self.current_user)
+
+            if user_data.get('status') == 'clocked_in':
+                self.current_status = 'clocked_in'
+                self.clock_in_time = datetime.datetime.fromisoformat(
+                    user_data['clock_in_time'])
+                self.clock_in_note = user_data.get('clock_in_note')
+            else:
+                self.current_status = 'clocked_out'
+
+            if 'total_time_seconds' in user_data:
+                self.total_time_today = datetime.timedelta(
+                    seconds=user_data['total_time_seconds'])
+            self._cached_totals = user_data.get('totals') or {}
+        except Exception:
+            self.current_status = 'clocked_out'
+            self._cached_totals = {}
+
+    def save_user_data(self, now=None):
+        """Save the current user's clock status, with today/week totals for a lazy start"""
+        # Unread history has not changed, so its cached totals still hold
+        if self.history_loaded:
+            today = (now or datetime.datetime.now()).date()
+            self._cached_totals = {
+                'date': today.isoformat(),
+                'today_seconds': self._totals.today_seconds(today),
+                'week_seconds': self._totals.week_seconds(today),
+                'first_day': self._history[0].date.isoformat() if self._history else None,
+            }
+        user_data = {
+            'status': self.current_status,
+            'total_time_seconds': self.total_time_today.total_seconds(),
+            'totals': self._cached_totals,
+        }
+        if self.clocked_in:
+            user_data['clock_in_time'] = self.clock_in_time.isoformat()
+            if self.clock_in_note:
+                user_data['clock_in_note'] = self.clock_in_note
+
+        self.storage.save_user_state(self.current_user, user_data)
+
+    def clock_in(self, note=None, now=None):
+        """Start a session; returns the clock in time"""
+        if self.clocked_in:
+            raise ValueError('Already clocked in!')
+        self.current_status = 'clocked_in'
+        self.clock_in_time = now or datetime.datetime.now()
+        self.clock_in_note = note or None
+        self.save_user_data()
+        return self.clock_in_time
+
+    def clock_out(self, note='', now=None):
+        """End the session and record it; returns the new Punch"""
+        if not self.clocked_in:
+            raise ValueError('Already clocked out!')
+        clock_out_time = now or datetime.datetime.now()
+        self.total_time_today += clock_out_time - self.clock_in_time
+
+        self.current_status = 'clocked_out'
+        self.clock_in_note = None
+        return self.add_punch(self.clock_in_time, clock_out_time, note)  # Saves the status
+
+    def reset_day(self, now=None):
+        """Reset the daily time tracking (a running session restarts now)"""
+        self.total_time_today = datetime.timedelta()
+        if self.clocked_in:
+            self.clock_in_time = now or datetime.datetime.now()
+        self.save_user_data()
+
+    def current_session(self, now=None):
+        """The running session length (zero when clocked out)"""
+        if self.clocked_in:
+            return (now or datetime.datetime.now()) - self.clock_in_time
+        return datetime.timedelta()
+
+    # ---- history ----
+
+    def load_history(self):
+        """Load the current user's punches (raises if storage could not read them)"""
+        history = PunchStore()
+        try:
+            # Parsed once here; every total, screen and report reuses the punch store
+            entries = self.storage.load_history(self.current_user) if self.current_user else []
+            history = PunchStore.from_dicts(entries, self.current_user)
+        finally:
+            # Totals first: another thread treats the history as loaded once it is set
+            self._totals = RunningTotals(history)
+            self._history = history
+            self.history_version += 1
+
+    def save_history(self):
+        """Rewrite the current user's history (after entries are removed or edited)"""
+        self.storage.replace_history(self.current_user, self.history.to_dicts())
+
+    def add_punch(self, clock_in, clock_out, note=''):
+        """Record a finished session; returns the new Punch"""
+        punch = Punch(to_epoch(clock_in), to_epoch(clock_out),
+                      (clock_out - clock_in).total_seconds(),
+                      truncate_note(note) if note else '', new_punch_id())
+        # A sync on the prefetch thread must not reload the history between
+        # adding the punch here and storing it
+        with self._load_lock:
+            self.history.add(punch)
+            self.totals.add(punch)
+            self.history_version += 1
+            # Append-only: a punch costs the same regardless of history size
+            entry = punch.to_dict()
+            self.storage.append_history(self.current_user, entry)
+        if self.changes is not None:
+            self.changes.record(self.current_user, entry)
+        self.save_user_data()  # Refresh the cached totals
+        return punch
+
+    def find_punch(self, punch_id):
+        """The current user's punch with this id (None if there is none)"""
+        return self.history.get(punch_id)
+
+    def edit_note(self, punch, note):
+        """Change a recorded punch's note"""
+        with self._load_lock:
+            punch.note = note
+            self.history_version += 1
+            self.save_history()
+        if self.changes is not None:
+            self.changes.record(self.current_user, punch.to_dict())
+
+    def delete_punch(self, punch):
+        """Remove a recorded punch and stop counting it"""
+        with self._load_lock:
+            self.history.remove(punch)
+            self.totals.remove(punch)
+            self.history_version += 1
+            self.save_history()
+        self.save_user_data()  # Refresh the cached totals
+        if self.changes is not None:
+            self.changes.record(self.current_user, punch.to_dict(), deleted=True)
+
+    def sync_folder(self, folder=None):
+        """Exchange punch changes with other devices through a shared folder
+
+        folder defaults to TIMECLOCK_SYNC_DIR (no sync if that is unset or
+        there is no change log). Returns the number of changes applied here;
+        users and the current user's history (and saved totals) are reloaded
+        if there were any.
+        """
+        from . import sync
+
+        folder = folder or os.environ.get(sync.SYNC_DIR_VAR)
+        if not folder or self.changes is None:
+            return 0
+        applied = sync.sync_folder(self.changes, self.storage, folder)
+        if applied:
+            # May run on the prefetch thread while the UI reads the history
+            with self._load_lock:
+                self.load_users()
+                if self.current_user:
+                    # Sync dropped the saved totals of every user it changed
+                    self.load_history()
+                    self.save_user_data()
+        return applied
+
+    # ---- totals ----
+
+    def _cached_seconds(self, today):
+        """(today, week) seconds from the totals saved with the user state"""
+        cache = self._cached_totals
+        if not cache.get('date'):
+            return 0.0, 0.0
+        saved = datetime.date.fromisoformat(cache['date'])
+        # Nothing was punched since they were saved, so later days add nothing
+        week = cache['week_seconds'] if saved <= today and week_start(saved) == week_start(today) else 0.0
+        return (cache['today_seconds'] if saved == today else 0.0), week
+
+    def today_hours(self, now=None):
+        """Time worked today, including the running session"""
+        now = now or datetime.datetime.now()
+        if self.history_loaded:
+            seconds = self._totals.today_seconds(now.date())
+        else:
+            seconds = self._cached_seconds(now.date())[0]
+        return datetime.timedelta(seconds=seconds) + self.current_session(now)
+
+    def week_hours(self, now=None):
+        """Time worked this week (Monday to today), including the running session"""
+        now = now or datetime.datetime.now()
+        if self.history_loaded:
+            seconds = self._totals.week_seconds(now.date())
+        else:
+            seconds = self._cached_seconds(now.date())[1]
+        return datetime.timedelta(seconds=seconds) + self.current_session(now)
+
+    def daily_breakdown(self, now=None):
+        """Time worked per weekday this week ({'Mon': timedelta, ...})"""
+        now = now or datetime.datetime.now()
+        today = now.date()
+        monday = week_start(today)
+        daily_hours = {}
+
+        # Future days of the week stay at zero
+        for i in range(7):
+            day = monday + datetime.timedelta(days=i)
+            seconds = self.totals.day_seconds(day) if day <= today else 0
+            daily_hours[day.strftime('%a')] = datetime.timedelta(seconds=seconds)
+
+        daily_hours[today.strftime('%a')] += self.current_session(now)
+        return daily_hours
+
+    def daily_totals(self, start, end):
+        """Seconds worked per day from start to end ({date: seconds}, worked days only)"""
+        totals = {}
+        for offset in range((end - start).days + 1):
+            day = start + datetime.timedelta(days=offset)
+            seconds = self.totals.day_seconds(day)
+            if seconds:
+                totals[day] = seconds
+        return totals
+
+    def period_summary(self, days, today=None):
+        """Totals for the last `days` calendar days, including today"""
+        end = today or datetime.date.today()
+        start = end - datetime.timedelta(days=days - 1)
+        daily = self.daily_totals(start, end)
+        total = datetime.timedelta(seconds=self.totals.range_seconds(start, end))
+        return {
+            'start': start,
+            'end': end,
+            'daily': daily,
+            'total': total,
+            'days_worked': len(daily),
+            'average': total / len(daily) if daily else datetime.timedelta(),
+        }
+
+    # ---- weekly archive ----
+
+    def load_archive(self):
+        """Load the current user's archived weeks"""
+        try:
+            self._archive = ArchiveIndex(self.storage.load_archive(self.current_user))
+        except Exception:
+            self._archive = ArchiveIndex()
+        self.archive_version += 1
+        return self.archive
+
+    def add_to_archive(self, week_end_date, total_hours, entries_count):
+        """Add a week's total to the archive"""
+        week_entry = {
+            'week_end': week_end_date,
+            'total_hours': total_hours,
+            'entries_count': entries_count,
+            'archived_date': datetime.datetime.now().isoformat()
+        }
+        self.archive.add(week_entry)
+        self.archive_version += 1
+        self.storage.append_archive(self.current_user, week_entry)
+        return week_entry
+
+    def latest_archived_week(self):
+        """The archived week with the latest end date (None if nothing is archived)"""
+        latest = self.archive.latest
+        if latest is None:
+            return None
+        # Punches added to a week after it closed are archived as a second record
+        records = self.archive.between(latest['week_end'], latest['week_end'])
+        if len(records) == 1:
+            return latest
+        return dict(latest,
+                    total_hours=round(sum(week['total_hours'] for week in records), 2),
+                    entries_count=sum(week['entries_count'] for week in records))
+
+    def check_rollover(self, now=None):
+        """Roll over closed weeks if the oldest punch is before this Monday (cheap to call often)"""
+        if self.history_loaded:
+            first = self._history[0].date if self._history else None
+        else:
+            first = self._cached_totals.get('first_day')
+            first = datetime.date.fromisoformat(first) if first else None
+        monday = week_start((now or datetime.datetime.now()).date())
+        if first is None or first >= monday:
+            return None
+        return self.roll_over_weeks(now)
+
+    def roll_over_weeks(self, now=None):
+        """Archive each closed week (Monday to Sunday, before this week) as its own record
+
+        One pass over the closed punches; only the current week stays in the
+        live history. The closed punches move to the storage's cold store,
+        where exports and payroll still read them. Returns the archived week
+        records (oldest first).
+        """
+        now = now or datetime.datetime.now()
+        monday = week_start(now.date())
+        closed = self.history.between(None, monday - datetime.timedelta(days=1))
+        if not closed:
+            return []
+
+        # Punches are sorted, so weeks come out oldest first. Day numbers count
+        # from Thursday 1970-01-01, so a day's weekday is (day + 3) % 7
+        weeks = []
+        sunday = None
+        for punch in closed:
+            day = punch.day
+            punch_sunday = day + 6 - (day + 3) % 7
+            if punch_sunday != sunday:
+                sunday = punch_sunday
+                weeks.append([sunday, 0, 0, hashlib.sha1()])
+            weeks[-1][1] += punch.duration
+            weeks[-1][2] += 1
+            weeks[-1][3].update(punch_id(self.current_user, punch.to_dict()).encode('utf-8'))
+
+        archived_date = now.isoformat()
+        records = [{
+            'week_end': day_from_number(sunday).isoformat(),
+            'total_hours': round(seconds / 3600, 2),
+            'entries_count': count,
+            'archived_date': archived_date,
+            'punches_kept': True,  # Still in the cold store; payroll reads those instead
+            # The punches it covers: a rollover that crashed before retiring
+            # them archives the same batch again, which storage then skips
+            'batch': digest.hexdigest()[:16],
+        } for sunday, seconds, count, digest in weeks]
+        for record in unarchived(self.archive.between(records[0]['week_end'],
+                                                      records[-1]['week_end']), records):
+            self.archive.add(record)
+        self.archive_version += 1
+        self.storage.extend_archive(self.current_user, records)
+
+        # Keep only current week entries (Mon onwards)
+        self.storage.retire_history(self.current_user, [punch.to_dict() for punch in closed])
+        self.history = PunchStore(self.history.between(monday))
+        self.totals.rebuild(self.history)
+        self.history_version += 1
+        self.save_user_data(now)
+        return records
+
+    def archive_previous_weeks(self, now=None):
+        """Archive every closed week (one record each) and retire their punches
+
+        Returns a summary of the reset for display.
+        """
+        now = now or datetime.datetime.now()
+        monday = week_start(now.date())
+        weeks = self.roll_over_weeks(now)
+
+        return {
+            'week_start': monday,
+            'week_end': monday + datetime.timedelta(days=6),
+            'week_total': (datetime.timedelta(seconds=self.totals.range_seconds(monday))
+                           + self.current_session(now)),
+            'weeks': len(weeks),
+            'archived': sum(week['entries_count'] for week in weeks),
+            'kept': len(self.history),
+        }
+
+    # ---- reports ----
+
+    def _cached_report(self, kind, now, build):
+        """build() once per user, data version, clock status and minute"""
+        # Reports print times to the minute, so repeated calls within a minute
+        # (print, copy, screen refresh) reuse the text until a punch, note edit,
+        # weekly reset or reload bumps a version
+        key = (self.current_user, self.history_version, self.archive_version,
+               self.current_status, self.clock_in_time,
+               now.replace(second=0, microsecond=0))
+        cached = self._reports.get(kind)
+        if cached and cached[0] == key:
+            return cached[1]
+        text = build()
+        self._reports[kind] = (key, text)
+        return text
+
+    def hours_report(self, now=None):
+        """Printable report of the current and previous week"""
+        now = now or datetime.datetime.now()
+        return self._cached_report('hours', now, lambda: reports.hours_report(
+            self.current_user, week_start(now.date()), self.week_hours(now),
+            self.latest_archived_week(), now))
+
+    def payroll_report(self, fmt='text', start=None, end=None, today=None):
+        """Current week, previous week and (optionally) start-end totals for every user"""
+        from . import payroll
+
+        periods = payroll.payroll_periods(today, start, end)
+
+        def build():
+            rows = payroll.payroll(self.storage, self.users, periods)
+            return payroll.render(rows, periods, fmt)
+
+        # Other users' punches are not versioned here; the minute in the key
+        # bounds how stale a cached sheet can be
+        return self._cached_report(('payroll', fmt, tuple(periods.items()), tuple(self.users)),
+                                   datetime.datetime.now(), build)
+
+    def csv_rows(self):
+        """CSV export rows for the current user, oldest first (header not included)"""
+        return reports.csv_rows(self.current_user, self.history)
+
+    def start_export(self, path, users=None, start=None, end=None):
+        """Export users' punches (default: the current user) to a CSV on a background thread"""
+        from .export import ExportJob
+
+        users = [self.current_user] if users is None else users
+        return ExportJob(self.storage, path, users, start, end).start()
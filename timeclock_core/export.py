@@ -0,0 +1,140 @@
+"""
+Streaming CSV export for any set of users and a date range
+
+export_csv reads each user's history from storage in sorted chunks and
+writes rows through a buffered file as it goes, so memory stays bounded
+by one chunk (one user's shard on the JSON backend) however long the
+export is. The file is written next to the target and renamed into place
+when complete, so a failed or cancelled export leaves no partial CSV.
+
+ExportJob runs an export on a background thread and exposes its progress
+for the UI to poll.
+"""
+
+import csv
+import datetime
+import os
+import threading
+
+from .reports import CSV_HEADER, format_timedelta
+
+CHUNK_SIZE = 1000              # History entries read from storage at a time
+BUFFER_SIZE = 64 * 1024        # Bytes buffered before each write to disk
+
+
+class ExportCancelled(Exception):
+    """The export was cancelled before it finished"""
+
+
+def _clock_text(iso):
+    """'YYYY-MM-DDTHH:MM:SS...' -> 'HH:MM:SS AM' (strftime('%I:%M:%S %p') without parsing)"""
+    hour = int(iso[11:13])
+    return f"{hour % 12 or 12:02d}:{iso[14:19]} {'AM' if hour < 12 else 'PM'}"
+
+
+def entry_row(user, entry):
+    """CSV export row for a stored history entry (same columns as reports.csv_row)"""
+    clock_in = entry['clock_in']
+    duration = datetime.timedelta(seconds=entry.get('duration_seconds', 0))
+    # Stored timestamps are already ISO text; slicing them avoids a parse and
+    # three strftime calls per row, which dominate a large export
+    return [
+        user,
+        clock_in[:10],
+        _clock_text(clock_in),
+        _clock_text(entry['clock_out']),
+        format_timedelta(duration),
+        f"{duration.total_seconds() / 3600:.2f}"
+    ]
+
+
+def export_csv(storage, path, users, start=None, end=None, progress=None,
+               cancelled=None, chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE):
+    """Write users' punches with clock in between start and end to path
+
+    Rows are grouped by user (in the order given), oldest first.
+    progress(rows, users_done, user_count) is called after every chunk;
+    cancelled() is checked as often and raises ExportCancelled when true.
+    Returns the number of rows written.
+    """
+    users = list(users)
+    part_path = path + '.part'
+    rows = 0
+    try:
+        with open(part_path, 'w', newline='', buffering=buffer_size) as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for done, user in enumerate(users):
+                for chunk in storage.history_chunks(user, start, end, chunk_size):
+                    if cancelled and cancelled():
+                        raise ExportCancelled()
+                    writer.writerows(entry_row(user, entry) for entry in chunk)
+                    rows += len(chunk)
+                    if progress:
+                        progress(rows, done, len(users))
+                if progress:
+                    progress(rows, done + 1, len(users))
+        os.replace(part_path, path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    return rows
+
+
+class ExportJob:
+    """An export_csv running on a background thread"""
+
+    def __init__(self, storage, path, users, start=None, end=None, chunk_size=CHUNK_SIZE):
+        self.storage = storage
+        self.path = path
+        self.users = list(users)
+        self.start_date = start
+        self.end_date = end
+        self.chunk_size = chunk_size
+
+        self.rows = 0                   # Rows written so far
+        self.users_done = 0
+        self.user_count = len(self.users)
+        self.error = None               # Exception that stopped the export
+        self.cancelled = False
+        self.done = False
+
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='timeclock-export', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop after the current chunk; the partial file is removed"""
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return self.done
+
+    @property
+    def fraction(self):
+        """Progress from 0 to 1, by users finished"""
+        return self.users_done / self.user_count if self.user_count else 1.0
+
+    def _progress(self, rows, users_done, user_count):
+        self.rows = rows
+        self.users_done = users_done
+
+    def _run(self):
+        try:
+            self.rows = export_csv(self.storage, self.path, self.users,
+                                   self.start_date, self.end_date,
+                                   progress=self._progress, cancelled=self._cancel.is_set,
+                                   chunk_size=self.chunk_size)
+        except ExportCancelled:
+            self.cancelled = True
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
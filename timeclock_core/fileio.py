@@ -0,0 +1,207 @@
+"""
+Crash-safe file writes for the JSON stores
+
+write_json_atomic writes to a temporary file and renames it over the
+target, keeping the previous version as <file>.bak, so a crash or dead
+battery mid-write leaves either the old or the new file, never a
+truncated one. read_json falls back to the backup when the main file is
+missing or unreadable (the damaged file is kept as <file>.corrupt).
+
+fsync is batched: with TIMECLOCK_FSYNC_WINDOW=<seconds> set, journal
+appends within that window are synced together once it closes, so a burst
+of punches at shift change pays one fsync instead of one each. A replaced
+file is always synced before it is renamed into place (otherwise the rename
+could reach the disk before the data); only the directory sync after the
+rename waits for the window. The default (0) syncs every write at once.
+
+FileLock is an advisory lock shared by every process using the same data
+directory (two kiosk instances, say), held around read-modify-write cycles.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _fsync_dir(path):
+    """fsync a directory (skipped where unsupported, e.g. Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class FsyncBatcher:
+    """Group commit: sync every file written within one window together"""
+
+    def __init__(self, window=0.0):
+        self.window = window    # Seconds; 0 syncs each write immediately
+        self._files = {}        # (device, inode) -> descriptor of a file written since the last sync
+        self._dirs = set()      # Directories renamed into since the last sync
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def sync(self, f):
+        """Make an open, written file durable (now, or when the window closes)"""
+        f.flush()
+        if self.window <= 0:
+            os.fsync(f.fileno())
+            return
+        # A duplicate of the writable descriptor outlives f: Windows cannot
+        # fsync a file reopened read-only
+        stat = os.fstat(f.fileno())
+        with self._lock:
+            if (stat.st_dev, stat.st_ino) in self._files:
+                return
+            try:
+                fd = os.dup(f.fileno())
+            except OSError:
+                fd = None
+            if fd is not None:
+                self._files[stat.st_dev, stat.st_ino] = fd
+                self._start_timer()
+                return
+        os.fsync(f.fileno())
+
+    def sync_dir(self, path):
+        """Make a rename in path's directory durable"""
+        directory = os.path.dirname(os.path.abspath(path))
+        if self.window <= 0:
+            _fsync_dir(directory)
+            return
+        with self._lock:
+            self._dirs.add(directory)
+            self._start_timer()
+
+    def flush(self):
+        """Sync everything written so far (window closed, or exit)"""
+        with self._lock:
+            files, self._files = self._files, {}
+            dirs, self._dirs = self._dirs, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        errors = []
+        for fd in files.values():
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                errors.append(e)
+            finally:
+                os.close(fd)
+        for directory in dirs:
+            _fsync_dir(directory)
+        if errors:
+            raise errors[0]
+
+
+fsync_batcher = FsyncBatcher(float(os.environ.get('TIMECLOCK_FSYNC_WINDOW', '0') or 0))
+atexit.register(fsync_batcher.flush)
+
+
+def write_json_atomic(path, data, backup=True, indent=2):
+    """Replace path with data without ever leaving a partial file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        # Not batched: the data has to be on disk before the rename is
+        f.flush()
+        os.fsync(f.fileno())
+    if backup and os.path.exists(path):
+        os.replace(path, path + '.bak')
+    os.replace(tmp_path, path)
+    fsync_batcher.sync_dir(path)
+
+
+def read_json(path, default):
+    """Load path, falling back to its backup if it is missing or damaged"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        # Keep the damaged file for inspection, then try the backup
+        print(f"{path} is damaged ({e}); restoring from backup", file=sys.stderr)
+        os.replace(path, path + '.corrupt')
+
+    backup = path + '.bak'
+    if not os.path.exists(backup):
+        return default
+    with open(backup, 'r') as f:
+        return json.load(f)
+
+
+def remove_json(path):
+    """Delete path together with its backup"""
+    for candidate in (path, path + '.bak', path + '.tmp'):
+        if os.path.exists(candidate):
+            os.remove(candidate)
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, across processes (re-entrant within one)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._depth = 0
+        self._thread_lock = threading.RLock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            f = open(self.path, 'a+')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    while True:
+                        try:
+                            # LK_LOCK gives up after ~10 seconds; keep waiting
+                            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+            except BaseException:
+                f.close()
+                self._thread_lock.release()
+                raise
+            self._file = f
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            f, self._file = self._file, None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                f.close()
+        self._thread_lock.release()
@@ -0,0 +1,135 @@
+"""
+Append-only punch journal for the time clock history
+
+Clock-outs append one JSON line to a journal file instead of rewriting the
+whole history snapshot. The journal is folded back into the snapshot
+(compaction) once it holds enough records, so the cost of a punch does not
+grow with the size of the history.
+"""
+
+import json
+import os
+
+from .fileio import fsync_batcher, read_json, write_json_atomic
+from .punches import punch_id
+
+
+class HistoryJournal:
+    """History snapshot ({user: [entries]}) plus an append-only journal"""
+
+    def __init__(self, history_file, journal_file=None, compact_every=500):
+        self.history_file = history_file
+        self.journal_file = journal_file or os.path.splitext(history_file)[0] + '.journal'
+        self.compact_every = compact_every
+        self._journal_records = None  # Lazily counted on first append
+        self._tail_checked = False     # Torn last line cut off before the first append
+
+    def _read_snapshot(self):
+        """Read the snapshot file ({user: [entries]})"""
+        return read_json(self.history_file, {})
+
+    def _read_journal(self):
+        """Read journal records, skipping a torn trailing line"""
+        records = []
+        if not os.path.exists(self.journal_file):
+            self._journal_records = 0
+            return records
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A crash mid-append leaves a partial last line
+                    continue
+        self._journal_records = len(records)
+        return records
+
+    def _replay(self, all_history, records):
+        """Apply journal records on top of a snapshot"""
+        seen = {}
+        for record in records:
+            user = record.get('user')
+            entry = record.get('entry')
+            if user is None or entry is None:
+                continue
+            entries = all_history.setdefault(user, [])
+            if user not in seen:
+                seen[user] = {punch_id(user, e) for e in entries}
+            # A crash between snapshot write and journal truncation can
+            # leave records that are already part of the snapshot (keyed on
+            # punch id: two punches may share their clock times)
+            key = punch_id(user, entry)
+            if key in seen[user]:
+                continue
+            seen[user].add(key)
+            entries.append(entry)
+        return all_history
+
+    def load_all(self):
+        """Load every user's history (snapshot + journal)"""
+        return self._replay(self._read_snapshot(), self._read_journal())
+
+    def load(self, user):
+        """Load one user's history"""
+        return self.load_all().get(user, [])
+
+    def _truncate_torn_tail(self):
+        """Cut off a partial last line so the next record starts on its own line"""
+        try:
+            with open(self.journal_file, 'rb+') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) == b'\n':
+                    return
+                # Find the end of the last complete line (the fragment is unreadable anyway)
+                end = size
+                while end > 0:
+                    start = max(0, end - 4096)
+                    f.seek(start)
+                    newline = f.read(end - start).rfind(b'\n')
+                    if newline >= 0:
+                        end = start + newline + 1
+                        break
+                    end = start
+                f.truncate(end)
+        except FileNotFoundError:
+            pass
+
+    def append(self, user, entry):
+        """Append a single punch without rewriting the snapshot"""
+        if not self._tail_checked:
+            self._truncate_torn_tail()
+            self._tail_checked = True
+        if self._journal_records is None:
+            self._read_journal()
+
+        with open(self.journal_file, 'a') as f:
+            f.write(json.dumps({'user': user, 'entry': entry}) + '\n')
+            fsync_batcher.sync(f)
+        self._journal_records += 1
+
+        if self._journal_records >= self.compact_every:
+            self.compact()
+
+    def rewrite(self, user, entries):
+        """Replace one user's history (reset, note edits) and compact"""
+        all_history = self.load_all()
+        all_history[user] = entries
+        self._write_snapshot(all_history)
+
+    def compact(self):
+        """Fold the journal into the snapshot file"""
+        self._write_snapshot(self.load_all())
+
+    def _write_snapshot(self, all_history):
+        write_json_atomic(self.history_file, all_history)
+        # Only truncate once the snapshot holds every journaled record
+        with open(self.journal_file, 'w'):
+            pass
+        self._journal_records = 0
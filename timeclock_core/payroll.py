@@ -0,0 +1,195 @@
+"""
+Payroll report for every user in one pass over storage
+
+Each user's history is read once, as one date range covering every
+period in the report (current week, previous week and an optional custom
+period), and every punch is added to the periods it falls in. Weeks
+reset before rolled over punches were kept exist only as an archived
+total; those are added to the periods that hold the whole week, and a
+period that holds only part of one is flagged approximate. Nothing
+is selected or loaded into an engine, so a payroll sheet for all staff
+costs one range read per user instead of a full reload per user.
+
+With workers > 1 users are spread across a process pool; each worker
+process opens its own storage from (kind, data_dir).
+
+payroll_report.py is the command line front end.
+"""
+
+import csv
+import datetime
+import io
+import json
+from collections import OrderedDict
+
+from .archive import ArchiveIndex
+from .reports import format_hours_minutes
+from .storage import open_storage
+
+FORMATS = ('text', 'csv', 'json')
+COLUMN_WIDTH = 11
+
+
+def payroll_periods(today=None, start=None, end=None):
+    """{name: (start date, end date)}: current week, previous week, optional custom period"""
+    today = today or datetime.date.today()
+    monday = today - datetime.timedelta(days=today.weekday())
+    periods = OrderedDict()
+    periods['current_week'] = (monday, monday + datetime.timedelta(days=6))
+    periods['previous_week'] = (monday - datetime.timedelta(days=7),
+                                monday - datetime.timedelta(days=1))
+    if start or end:
+        periods['period'] = (start or datetime.date.min, end or today)
+    return periods
+
+
+def user_payroll(storage, user, periods):
+    """One user's seconds worked per period, from a single range read
+
+    row['approximate'] lists the periods that only partly cover an archived
+    week whose punches are gone (that week is left out of their totals).
+    """
+    bounds = [(name, start.isoformat(), end.isoformat())
+              for name, (start, end) in periods.items()]
+    first = min(start for start, _ in periods.values())
+    last = max(end for _, end in periods.values())
+
+    row = {'user': user, 'punches': 0, 'approximate': []}
+    row.update((name, 0) for name in periods)
+    for chunk in storage.history_chunks(user, first, last):
+        for entry in chunk:
+            day = entry['clock_in'][:10]
+            seconds = entry.get('duration_seconds', 0)
+            row['punches'] += 1
+            for name, start, end in bounds:
+                if start <= day <= end:
+                    row[name] += seconds
+
+    # Weeks reset by older versions live only in the archive, as one total
+    week_ends = (first.isoformat(), (last + datetime.timedelta(days=6)).isoformat())
+    approximate = set()
+    for week in ArchiveIndex(storage.load_archive(user)).between(*week_ends):
+        if week.get('punches_kept'):
+            continue  # Its punches were read above
+        sunday = datetime.date.fromisoformat(week['week_end'])
+        monday = sunday - datetime.timedelta(days=6)
+        for name, (start, end) in periods.items():
+            if start <= monday and sunday <= end:
+                row[name] += week['total_hours'] * 3600
+            elif start <= sunday and monday <= end:
+                approximate.add(name)
+    row['approximate'] = [name for name in periods if name in approximate]
+    return row
+
+
+_worker_storage = None
+
+
+def _init_worker(kind, data_dir):
+    global _worker_storage
+    _worker_storage = open_storage(kind, data_dir)
+
+
+def _worker_payroll(args):
+    user, periods = args
+    return user_payroll(_worker_storage, user, periods)
+
+
+def payroll(storage, users=None, periods=None, workers=1, kind=None, data_dir='.'):
+    """Payroll rows ({'user', 'punches', <period>: seconds}) for users (default: all)
+
+    workers > 1 runs users in a process pool; the workers open
+    open_storage(kind, data_dir) themselves, so those must name the same
+    data as storage.
+    """
+    users = list(storage.load_users() if users is None else users)
+    periods = periods or payroll_periods()
+    if workers <= 1 or len(users) < 2:
+        return [user_payroll(storage, user, periods) for user in users]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Queued saves must be on disk before other processes read it
+    flush = getattr(storage, 'flush', None)
+    if flush:
+        flush()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(kind, data_dir)) as pool:
+        chunksize = max(1, len(users) // (workers * 4))
+        return list(pool.map(_worker_payroll, [(user, periods) for user in users],
+                             chunksize=chunksize))
+
+
+def _hours(seconds):
+    return round(seconds / 3600, 2)
+
+
+def _period_text(start, end):
+    if start == datetime.date.min:
+        return f"... - {end.strftime('%a, %b %d %Y')}"
+    return f"{start.strftime('%a, %b %d %Y')} - {end.strftime('%a, %b %d %Y')}"
+
+
+def _cell(row, name):
+    """Hours and minutes for a period, marked ~ if approximate"""
+    mark = '~' if name in row.get('approximate', ()) else ''
+    return mark + format_hours_minutes(datetime.timedelta(seconds=row[name]))
+
+
+def format_text(rows, periods, now=None):
+    """Printable payroll sheet"""
+    now = now or datetime.datetime.now()
+    titles = {'current_week': 'Current', 'previous_week': 'Previous', 'period': 'Period'}
+    lines = [
+        "=======================================",
+        "           PAYROLL REPORT",
+        f"    Printed: {now.strftime('%Y-%m-%d %I:%M %p')}",
+        "=======================================",
+        "",
+    ]
+    for name, (start, end) in periods.items():
+        lines.append(f"{titles[name] + ':':<10} {_period_text(start, end)}")
+    lines.append("---------------------------------------")
+    lines.append(f"{'User':<16}" + "".join(f"{titles[name]:>{COLUMN_WIDTH}}" for name in periods))
+    for row in rows:
+        lines.append(f"{row['user'][:16]:<16}" + "".join(
+            f"{_cell(row, name):>{COLUMN_WIDTH}}" for name in periods))
+    lines.append("---------------------------------------")
+    lines.append(f"{'TOTAL':<16}" + "".join(
+        f"{format_hours_minutes(datetime.timedelta(seconds=sum(r[name] for r in rows))):>{COLUMN_WIDTH}}"
+        for name in periods))
+    if any(row.get('approximate') for row in rows):
+        lines.append("~ Leaves out an archived week only partly in the period")
+    lines.append("=======================================")
+    return "\n".join(lines) + "\n"
+
+
+def format_csv(rows, periods):
+    """Payroll sheet as CSV text (hours as decimals)"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['User'] + [f"{name} ({start} - {end})"
+                                for name, (start, end) in periods.items()]
+                    + ['Punches', 'Approximate'])
+    for row in rows:
+        writer.writerow([row['user']] + [f"{_hours(row[name]):.2f}" for name in periods]
+                        + [row['punches'], ' '.join(row.get('approximate', ()))])
+    return out.getvalue()
+
+
+def format_json(rows, periods):
+    """Payroll sheet as JSON text (hours as decimals)"""
+    return json.dumps({
+        'periods': {name: {'start': start.isoformat(), 'end': end.isoformat()}
+                    for name, (start, end) in periods.items()},
+        'users': [dict(row, **{name: _hours(row[name]) for name in periods}) for row in rows],
+    }, indent=2)
+
+
+def render(rows, periods, fmt='text'):
+    """Payroll rows as text, CSV or JSON"""
+    if fmt == 'csv':
+        return format_csv(rows, periods)
+    if fmt == 'json':
+        return format_json(rows, periods)
+    return format_text(rows, periods)
@@ -0,0 +1,176 @@
+"""
+Write-behind persistence for the time clock apps
+
+WriteBehindStorage wraps a storage backend so saves return immediately:
+each write is queued and a background thread applies it. Writes that
+replace the same data (session state, the user list, a full history
+rewrite) are coalesced so only the newest one reaches the disk. The
+apps' in-memory state stays authoritative; reads first wait for the
+queue to drain so they never see older data than was last saved.
+
+Call flush() or close() before exit so queued writes are not lost.
+"""
+
+import copy
+import itertools
+import sys
+import threading
+from collections import OrderedDict
+
+from .storage import StorageBackend
+
+
+class WriteBehindStorage(StorageBackend):
+    """Storage backend whose writes run on a background thread"""
+
+    def __init__(self, storage, max_pending=256):
+        self.storage = storage
+        self.max_pending = max_pending   # Writers wait once this many writes are queued
+        self.errors = []                 # (operation, exception) for failed writes
+
+        self._pending = OrderedDict()    # Coalescing key -> (user, method name, args)
+        self._unique = itertools.count()  # Keys for writes that never coalesce
+        self._busy = False               # A write is being applied right now
+        self._closed = False
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()  # One storage call at a time (worker or reader)
+
+        self._worker = threading.Thread(target=self._run, name='timeclock-writer', daemon=True)
+        self._worker.start()
+
+    # ---- queue ----
+
+    def _enqueue(self, key, user, method, *args):
+        """Queue a write, replacing a pending write with the same key"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Storage is closed")
+            if key not in self._pending:
+                while len(self._pending) >= self.max_pending:
+                    self._cond.wait()
+            self._pending[key] = (user, method, args)
+            self._pending.move_to_end(key)
+            self._cond.notify_all()
+
+    def _drop_pending(self, user, methods):
+        """Forget queued writes for a user that a newer write supersedes"""
+        for key in [key for key, (pending_user, method, _) in self._pending.items()
+                    if pending_user == user and method in methods]:
+            del self._pending[key]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, (user, method, args) = self._pending.popitem(last=False)
+                self._busy = True
+                self._cond.notify_all()
+            try:
+                with self._io_lock:
+                    getattr(self.storage, method)(*args)
+            except Exception as e:
+                # Keep going: later writes (e.g. a full rewrite) may still succeed
+                self.errors.append((method, e))
+                print(f"Error saving {method} for {user}: {e}", file=sys.stderr)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    @property
+    def pending_count(self):
+        """Writes queued but not yet applied"""
+        with self._cond:
+            return len(self._pending) + (1 if self._busy else 0)
+
+    def flush(self, timeout=None):
+        """Wait until every queued write has been applied"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self):
+        """Apply queued writes, stop the worker and close the backend"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+        self.storage.close()
+
+    # ---- writes (queued) ----
+
+    def save_users(self, users):
+        self._enqueue(('users',), None, 'save_users', copy.deepcopy(users))
+
+    def delete_user(self, user):
+        with self._cond:
+            self._drop_pending(user, ('save_user_state', 'append_history', 'replace_history',
+                                      'retire_history', 'append_archive', 'extend_archive'))
+        self._enqueue(('delete', user), user, 'delete_user', user)
+
+    def save_user_state(self, user, state):
+        self._enqueue(('state', user), user, 'save_user_state', user, copy.deepcopy(state))
+
+    def append_history(self, user, entry):
+        # Appends keep their order; the entry dict must not be changed afterwards
+        self._enqueue(next(self._unique), user, 'append_history', user, entry)
+
+    def replace_history(self, user, entries):
+        # A full rewrite already holds every earlier append
+        with self._cond:
+            self._drop_pending(user, ('append_history', 'replace_history'))
+        self._enqueue(('history', user), user, 'replace_history', user, entries)
+
+    def retire_history(self, user, entries):
+        # Runs in order after the appends and rewrites queued before it
+        self._enqueue(next(self._unique), user, 'retire_history', user, entries)
+
+    def append_archive(self, user, week):
+        self._enqueue(next(self._unique), user, 'append_archive', user, copy.deepcopy(week))
+
+    def extend_archive(self, user, weeks):
+        self._enqueue(next(self._unique), user, 'extend_archive', user, copy.deepcopy(weeks))
+
+    def update_punches(self, user, entries_by_id):
+        # Returns a count, so it runs now (after the queued writes it builds on)
+        return self._read('update_punches', user, entries_by_id)
+
+    # ---- reads (after the queue drains) ----
+
+    def _read(self, method, *args):
+        self.flush()
+        with self._io_lock:
+            return getattr(self.storage, method)(*args)
+
+    def load_users(self):
+        return self._read('load_users')
+
+    def load_user_state(self, user):
+        return self._read('load_user_state', user)
+
+    def load_history(self, user):
+        return self._read('load_history', user)
+
+    def load_archive(self, user):
+        return self._read('load_archive', user)
+
+    def load_cold_history(self, user):
+        return self._read('load_cold_history', user)
+
+    def history_between(self, user, start=None, end=None):
+        return self._read('history_between', user, start, end)
+
+    def history_chunks(self, user, start=None, end=None, size=1000):
+        self.flush()
+        chunks = self.storage.history_chunks(user, start, end, size)
+        while True:
+            # Lock per chunk, so queued saves still run during a long export
+            with self._io_lock:
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
@@ -0,0 +1,191 @@
+"""
+Opt-in profiling of storage and engine hot paths
+
+With TIMECLOCK_PROFILE set, instrument() wraps the engine's load, save,
+punch, totals, report and weekly reset methods and its storage's reads
+and writes. Each call records its count, total and maximum latency, a
+latency histogram and (for storage) the JSON-encoded size of the data
+read or written. The stats are written to a file when the app exits and
+shown on each app's hidden diagnostics screen.
+
+TIMECLOCK_PROFILE=path.json or path.csv picks the file; any other value
+(1, say) writes timeclock_profile.json. Unset, nothing is wrapped and the
+calls run exactly as before.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+ENV_VAR = 'TIMECLOCK_PROFILE'
+DEFAULT_PATH = 'timeclock_profile.json'
+
+# Histogram bucket upper bounds (ms); the last bucket is everything slower
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500)
+
+ENGINE_CALLS = (
+    'load_users', 'save_users', 'select_user', 'load_user_data', 'save_user_data',
+    'load_history', 'save_history', 'load_archive', 'add_punch', 'today_hours',
+    'week_hours', 'daily_breakdown', 'hours_report', 'payroll_report',
+    'archive_previous_weeks', 'roll_over_weeks',
+)
+STORAGE_READS = ('load_users', 'load_user_state', 'load_history', 'load_cold_history',
+                 'load_archive', 'history_between')
+STORAGE_WRITES = ('save_users', 'save_user_state', 'append_history', 'replace_history',
+                  'retire_history', 'update_punches', 'append_archive', 'extend_archive')
+
+COLUMNS = ['name', 'count', 'total_ms', 'mean_ms', 'max_ms', 'bytes_read', 'bytes_written'] + [
+    f"le_{bound}ms" for bound in BUCKETS_MS] + [f"gt_{BUCKETS_MS[-1]}ms"]
+
+
+def _size(data):
+    """JSON-encoded size of data in bytes (0 if it does not encode)"""
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class CallStats:
+    """Count, latency and bytes for one instrumented call"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add(self, ms, bytes_read=0, bytes_written=0):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        bucket = 0
+        while bucket < len(BUCKETS_MS) and ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+
+class Profiler:
+    """Call stats by name ('engine.week_hours', 'disk.load_history', ...)"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.stats = {}
+        self._lock = threading.Lock()  # Storage writes are recorded from the writer thread
+
+    def record(self, name, ms, bytes_read=0, bytes_written=0):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+            stats.add(ms, bytes_read, bytes_written)
+
+    def _timed(self, name, func, reads=False, writes=False):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+            # Sized after the clock stops, so encoding does not count as latency
+            self.record(name, ms, _size(result) if reads else 0,
+                        _size(args[-1]) if writes and args else 0)
+            return result
+        timed.__wrapped__ = func
+        return timed
+
+    def wrap(self, obj, prefix, names, reads=(), writes=()):
+        """Replace obj's methods in names (if it has them) with timed ones"""
+        for name in names:
+            func = getattr(obj, name, None)
+            if func is None or hasattr(func, '__wrapped__'):
+                continue
+            setattr(obj, name, self._timed(f"{prefix}.{name}", func,
+                                           name in reads, name in writes))
+
+    def rows(self):
+        """Stats as dicts (COLUMNS), slowest total first"""
+        with self._lock:
+            items = list(self.stats.items())
+        rows = []
+        for name, stats in items:
+            row = {
+                'name': name,
+                'count': stats.count,
+                'total_ms': round(stats.total_ms, 3),
+                'mean_ms': round(stats.total_ms / stats.count, 3) if stats.count else 0.0,
+                'max_ms': round(stats.max_ms, 3),
+                'bytes_read': stats.bytes_read,
+                'bytes_written': stats.bytes_written,
+            }
+            row.update(zip(COLUMNS[7:], stats.histogram))
+            rows.append(row)
+        rows.sort(key=lambda row: -row['total_ms'])
+        return rows
+
+    def dump(self, path=None):
+        """Write the stats to path (default self.path) as CSV or JSON by extension"""
+        path = path or self.path
+        rows = self.rows()
+        if path.endswith('.csv'):
+            import csv
+
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'buckets_ms': list(BUCKETS_MS), 'calls': rows}, f, indent=2)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+
+def format_text(rows):
+    """Stats as a fixed-width table for the diagnostics screens"""
+    lines = [f"{'Call':<30}{'Count':>7}{'Mean ms':>9}{'Max ms':>9}{'KB in':>8}{'KB out':>8}"]
+    for row in rows:
+        lines.append(f"{row['name'][:30]:<30}{row['count']:>7}{row['mean_ms']:>9.2f}"
+                     f"{row['max_ms']:>9.2f}{row['bytes_read'] / 1024:>8.1f}"
+                     f"{row['bytes_written'] / 1024:>8.1f}")
+    if not rows:
+        lines.append("No calls recorded yet")
+    return "\n".join(lines)
+
+
+def from_env(environ=None):
+    """A Profiler if TIMECLOCK_PROFILE is set, else None"""
+    value = (os.environ if environ is None else environ).get(ENV_VAR, '').strip()
+    if not value or value == '0':
+        return None
+    return Profiler(value if value.endswith(('.json', '.csv')) else DEFAULT_PATH)
+
+
+def instrument(engine, profiler=None):
+    """Time engine and storage calls (if profiling is enabled); returns the Profiler or None
+
+    A write-behind storage is wrapped twice: 'storage.' times what the
+    engine waits for, 'disk.' what the writer thread spends on the backend.
+    """
+    if profiler is None:
+        profiler = from_env()
+        if profiler is None:
+            return None
+        atexit.register(profiler.dump)
+    profiler.wrap(engine, 'engine', ENGINE_CALLS)
+    storage = engine.storage
+    profiler.wrap(storage, 'storage', STORAGE_READS + STORAGE_WRITES, STORAGE_READS, STORAGE_WRITES)
+    backend = getattr(storage, 'storage', None)
+    if backend is not None:
+        profiler.wrap(backend, 'disk', STORAGE_READS + STORAGE_WRITES, STORAGE_READS, STORAGE_WRITES)
+    engine.profiler = profiler
+    return profiler
@@ -0,0 +1,216 @@
+"""
+Compact in-memory punch representation
+
+History entries are stored on disk as dicts of ISO strings. Punch parses
+one entry once, at load time, into epoch seconds held in __slots__, and
+PunchStore keeps a user's punches sorted by clock in so every total,
+filter and export works on numbers and bisects instead of re-parsing,
+plus an id -> punch index for finding, editing and deleting one punch.
+
+Punch ids are ULID-style: 26 characters that sort by creation time and
+never repeat, so they can key edits, sync and caches. Entries saved with
+the old list-position ids get a stable id derived from their clock times.
+
+Timestamps are naive local times, so "epoch seconds" here are seconds
+since 1970-01-01 00:00 in local wall-clock time (no timezone conversion).
+"""
+
+import datetime
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch(dt):
+    """Naive datetime -> epoch seconds"""
+    return (dt - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    """Epoch seconds -> naive datetime (exact to the microsecond)"""
+    return EPOCH + datetime.timedelta(microseconds=round(seconds * 1000000))
+
+
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_last_id = [0, 0]          # (milliseconds, random part) of the last id made here
+_id_lock = threading.Lock()
+
+
+def new_punch_id(now=None):
+    """ULID-style id: 48-bit millisecond time + 80 random bits, as 26 characters
+
+    Ids sort by creation time. Within one millisecond the random part of
+    the previous id is incremented, so ids made here are strictly
+    increasing even if the clock stalls or steps back.
+    """
+    ms = int((time.time() if now is None else now) * 1000)
+    with _id_lock:
+        last_ms, last_random = _last_id
+        if ms <= last_ms:
+            ms, random_part = last_ms, last_random + 1
+        else:
+            random_part = int.from_bytes(os.urandom(10), 'big')
+        _last_id[:] = ms, random_part
+    value = (ms << 80) | (random_part & ((1 << 80) - 1))
+    return ''.join(CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def punch_id(user, entry):
+    """A stored history entry's stable id
+
+    Entries saved before ids were unique carry their list position (an
+    int) as id; theirs is derived from the user and clock times instead,
+    so every device holding the same old data agrees on it.
+    """
+    entry_id = entry.get('id')
+    if isinstance(entry_id, str) and entry_id:
+        return entry_id
+    import hashlib
+
+    key = f"{user}|{entry['clock_in']}|{entry['clock_out']}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:32]
+
+
+def day_number(day):
+    """date -> days since 1970-01-01"""
+    return day.toordinal() - EPOCH_ORDINAL
+
+
+def day_from_number(number):
+    """days since 1970-01-01 -> date"""
+    return datetime.date.fromordinal(number + EPOCH_ORDINAL)
+
+
+class Punch:
+    """One finished session (clock in -> clock out)"""
+
+    __slots__ = ('clock_in', 'clock_out', 'duration', 'note', 'id')
+
+    def __init__(self, clock_in, clock_out, duration, note='', id=None):
+        self.clock_in = clock_in      # Epoch seconds
+        self.clock_out = clock_out    # Epoch seconds
+        self.duration = duration      # Seconds worked
+        self.note = sys.intern(note) if note else ''
+        self.id = id
+
+    @classmethod
+    def from_dict(cls, entry, user=''):
+        """Parse a stored history entry (old integer ids are replaced, see punch_id)"""
+        return cls(
+            to_epoch(datetime.datetime.fromisoformat(entry['clock_in'])),
+            to_epoch(datetime.datetime.fromisoformat(entry['clock_out'])),
+            entry.get('duration_seconds', 0),
+            entry.get('note', ''),
+            punch_id(user, entry),
+        )
+
+    def to_dict(self):
+        """History entry in the stored (ISO string) format"""
+        clock_in = self.clock_in_dt
+        return {
+            'clock_in': clock_in.isoformat(),
+            'clock_out': self.clock_out_dt.isoformat(),
+            'duration_seconds': self.duration,
+            'date': clock_in.strftime('%Y-%m-%d'),
+            'note': self.note,
+            'id': self.id
+        }
+
+    @property
+    def clock_in_dt(self):
+        return from_epoch(self.clock_in)
+
+    @property
+    def clock_out_dt(self):
+        return from_epoch(self.clock_out)
+
+    @property
+    def day(self):
+        """Day of the clock in, as days since 1970-01-01"""
+        return int(self.clock_in // SECONDS_PER_DAY)
+
+    @property
+    def date(self):
+        return day_from_number(self.day)
+
+
+class PunchStore:
+    """A user's punches, sorted by clock in"""
+
+    def __init__(self, punches=()):
+        self._punches = sorted(punches, key=lambda p: p.clock_in)
+        self._starts = array('d', (p.clock_in for p in self._punches))
+        self._by_id = {}
+        for punch in self._punches:
+            self._index(punch)
+
+    @classmethod
+    def from_dicts(cls, entries, user=''):
+        return cls(Punch.from_dict(entry, user) for entry in entries)
+
+    def _index(self, punch):
+        # Exact duplicates in old data derive the same id; the copy gets a new one
+        if punch.id is None or punch.id in self._by_id:
+            punch.id = new_punch_id()
+        self._by_id[punch.id] = punch
+
+    def to_dicts(self):
+        return [punch.to_dict() for punch in self._punches]
+
+    def __len__(self):
+        return len(self._punches)
+
+    def __iter__(self):
+        return iter(self._punches)
+
+    def __reversed__(self):
+        return reversed(self._punches)
+
+    def __getitem__(self, index):
+        return self._punches[index]
+
+    def __contains__(self, punch_id):
+        return punch_id in self._by_id
+
+    def get(self, punch_id, default=None):
+        """The punch with this id (a dict lookup)"""
+        return self._by_id.get(punch_id, default)
+
+    def add(self, punch):
+        """Insert a punch, keeping clock-in order (missed punches are back-dated)"""
+        self._index(punch)
+        index = bisect_right(self._starts, punch.clock_in)
+        self._punches.insert(index, punch)
+        self._starts.insert(index, punch.clock_in)
+        return punch
+
+    def remove(self, punch):
+        """Remove a punch; found by id, then bisected to by its clock in"""
+        punch = self._by_id.pop(punch.id)
+        index = bisect_left(self._starts, punch.clock_in)
+        while self._punches[index] is not punch:
+            index += 1  # Past other punches with the same clock in
+        del self._punches[index]
+        del self._starts[index]
+        return punch
+
+    def _day_index(self, day):
+        return bisect_left(self._starts, day_number(day) * SECONDS_PER_DAY)
+
+    def between(self, start=None, end=None):
+        """Punches with clock in on days start..end (inclusive dates)"""
+        lo = self._day_index(start) if start is not None else 0
+        hi = (self._day_index(end + datetime.timedelta(days=1))
+              if end is not None else len(self._punches))
+        return self._punches[lo:hi]
+
+    def total_seconds(self, punches=None):
+        return sum(p.duration for p in (self._punches if punches is None else punches))
@@ -0,0 +1,136 @@
+"""
+Formatting and report text shared by the time clock front ends
+"""
+
+import datetime
+
+
+def format_timedelta(td):
+    """Format timedelta to readable string (HH:MM:SS)"""
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def format_hours(td):
+    """Format timedelta to hours decimal (e.g. 7.5)"""
+    return f"{td.total_seconds() / 3600:.1f}"
+
+
+def format_hours_minutes(td):
+    """Format timedelta to hours and minutes (e.g. 7h 30m)"""
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    return f"{hours}h {minutes}m"
+
+
+def format_decimal_hours(total_hours):
+    """Format archived decimal hours (e.g. 7.5) as hours and minutes"""
+    hours = int(total_hours)
+    minutes = int((total_hours - hours) * 60)
+    return f"{hours}h {minutes}m"
+
+
+def hours_report(user, week_start, week_duration, previous_week=None, now=None):
+    """Printable report of the current week and the most recent archived week"""
+    now = now or datetime.datetime.now()
+    week_end = week_start + datetime.timedelta(days=6)  # Sunday
+
+    # Generate report with ASCII characters (no special Unicode)
+    report = (
+        f"=======================================\n"
+        f"        HOURS WORKED REPORT\n"
+        f"         User: {user}\n"
+        f"    Printed: {now.strftime('%Y-%m-%d %I:%M %p')}\n"
+        f"=======================================\n\n"
+        f"CURRENT WEEK\n"
+        f"Period: {week_start.strftime('%a, %b %d')} - {week_end.strftime('%a, %b %d')}\n"
+        f"Hours Worked: {format_hours_minutes(week_duration)}\n\n"
+        f"---------------------------------------\n"
+        f"PREVIOUS WEEK\n"
+    )
+
+    if previous_week:
+        previous_week_end = datetime.datetime.fromisoformat(previous_week['week_end']).date()
+        previous_week_start = previous_week_end - datetime.timedelta(days=6)
+        report += (
+            f"Period: {previous_week_start.strftime('%a, %b %d')} - {previous_week_end.strftime('%a, %b %d')}\n"
+            f"Hours Worked: {format_decimal_hours(previous_week['total_hours'])}\n"
+        )
+    else:
+        report += "No previous week data available.\n"
+
+    report += (
+        f"---------------------------------------\n"
+        f"=======================================\n"
+    )
+    return report
+
+
+CSV_HEADER = ['User', 'Date', 'Clock In', 'Clock Out', 'Duration (HH:MM:SS)', 'Duration (Hours)']
+
+
+def csv_row(user, clock_in, clock_out, duration):
+    """One CSV export row (datetimes and a timedelta)"""
+    return [
+        user,
+        clock_in.strftime('%Y-%m-%d'),
+        clock_in.strftime('%I:%M:%S %p'),
+        clock_out.strftime('%I:%M:%S %p'),
+        format_timedelta(duration),
+        f"{duration.total_seconds() / 3600:.2f}"
+    ]
+
+
+def csv_rows(user, punches):
+    """CSV export rows (no header) for punches, in the order given"""
+    for punch in punches:
+        yield csv_row(user, punch.clock_in_dt, punch.clock_out_dt,
+                      datetime.timedelta(seconds=punch.duration))
+
+
+NOTE_PLACEHOLDER = "Write note here before clock in"
+
+
+def history_row(punch):
+    """History view row: date, clock in, clock out, duration, note"""
+    clock_in = punch.clock_in_dt
+    note = punch.note.strip()
+    return (
+        clock_in.strftime('%Y-%m-%d'),
+        clock_in.strftime('%I:%M:%S %p'),
+        punch.clock_out_dt.strftime('%I:%M:%S %p'),
+        format_timedelta(datetime.timedelta(seconds=punch.duration)),
+        '' if note == NOTE_PLACEHOLDER else note  # Only actual notes, not the placeholder
+    )
+
+
+class HistoryPager:
+    """History view rows a page at a time, newest first
+
+    The punches are copied when the pager is made, so punches added,
+    deleted or reloaded while the view is open cannot shift the pages
+    (repeating or skipping rows); the view shows the history as it was
+    when it opened.
+    """
+
+    def __init__(self, punches, page_size=100):
+        self.punches = list(punches)  # Oldest first, as the punch store keeps them
+        self.page_size = page_size
+        self.shown = 0
+
+    @property
+    def done(self):
+        return self.shown >= len(self.punches)
+
+    def next_page(self):
+        """[(punch id, row)] for the next page"""
+        stop = min(self.shown + self.page_size, len(self.punches))
+        last = len(self.punches) - 1
+        rows = [(self.punches[last - i].id, history_row(self.punches[last - i]))
+                for i in range(self.shown, stop)]
+        self.shown = stop
+        return rows
@@ -0,0 +1,743 @@
+"""
+Storage backends for the time clock apps
+
+StorageBackend is everything the apps need from persistence. JsonStorage
+keeps JSON files, one set per user; SqliteStorage keeps the same data in one
+database indexed on (user, clock_in) and (user, date) so date-range totals
+run as range queries instead of list scans.
+
+Pick the backend with the TIMECLOCK_STORAGE environment variable
+("json" or "sqlite"). The SQLite store imports the JSON files the first
+time it is created.
+"""
+
+import copy
+import datetime
+import json
+import os
+import re
+from contextlib import contextmanager
+
+from .archive import insert_week, unarchived
+from .fileio import FileLock, fsync_batcher, read_json, remove_json, write_json_atomic
+from .journal import HistoryJournal
+from .punches import punch_id
+
+
+def _day(value):
+    """Normalise a date/datetime/ISO string to 'YYYY-MM-DD'"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def _next_day(value):
+    day = datetime.date.fromisoformat(_day(value))
+    return (day + datetime.timedelta(days=1)).isoformat()
+
+
+class StorageBackend:
+    """Interface shared by the JSON and SQLite stores
+
+    Date arguments are inclusive and accept date objects or ISO strings.
+    """
+
+    def load_users(self):
+        raise NotImplementedError
+
+    def save_users(self, users):
+        raise NotImplementedError
+
+    def delete_user(self, user):
+        """Remove a user's session data, history and archive"""
+        raise NotImplementedError
+
+    def load_user_state(self, user):
+        raise NotImplementedError
+
+    def save_user_state(self, user, state):
+        raise NotImplementedError
+
+    def load_history(self, user):
+        raise NotImplementedError
+
+    def append_history(self, user, entry):
+        raise NotImplementedError
+
+    def replace_history(self, user, entries):
+        raise NotImplementedError
+
+    def load_archive(self, user):
+        """Archived weeks, oldest week_end first"""
+        raise NotImplementedError
+
+    def append_archive(self, user, week):
+        """Add a week, keeping the archive in week_end order"""
+        raise NotImplementedError
+
+    def extend_archive(self, user, weeks):
+        """Add several weeks in one write, skipping batches already archived"""
+        for week in unarchived(self.load_archive(user), weeks):
+            self.append_archive(user, week)
+
+    def retire_history(self, user, entries):
+        """Move entries out of the live history into the user's cold store
+
+        Retired punches are no longer returned by load_history, but
+        history_between and history_chunks (exports, payroll) still read them.
+        """
+        raise NotImplementedError
+
+    def load_cold_history(self, user):
+        """Retired punches, oldest first"""
+        raise NotImplementedError
+
+    def update_punches(self, user, entries_by_id):
+        """Replace punches by id ({punch id: entry, or None to delete}), live or retired
+
+        Returns how many stored punches were replaced or deleted.
+        """
+        raise NotImplementedError
+
+    def history_between(self, user, start=None, end=None):
+        """Entries (live and retired) with clock_in between start and end, oldest first"""
+        raise NotImplementedError
+
+    def history_chunks(self, user, start=None, end=None, size=1000):
+        """history_between in lists of at most size entries, oldest first"""
+        entries = self.history_between(user, start, end)
+        for i in range(0, len(entries), size):
+            yield entries[i:i + size]
+
+    def close(self):
+        pass
+
+
+def _merge_keyed(base, ours, theirs, signature=None):
+    """Three-way merge of {key: value} dicts written by two instances
+
+    base is what this instance last loaded or saved (values passed through
+    signature, when given). Keys we added or changed since then win, keys
+    only the other writer added or changed are kept, and keys we removed are
+    dropped unless the other writer changed them meanwhile.
+    """
+    sign = signature or (lambda value: value)
+    merged = dict(theirs)
+    for key, base_value in base.items():
+        if key not in ours and key in merged and sign(merged[key]) == base_value:
+            del merged[key]
+    for key, value in ours.items():
+        if key not in base or base[key] != sign(value):
+            merged[key] = value
+    return merged
+
+
+def _entry_key(user, entry):
+    """Punch id (derived from the clock times for entries saved before ids were unique)"""
+    return punch_id(user, entry)
+
+
+def _update_entries(user, entries, entries_by_id):
+    """(entries with the updates applied, how many matched)"""
+    kept = []
+    changed = 0
+    for entry in entries:
+        key = _entry_key(user, entry)
+        if key not in entries_by_id:
+            kept.append(entry)
+            continue
+        changed += 1
+        if entries_by_id[key] is not None:
+            kept.append(entries_by_id[key])
+    return kept, changed
+
+
+def _entry_signature(entry):
+    return (entry.get('duration_seconds', 0), entry.get('note', ''), entry.get('id'))
+
+
+class JsonStorage(StorageBackend):
+    """JSON files sharded per user, with punches appended to a journal
+
+    timeclock_manifest.json maps each user to their own history, session,
+    archive and cold (rolled over) history files, so one user's punch never
+    reads or rewrites another user's data. The combined files of older
+    versions are split into shards the first time the store is opened.
+
+    Several processes may share one data directory. Every read-modify-write
+    holds timeclock.lock, and a file's version is its identity on disk
+    (inode, size and modification time, which every atomic rewrite or
+    journal append changes); a save made after another process changed the
+    same file is merged with that change instead of overwriting it. Saves
+    never rewrite the manifest, which only changes when users are added or
+    removed.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, data_dir='.'):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, 'timeclock_users.json')
+        self.manifest_file = os.path.join(data_dir, 'timeclock_manifest.json')
+        self.lock = FileLock(os.path.join(data_dir, 'timeclock.lock'))
+
+        # Combined files written by earlier versions (migrated into shards)
+        self.data_file = os.path.join(data_dir, 'timeclock_data.json')
+        self.history_file = os.path.join(data_dir, 'timeclock_history.json')
+        self.weekly_archive_file = os.path.join(data_dir, 'timeclock_weekly_archive.json')
+
+        self._journals = {}  # user -> HistoryJournal for their history shard
+        self._seen = {}      # (user, kind) -> file version this instance last read or wrote
+        self._base = {}      # (user, kind) or 'users' -> contents at that version (for merges)
+
+        with self.lock:
+            self.manifest = self._read(self.manifest_file, None)
+            if self.manifest is None:
+                self.manifest = {'version': self.MANIFEST_VERSION, 'users': {}}
+                self._migrate_combined_files()
+
+    def _read(self, path, default):
+        return read_json(path, default)
+
+    def _write(self, path, data):
+        # Temp file + rename, keeping the previous version as <file>.bak
+        write_json_atomic(path, data)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the data directory lock, with the manifest as other processes left it"""
+        with self.lock:
+            self.manifest = self._read(self.manifest_file, None) or self.manifest
+            yield
+
+    def _migrate_combined_files(self):
+        """Split the shared history/data/archive files into per-user shards"""
+        combined = [self.history_file, self.data_file, self.weekly_archive_file,
+                    HistoryJournal(self.history_file).journal_file]
+        if not any(os.path.exists(path) for path in combined):
+            return
+
+        all_history = HistoryJournal(self.history_file).load_all()
+        all_data = self._read(self.data_file, {})
+        all_archive = self._read(self.weekly_archive_file, {})
+
+        for user in set(all_history) | set(all_data) | set(all_archive):
+            shard = self._shard(user, save_manifest=False)
+            if user in all_history:
+                self._write(shard['history'], {user: all_history[user]})
+            if user in all_data:
+                self._write(shard['data'], {user: all_data[user]})
+            if user in all_archive:
+                self._write(shard['archive'], {user: all_archive[user]})
+        self._write(self.manifest_file, self.manifest)
+
+        # Keep the originals around, but out of the way
+        for path in combined:
+            if os.path.exists(path):
+                os.replace(path, path + '.migrated')
+
+    def _shard(self, user, save_manifest=True):
+        """Paths of a user's shard files, registering the user if needed"""
+        users = self.manifest['users']
+        if user not in users:
+            slug = re.sub(r'[^A-Za-z0-9_-]', '_', user) or 'user'
+            taken = {files['slug'] for files in users.values()}
+            candidate, n = slug, 2
+            while candidate in taken:
+                candidate, n = f'{slug}_{n}', n + 1
+            users[user] = {
+                'slug': candidate,
+                'history': f'timeclock_history_{candidate}.json',
+                'data': f'timeclock_data_{candidate}.json',
+                'archive': f'timeclock_weekly_archive_{candidate}.json',
+                'cold': f'timeclock_history_cold_{candidate}.json',
+            }
+            if save_manifest:
+                self._write(self.manifest_file, self.manifest)
+        return self._paths(users[user])
+
+    def _registered(self, user):
+        """Whether user has shard files (reads never register a user; only writes do)"""
+        return user in self.manifest['users']
+
+    def _paths(self, files):
+        # Manifests written before the cold store have no 'cold' entry
+        names = dict(files)
+        names.setdefault('cold', f"timeclock_history_cold_{files['slug']}.json")
+        return {kind: os.path.join(self.data_dir, names[kind])
+                for kind in ('history', 'data', 'archive', 'cold')}
+
+    def _journal(self, user):
+        if user not in self._journals:
+            self._journals[user] = HistoryJournal(self._shard(user)['history'])
+        return self._journals[user]
+
+    @staticmethod
+    def _identity(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _version(self, user, kind):
+        """Version of one of user's files as any process last left it (no write needed)"""
+        path = self._shard(user)[kind]
+        if kind == 'history':
+            # Appends only grow the journal; rewrites replace the snapshot
+            return (self._identity(path), self._identity(self._journal(user).journal_file))
+        return self._identity(path)
+
+    def _changed_elsewhere(self, user, kind):
+        """Another process wrote this file since this instance last read it"""
+        return self._seen.get((user, kind)) != self._version(user, kind)
+
+    def load_users(self):
+        with self._locked():
+            users = self._read(self.users_file, {})
+            self._base['users'] = copy.deepcopy(users)
+        return users
+
+    def save_users(self, users):
+        with self._locked():
+            # Users added or renamed by another instance are kept
+            theirs = self._read(self.users_file, {})
+            merged = _merge_keyed(self._base.get('users', {}), users, theirs)
+            self._write(self.users_file, merged)
+            self._base['users'] = copy.deepcopy(merged)
+
+    def delete_user(self, user):
+        with self._locked():
+            files = self.manifest['users'].pop(user, None)
+            self._journals.pop(user, None)
+            for kind in ('history', 'data'):
+                self._seen.pop((user, kind), None)
+                self._base.pop((user, kind), None)
+            if files is None:
+                return
+            # Batched syncs hold the journal open (Windows cannot delete an open file)
+            fsync_batcher.flush()
+            for path in self._paths(files).values():
+                remove_json(path)
+                if os.path.exists(HistoryJournal(path).journal_file):
+                    os.remove(HistoryJournal(path).journal_file)
+            self._write(self.manifest_file, self.manifest)
+
+    def load_user_state(self, user):
+        with self._locked():
+            if not self._registered(user):
+                return {}
+            state = self._read(self._shard(user)['data'], {}).get(user, {})
+            self._seen[user, 'data'] = self._version(user, 'data')
+            self._base[user, 'data'] = copy.deepcopy(state)
+        return state
+
+    def save_user_state(self, user, state):
+        with self._locked():
+            path = self._shard(user)['data']
+            if self._changed_elsewhere(user, 'data'):
+                theirs = self._read(path, {}).get(user, {})
+                state = _merge_keyed(self._base.get((user, 'data'), {}), state, theirs)
+            self._write(path, {user: state})
+            self._seen[user, 'data'] = self._version(user, 'data')
+            self._base[user, 'data'] = copy.deepcopy(state)
+
+    def load_history(self, user):
+        with self._locked():
+            if not self._registered(user):
+                return []
+            entries = self._journal(user).load(user)
+            self._seen[user, 'history'] = self._version(user, 'history')
+            self._base[user, 'history'] = {_entry_key(user, e): _entry_signature(e) for e in entries}
+        return entries
+
+    def append_history(self, user, entry):
+        with self._locked():
+            # Appends from different processes never conflict; just track the version
+            old = self._version(user, 'history')
+            self._journal(user).append(user, entry)
+            if self._seen.get((user, 'history')) == old:
+                self._seen[user, 'history'] = self._version(user, 'history')
+            base = self._base.get((user, 'history'))
+            if base is not None:
+                base[_entry_key(user, entry)] = _entry_signature(entry)
+
+    def replace_history(self, user, entries):
+        with self._locked():
+            journal = self._journal(user)
+            if self._changed_elsewhere(user, 'history'):
+                # Keep punches (and edits) other processes made since our load
+                ours = {_entry_key(user, e): e for e in entries}
+                theirs = {_entry_key(user, e): e for e in journal.load(user)}
+                merged = _merge_keyed(self._base.get((user, 'history'), {}),
+                                      ours, theirs, _entry_signature)
+                entries = sorted(merged.values(), key=lambda e: e['clock_in'])
+            journal.rewrite(user, entries)
+            self._seen[user, 'history'] = self._version(user, 'history')
+            self._base[user, 'history'] = {_entry_key(user, e): _entry_signature(e) for e in entries}
+
+    def load_archive(self, user):
+        with self._locked():
+            if not self._registered(user):
+                return []
+            return self._read(self._shard(user)['archive'], {}).get(user, [])
+
+    def append_archive(self, user, week):
+        with self._locked():
+            path = self._shard(user)['archive']
+            try:
+                archive = self._read(path, {}).get(user, [])
+            except ValueError:
+                archive = []
+            # Written in week_end order, so loading never has to sort
+            self._write(path, {user: insert_week(archive, week)})
+
+    def extend_archive(self, user, weeks):
+        with self._locked():
+            path = self._shard(user)['archive']
+            try:
+                archive = self._read(path, {}).get(user, [])
+            except ValueError:
+                archive = []
+            for week in unarchived(archive, weeks):
+                insert_week(archive, week)
+            self._write(path, {user: archive})
+
+    def retire_history(self, user, entries):
+        with self._locked():
+            path = self._shard(user)['cold']
+            cold = self._read(path, {}).get(user, [])
+            # Retried after a crash between the two writes: already in the cold file
+            present = {_entry_key(user, e) for e in cold}
+            retired = {_entry_key(user, e) for e in entries}
+            cold.extend(e for e in entries if _entry_key(user, e) not in present)
+            cold.sort(key=lambda e: e['clock_in'])
+            self._write(path, {user: cold})
+
+            # Punches other processes appended meanwhile stay live
+            journal = self._journal(user)
+            journal.rewrite(user, [e for e in journal.load(user) if _entry_key(user, e) not in retired])
+            self._seen[user, 'history'] = self._version(user, 'history')
+            base = self._base.get((user, 'history'))
+            if base is not None:
+                for key in retired:
+                    base.pop(key, None)
+
+    def load_cold_history(self, user):
+        with self._locked():
+            if not self._registered(user):
+                return []
+            return self._read(self._shard(user)['cold'], {}).get(user, [])
+
+    def update_punches(self, user, entries_by_id):
+        with self._locked():
+            if not self._registered(user):
+                return 0
+            live, changed = _update_entries(user, self.load_history(user), entries_by_id)
+            if changed:
+                self.replace_history(user, live)
+            path = self._shard(user)['cold']
+            cold, cold_changed = _update_entries(
+                user, self._read(path, {}).get(user, []), entries_by_id)
+            if cold_changed:
+                cold.sort(key=lambda e: e['clock_in'])
+                self._write(path, {user: cold})
+        return changed + cold_changed
+
+    def history_between(self, user, start=None, end=None):
+        start = _day(start) if start is not None else None
+        end = _day(end) if end is not None else None
+        with self._locked():
+            if not self._registered(user):
+                return []
+            cold = self._read(self._shard(user)['cold'], {}).get(user, [])
+            live = self._journal(user).load(user)
+        # A crash mid-retire can leave a punch in both; count it once
+        cold_keys = {_entry_key(user, e) for e in cold}
+        all_entries = cold + [e for e in live if _entry_key(user, e) not in cold_keys]
+        entries = [
+            entry for entry in all_entries
+            if (start is None or entry['clock_in'][:10] >= start)
+            and (end is None or entry['clock_in'][:10] <= end)
+        ]
+        entries.sort(key=lambda x: x['clock_in'])
+        return entries
+
+    def close(self):
+        # Sync anything still waiting for the fsync window to close
+        fsync_batcher.flush()
+
+
+class SqliteStorage(StorageBackend):
+    """All stores in one SQLite database with indexed range queries"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            name TEXT PRIMARY KEY,
+            info TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_state (
+            user TEXT PRIMARY KEY,
+            state TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS history (
+            row_id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            clock_in TEXT NOT NULL,
+            clock_out TEXT NOT NULL,
+            duration_seconds REAL NOT NULL,
+            date TEXT NOT NULL,
+            note TEXT NOT NULL DEFAULT '',
+            entry_id INTEGER,
+            punch_id TEXT,
+            cold INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_user_clock_in ON history (user, clock_in);
+        CREATE INDEX IF NOT EXISTS idx_history_user_date ON history (user, date);
+        CREATE TABLE IF NOT EXISTS weekly_archive (
+            row_id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            week_end TEXT NOT NULL,
+            total_hours REAL NOT NULL,
+            entries_count INTEGER NOT NULL,
+            archived_date TEXT NOT NULL,
+            punches_kept INTEGER NOT NULL DEFAULT 0,
+            batch TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_archive_user_week_end ON weekly_archive (user, week_end);
+    """
+
+    def __init__(self, db_file='timeclock.db', import_from=None):
+        import sqlite3
+
+        self.db_file = db_file
+        # WriteBehindStorage writes from its worker thread (one call at a time)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.executescript(self.SCHEMA)
+        # Databases made before punch ids were strings (entry_id would turn
+        # an all-digit id into a number)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(history)")}
+        if 'punch_id' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE history ADD COLUMN punch_id TEXT")
+        # ... and before rolled over punches were kept (cold = 1)
+        if 'cold' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE history ADD COLUMN cold INTEGER NOT NULL DEFAULT 0")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(weekly_archive)")}
+        if 'punches_kept' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE weekly_archive"
+                                  " ADD COLUMN punches_kept INTEGER NOT NULL DEFAULT 0")
+        if 'batch' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE weekly_archive ADD COLUMN batch TEXT")
+
+        if import_from is not None and self._get_meta('json_imported') is None:
+            self.import_from(import_from)
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_from(self, source):
+        """Copy every user's data out of another backend (first start)"""
+        users = source.load_users()
+        with self.conn:
+            self.conn.execute("DELETE FROM users")
+            for name, info in users.items():
+                self.conn.execute("INSERT INTO users (name, info) VALUES (?, ?)",
+                                  (name, json.dumps(info)))
+            for name in users:
+                state = source.load_user_state(name)
+                if state:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO user_state (user, state) VALUES (?, ?)",
+                        (name, json.dumps(state)))
+                self._insert_history(name, source.load_history(name))
+                self._insert_history(name, source.load_cold_history(name), cold=True)
+                for week in source.load_archive(name):
+                    self._insert_archive(name, week)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              ('json_imported', datetime.datetime.now().isoformat()))
+
+    def load_users(self):
+        rows = self.conn.execute("SELECT name, info FROM users ORDER BY rowid")
+        return {name: json.loads(info) for name, info in rows}
+
+    def save_users(self, users):
+        with self.conn:
+            self.conn.execute("DELETE FROM users")
+            self.conn.executemany("INSERT INTO users (name, info) VALUES (?, ?)",
+                                  [(name, json.dumps(info)) for name, info in users.items()])
+
+    def delete_user(self, user):
+        with self.conn:
+            for table in ('user_state', 'history', 'weekly_archive'):
+                self.conn.execute(f"DELETE FROM {table} WHERE user = ?", (user,))
+
+    def load_user_state(self, user):
+        row = self.conn.execute("SELECT state FROM user_state WHERE user = ?",
+                                (user,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_user_state(self, user, state):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO user_state (user, state) VALUES (?, ?)",
+                              (user, json.dumps(state)))
+
+    def _insert_history(self, user, entries, cold=False):
+        self.conn.executemany(
+            "INSERT INTO history (user, clock_in, clock_out, duration_seconds, date, note,"
+            " entry_id, punch_id, cold) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(user, e['clock_in'], e['clock_out'], e.get('duration_seconds', 0),
+              e.get('date') or e['clock_in'][:10], e.get('note', ''),
+              None if isinstance(e.get('id'), str) else e.get('id'),
+              e['id'] if isinstance(e.get('id'), str) else None, int(cold))
+             for e in entries])
+
+    def _history_rows(self, where, params):
+        rows = self.conn.execute(
+            "SELECT clock_in, clock_out, duration_seconds, date, note,"
+            " COALESCE(punch_id, entry_id) FROM history"
+            f" WHERE {where} ORDER BY clock_in, row_id", params)
+        return [{'clock_in': clock_in, 'clock_out': clock_out,
+                 'duration_seconds': duration, 'date': date, 'note': note, 'id': entry_id}
+                for clock_in, clock_out, duration, date, note, entry_id in rows]
+
+    def load_history(self, user):
+        return self._history_rows("user = ? AND cold = 0", (user,))
+
+    def append_history(self, user, entry):
+        with self.conn:
+            self._insert_history(user, [entry])
+
+    def replace_history(self, user, entries):
+        with self.conn:
+            self.conn.execute("DELETE FROM history WHERE user = ? AND cold = 0", (user,))
+            self._insert_history(user, entries)
+
+    def retire_history(self, user, entries):
+        # Match on punch id; only legacy (int id) entries fall back to clock times
+        keyed = [e for e in entries if isinstance(e.get('id'), str)]
+        legacy = [e for e in entries if not isinstance(e.get('id'), str)]
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE history SET cold = 1 WHERE user = ? AND cold = 0 AND punch_id = ?",
+                [(user, e['id']) for e in keyed])
+            self.conn.executemany(
+                "UPDATE history SET cold = 1"
+                " WHERE user = ? AND cold = 0 AND punch_id IS NULL AND clock_in = ? AND clock_out = ?",
+                [(user, e['clock_in'], e['clock_out']) for e in legacy])
+
+    def load_cold_history(self, user):
+        return self._history_rows("user = ? AND cold = 1", (user,))
+
+    def update_punches(self, user, entries_by_id):
+        rows = self.conn.execute(
+            "SELECT row_id, clock_in, clock_out, COALESCE(punch_id, entry_id), cold FROM history"
+            " WHERE user = ?", (user,)).fetchall()
+        changed = 0
+        with self.conn:
+            for row_id, clock_in, clock_out, entry_id, cold in rows:
+                key = punch_id(user, {'clock_in': clock_in, 'clock_out': clock_out, 'id': entry_id})
+                if key not in entries_by_id:
+                    continue
+                changed += 1
+                self.conn.execute("DELETE FROM history WHERE row_id = ?", (row_id,))
+                if entries_by_id[key] is not None:
+                    # A retired punch stays in the cold store
+                    self._insert_history(user, [entries_by_id[key]], cold=bool(cold))
+        return changed
+
+    def _insert_archive(self, user, week):
+        self.conn.execute(
+            "INSERT INTO weekly_archive (user, week_end, total_hours, entries_count, archived_date,"
+            " punches_kept, batch) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user, week['week_end'], week['total_hours'], week['entries_count'],
+             week['archived_date'], int(week.get('punches_kept', False)), week.get('batch')))
+
+    def load_archive(self, user):
+        rows = self.conn.execute(
+            "SELECT week_end, total_hours, entries_count, archived_date, punches_kept, batch"
+            " FROM weekly_archive WHERE user = ? ORDER BY week_end, row_id", (user,))
+        weeks = []
+        for week_end, total_hours, entries_count, archived_date, punches_kept, batch in rows:
+            week = {'week_end': week_end, 'total_hours': total_hours,
+                    'entries_count': entries_count, 'archived_date': archived_date}
+            if punches_kept:
+                week['punches_kept'] = True
+            if batch is not None:
+                week['batch'] = batch
+            weeks.append(week)
+        return weeks
+
+    def append_archive(self, user, week):
+        with self.conn:
+            self._insert_archive(user, week)
+
+    def extend_archive(self, user, weeks):
+        with self.conn:
+            for week in weeks:
+                if week.get('batch') is not None and self.conn.execute(
+                        "SELECT 1 FROM weekly_archive WHERE user = ? AND batch = ?",
+                        (user, week['batch'])).fetchone():
+                    continue
+                self._insert_archive(user, week)
+
+    def _range_where(self, user, start, end):
+        # clock_in is an ISO string, so day bounds compare lexically
+        where, params = "user = ?", [user]
+        if start is not None:
+            where += " AND clock_in >= ?"
+            params.append(_day(start))
+        if end is not None:
+            where += " AND clock_in < ?"
+            params.append(_next_day(end))
+        return where, params
+
+    def history_between(self, user, start=None, end=None):
+        return self._history_rows(*self._range_where(user, start, end))
+
+    def history_chunks(self, user, start=None, end=None, size=1000):
+        # Keyset pages on (clock_in, row_id): each page is one index range read
+        # and only one page is in memory at a time
+        where, params = self._range_where(user, start, end)
+        last_clock_in, last_row = '', 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT clock_in, clock_out, duration_seconds, date, note,"
+                " COALESCE(punch_id, entry_id), row_id"
+                f" FROM history WHERE {where}"
+                " AND (clock_in > ? OR (clock_in = ? AND row_id > ?))"
+                " ORDER BY clock_in, row_id LIMIT ?",
+                params + [last_clock_in, last_clock_in, last_row, size]).fetchall()
+            if not rows:
+                return
+            last_clock_in, last_row = rows[-1][0], rows[-1][6]
+            yield [{'clock_in': clock_in, 'clock_out': clock_out,
+                    'duration_seconds': duration, 'date': date, 'note': note, 'id': entry_id}
+                   for clock_in, clock_out, duration, date, note, entry_id, _ in rows]
+            if len(rows) < size:
+                return
+
+    def close(self):
+        self.conn.close()
+
+
+def open_storage(kind=None, data_dir='.'):
+    """Open the configured storage backend (TIMECLOCK_STORAGE=json|sqlite)"""
+    kind = kind or os.environ.get('TIMECLOCK_STORAGE', 'json')
+    if kind == 'json':
+        return JsonStorage(data_dir)
+    if kind == 'sqlite':
+        storage = SqliteStorage(os.path.join(data_dir, 'timeclock.db'))
+        # The JSON store (and its shard migration) is only opened for the one-time import
+        if storage._get_meta('json_imported') is None:
+            storage.import_from(JsonStorage(data_dir))
+        return storage
+    raise ValueError(f"Unknown storage backend: {kind}")
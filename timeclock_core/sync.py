@@ -0,0 +1,385 @@
+"""
+Incremental punch sync between devices (phone app <-> office PC)
+
+Every punch added or edited on a device is appended to that device's
+change log (timeclock_sync.log, one JSON line per change). A position in
+the log is its byte offset, so "changes since X" is one seek and a read
+of only what was appended after X. Once every known peer has
+acknowledged a stretch of the log it is cut off (compact()); positions
+keep counting from where the log started, so watermarks stay valid. A
+device first synced after that starts from a copy of the data files.
+
+Each device keeps, per peer, how far into the peer's log it has received
+and how far into its own log the peer has acknowledged. A packet carries
+the changes the addressed peer has not acknowledged plus the sender's own
+acknowledgements, so after one exchange each side only ever sends what is
+new. Changes (adds, note edits and deletes) are keyed by punch id and
+stamped with when they were made;
+applying one that is already known (or older than the local version) is
+a no-op, so packets can be re-sent or relayed through a third device.
+
+Transports: sync_folder() drops and picks up packet files in a shared
+folder (USB stick, synced directory); serve_once()/sync_socket() run one
+exchange over a local TCP connection, which must be authenticated with a
+shared secret unless it stays on the loopback interface. sync_timeclock.py
+is the command line front end; the apps keep a change log and sync
+through TIMECLOCK_SYNC_DIR only when it is set.
+"""
+
+import datetime
+import hashlib
+import hmac
+import json
+import os
+
+from .fileio import FileLock, read_json, write_json_atomic
+from .punches import punch_id
+
+LOG_FILE = 'timeclock_sync.log'
+STATE_FILE = 'timeclock_sync.json'
+PACKET_SUFFIX = '.tcsync'
+PACKET_FORMAT = 1
+DEFAULT_PORT = 8765
+SYNC_DIR_VAR = 'TIMECLOCK_SYNC_DIR'
+SECRET_VAR = 'TIMECLOCK_SYNC_SECRET'
+
+
+def changes_from_env(data_dir='.', environ=None):
+    """A ChangeLog if sync is set up, else None (punches are not logged)
+
+    Sync is set up by TIMECLOCK_SYNC_DIR, or by this device having synced
+    before (sync_timeclock.py leaves its state file behind).
+    """
+    configured = (os.environ if environ is None else environ).get(SYNC_DIR_VAR, '').strip()
+    if not configured and not os.path.exists(os.path.join(data_dir, STATE_FILE)):
+        return None
+    return ChangeLog(data_dir)
+
+
+class ChangeLog:
+    """This device's change log, peer id and per-peer watermarks"""
+
+    def __init__(self, data_dir='.'):
+        self.log_file = os.path.join(data_dir, LOG_FILE)
+        self.state_file = os.path.join(data_dir, STATE_FILE)
+        self.lock = FileLock(os.path.join(data_dir, 'timeclock_sync.lock'))
+        with self.lock:
+            self.state = read_json(self.state_file, None)
+            if self.state is None:
+                self.state = {'peer_id': os.urandom(8).hex(), 'received': {}, 'acked': {}}
+                write_json_atomic(self.state_file, self.state)
+        # Punch id -> (modified, origin) of its latest logged change. Deletes
+        # cut off by compact() are kept, so an older copy is not re-added
+        self._known = {pid: tuple(version)
+                       for pid, version in self.state.get('tombstones', {}).items()}
+        self._known_offset = 0   # Log offset _known is up to date with
+
+    @property
+    def peer_id(self):
+        return self.state['peer_id']
+
+    def _save_state(self):
+        write_json_atomic(self.state_file, self.state)
+
+    @property
+    def log_start(self):
+        """Offset of the first change still in the log file"""
+        return self.state.get('log_start', 0)
+
+    # ---- the log ----
+
+    def record(self, user, entry, modified=None, origin=None, deleted=False):
+        """Log a punch added, edited or deleted here (or applied from origin); returns the change"""
+        change = {
+            'user': user,
+            'entry': dict(entry, id=punch_id(user, entry)),
+            'modified': modified or datetime.datetime.now().isoformat(),
+            'origin': origin or self.peer_id,
+        }
+        if deleted:
+            change['deleted'] = True
+        line = json.dumps(change, separators=(',', ':')) + '\n'
+        with self.lock:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return change
+
+    def read_since(self, offset):
+        """(changes logged after offset, offset of the end of the log)"""
+        # Changes before log_start were compacted away; every peer has them
+        offset = max(offset, self.log_start)
+        try:
+            with open(self.log_file, 'rb') as f:
+                f.seek(offset - self.log_start)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        # A line still being written has no newline yet; leave it for next time
+        complete = data[:data.rfind(b'\n') + 1]
+        changes = [json.loads(line) for line in complete.splitlines() if line.strip()]
+        return changes, offset + len(complete)
+
+    def compact(self):
+        """Cut off the changes every known peer has acknowledged; returns bytes removed"""
+        with self.lock:
+            acked = self.state['acked']
+            upto = min(acked.values(), default=0)
+            if upto <= self.log_start:
+                return 0
+            self.known()  # Remember their versions before they are gone
+            try:
+                with open(self.log_file, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return 0
+            cut = upto - self.log_start
+            tombstones = self.state.setdefault('tombstones', {})
+            for line in data[:cut].splitlines():
+                change = json.loads(line)
+                if change.get('deleted'):
+                    tombstones[change['entry']['id']] = list(self._known[change['entry']['id']])
+            part_path = self.log_file + '.part'
+            with open(part_path, 'wb') as f:
+                f.write(data[cut:])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(part_path, self.log_file)
+            self.state['log_start'] = upto
+            self._save_state()
+        return cut
+
+    def known(self):
+        """{punch id: (modified, origin)} of every logged change (read incrementally)"""
+        changes, self._known_offset = self.read_since(self._known_offset)
+        for change in changes:
+            self._remember(change)
+        return self._known
+
+    def _remember(self, change):
+        version = (change['modified'], change['origin'])
+        pid = change['entry']['id']
+        if pid not in self._known or self._known[pid] < version:
+            self._known[pid] = version
+
+    # ---- packets ----
+
+    def packet(self, peer=None):
+        """Changes peer has not acknowledged (peer None: every known peer, for a shared folder)"""
+        acked = self.state['acked']
+        start = acked.get(peer, 0) if peer else min(acked.values(), default=0)
+        changes, end = self.read_since(start)
+        if peer:
+            changes = [change for change in changes if change['origin'] != peer]
+        return {
+            'format': PACKET_FORMAT,
+            'from': self.peer_id,
+            'start': start,
+            'end': end,
+            'acks': dict(self.state['received']),
+            'changes': changes,
+        }
+
+    def apply_packet(self, storage, packet):
+        """Apply a peer's packet to storage and update watermarks; returns changes applied"""
+        peer = packet.get('from')
+        if packet.get('format') != PACKET_FORMAT or not peer or peer == self.peer_id:
+            return 0
+        applied = self.apply_changes(storage, packet['changes'])
+
+        received = self.state['received'].get(peer, 0)
+        # Only advance if nothing between our watermark and the packet is missing
+        if packet['start'] <= received:
+            self.state['received'][peer] = max(received, packet['end'])
+        self.acknowledged(peer, packet['acks'])
+        return applied
+
+    def acknowledged(self, peer, acks):
+        """Record how far into our log peer has received (from its acks) and compact it"""
+        self.state['acked'][peer] = acks.get(self.peer_id, 0)
+        with self.lock:
+            self._save_state()
+        self.compact()
+
+    def apply_changes(self, storage, changes):
+        """Add new punches, apply newer edits and deletes; returns how many changed storage"""
+        known = self.known()
+        added = {}    # user -> {punch id: entry}
+        edited = {}   # user -> {punch id: entry, or None to delete}
+        for change in changes:
+            pid = change['entry']['id']
+            user = change['user']
+            version = (change['modified'], change['origin'])
+            if pid in known and known[pid] >= version:
+                continue  # Already have this version (or a newer one)
+            entry = None if change.get('deleted') else change['entry']
+            if pid in added.get(user, {}):
+                added[user][pid] = entry  # Added and changed again in this batch
+            elif pid in known:
+                edited.setdefault(user, {})[pid] = entry
+            else:
+                added.setdefault(user, {})[pid] = entry
+            # Logged with its origin and time, so it can be relayed to other peers
+            self._remember(self.record(user, change['entry'], change['modified'],
+                                       change['origin'], change.get('deleted', False)))
+
+        added = {user: [entry for entry in entries.values() if entry is not None]
+                 for user, entries in added.items()}
+        added = {user: entries for user, entries in added.items() if entries}
+        if not added and not edited:
+            return 0
+        users = storage.load_users()
+        new_users = [user for user in set(added) | set(edited) if user not in users]
+        for user in new_users:
+            users[user] = {'created': datetime.datetime.now().isoformat(), 'total_hours': 0}
+        if new_users:
+            storage.save_users(users)
+
+        count = 0
+        changed_users = set()
+        for user, entries in added.items():
+            # Files copied between devices before syncing may already hold the punch
+            days = [entry['clock_in'][:10] for entry in entries]
+            present = {punch_id(user, entry)
+                       for entry in storage.history_between(user, min(days), max(days))}
+            for entry in entries:
+                if entry['id'] not in present:
+                    storage.append_history(user, entry)
+                    present.add(entry['id'])
+                    changed_users.add(user)
+                    count += 1
+        for user, entries_by_id in edited.items():
+            # Punches already rolled over are edited in the cold store
+            changed = storage.update_punches(user, entries_by_id)
+            if changed:
+                changed_users.add(user)
+                count += changed
+        for user in changed_users:
+            _drop_cached_totals(storage, user)
+        return count
+
+
+def _drop_cached_totals(storage, user):
+    """Forget the today/week totals saved with a user's state (recomputed on next load)"""
+    state = storage.load_user_state(user)
+    if state.get('totals'):
+        del state['totals']
+        storage.save_user_state(user, state)
+
+
+# ---- transports ----
+
+def _packet_path(folder, peer_id):
+    return os.path.join(folder, f"timeclock_{peer_id}{PACKET_SUFFIX}")
+
+
+def sync_folder(log, storage, folder):
+    """Apply every other device's packet in folder, then write ours; returns changes applied"""
+    own = _packet_path(folder, log.peer_id)
+    applied = 0
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not name.endswith(PACKET_SUFFIX) or path == own:
+            continue
+        packet = read_json(path, None)
+        if packet:
+            applied += log.apply_packet(storage, packet)
+    write_json_atomic(own, log.packet(), backup=False)
+    return applied
+
+
+def _send(f, message):
+    f.write(json.dumps(message, separators=(',', ':')) + '\n')
+    f.flush()
+
+
+def _receive(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError('peer closed the connection')
+    return json.loads(line)
+
+
+def _exchange(log, storage, f, peer, first):
+    """Send our packet for peer and apply theirs, in the given order"""
+    if first:
+        _send(f, log.packet(peer))
+        applied = log.apply_packet(storage, _receive(f))
+        # Their packet went second; acknowledge it so they need not resend it
+        _send(f, {'acks': log.state['received']})
+    else:
+        applied = log.apply_packet(storage, _receive(f))
+        _send(f, log.packet(peer))
+        log.acknowledged(peer, _receive(f)['acks'])
+    return applied
+
+
+def is_loopback(host):
+    """Whether host only accepts connections from this machine"""
+    import ipaddress
+
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _proof(secret, nonce):
+    """HMAC of the other side's nonce: shows we know the secret without sending it"""
+    return hmac.new(secret.encode('utf-8'), str(nonce).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _check_proof(message, secret, nonce):
+    if not hmac.compare_digest(str(message.get('proof', '')), _proof(secret, nonce)):
+        raise PermissionError('peer did not prove it knows the shared secret')
+
+
+def serve_once(log, storage, host='127.0.0.1', port=DEFAULT_PORT, timeout=60, ready=None,
+               secret=None):
+    """Wait for one peer to connect and sync with it; returns changes applied here
+
+    Anything that connects can add and delete punches, so listening on a
+    non-loopback host requires a shared secret, which both sides prove they
+    know before any change is exchanged. ready(port), if given, is called
+    once the socket is listening.
+    """
+    import socket
+
+    if not secret and not is_loopback(host):
+        raise ValueError(f"A shared secret is required to listen on {host}")
+    with socket.create_server((host, port)) as server:
+        server.settimeout(timeout)
+        if ready:
+            ready(server.getsockname()[1])
+        conn, _ = server.accept()
+        with conn, conn.makefile('rw', encoding='utf-8') as f:
+            conn.settimeout(timeout)
+            hello = _receive(f)
+            peer = hello['hello']
+            reply = {'hello': log.peer_id}
+            if secret:
+                nonce = os.urandom(16).hex()
+                reply.update(nonce=nonce, proof=_proof(secret, hello.get('nonce', '')))
+            _send(f, reply)
+            proof = _receive(f)  # Always sent, so a client without the secret cannot stall us
+            if secret:
+                _check_proof(proof, secret, nonce)
+            # Server sends first; the client's reply acknowledges it
+            return _exchange(log, storage, f, peer, first=True)
+
+
+def sync_socket(log, storage, host='127.0.0.1', port=DEFAULT_PORT, timeout=60, secret=None):
+    """Connect to a peer running serve_once and sync with it; returns changes applied here"""
+    import socket
+
+    with socket.create_connection((host, port), timeout=timeout) as conn, \
+            conn.makefile('rw', encoding='utf-8') as f:
+        nonce = os.urandom(16).hex()
+        _send(f, {'hello': log.peer_id, 'nonce': nonce})
+        reply = _receive(f)
+        peer = reply['hello']
+        if secret:
+            _check_proof(reply, secret, nonce)
+        _send(f, {'proof': _proof(secret, reply.get('nonce', '')) if secret else ''})
+        return _exchange(log, storage, f, peer, first=False)
@@ -0,0 +1,186 @@
+"""
+Incremental day/week totals for the time clock display
+
+DayIndex keeps seconds worked per day in a Fenwick tree, so any date-range
+total is a logarithmic lookup and a back-dated missed punch is a cheap
+update. RunningTotals sits on top of it for one user and caches the today
+and this-week sums, so the once-a-second display refresh does a couple of
+lookups instead of parsing every history entry.
+"""
+
+import datetime
+from array import array
+
+from .punches import day_number
+
+
+class DayIndex:
+    """Seconds worked per day (day numbers) with Fenwick-tree range sums"""
+
+    GROWTH = 64  # Spare days added whenever the covered range grows
+
+    def __init__(self, punches=()):
+        self._first = None        # Day number held in slot 0
+        self._values = array('d')  # Seconds per day
+        self._tree = array('d')    # Fenwick tree over _values (1-based, slot 0 unused)
+        by_day = {}
+        for punch in punches:
+            by_day[punch.day] = by_day.get(punch.day, 0.0) + punch.duration
+        if by_day:
+            self._resize(min(by_day), max(by_day))
+            for day, seconds in by_day.items():
+                self._values[day - self._first] += seconds
+            self._build_tree()
+
+    def _resize(self, first, last):
+        """Cover days first..last (plus spare room), keeping existing values"""
+        if self._first is not None:
+            first = min(first, self._first)
+            last = max(last, self._first + len(self._values) - 1)
+            first -= self.GROWTH if first < self._first else 0
+        last += self.GROWTH
+        values = array('d', [0.0]) * (last - first + 1)
+        if self._first is not None:
+            offset = self._first - first
+            values[offset:offset + len(self._values)] = self._values
+        self._first = first
+        self._values = values
+
+    def _build_tree(self):
+        """O(n) Fenwick construction from the per-day values"""
+        size = len(self._values)
+        tree = array('d', [0.0]) * (size + 1)
+        tree[1:] = self._values
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, day, seconds):
+        """Add seconds to a day (negative to remove)"""
+        if self._first is None or not 0 <= day - self._first < len(self._values):
+            self._resize(day, day)
+            self._values[day - self._first] += seconds
+            self._build_tree()
+            return
+        self._values[day - self._first] += seconds
+        i = day - self._first + 1
+        size = len(self._values)
+        while i <= size:
+            self._tree[i] += seconds
+            i += i & -i
+
+    def _prefix(self, day):
+        """Seconds worked on all days up to and including day"""
+        if self._first is None or day < self._first:
+            return 0.0
+        i = min(day - self._first + 1, len(self._values))
+        total = 0.0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def range_seconds(self, start=None, end=None):
+        """Seconds worked on days start..end (inclusive, None = open ended)"""
+        if self._first is None:
+            return 0.0
+        end_total = self._prefix(end) if end is not None else self._prefix(
+            self._first + len(self._values) - 1)
+        start_total = self._prefix(start - 1) if start is not None else 0.0
+        return end_total - start_total
+
+    def day_seconds(self, day):
+        """Seconds worked on one day"""
+        if self._first is None or not 0 <= day - self._first < len(self._values):
+            return 0.0
+        return self._values[day - self._first]
+
+
+class RunningTotals:
+    """Per-user day index, with cached today/week sums"""
+
+    def __init__(self, punches=()):
+        self._anchor = None   # Date the cached sums were computed for
+        self._today = 0.0
+        self._week = 0.0
+        self.rebuild(punches)
+
+    def rebuild(self, punches):
+        """Recount every bucket (load, reset)"""
+        self.index = DayIndex(punches)
+        self._anchor = None
+
+    def _adjust(self, punch, sign):
+        day = punch.day
+        seconds = sign * punch.duration
+        self.index.add(day, seconds)
+
+        # Keep the cached sums in step instead of recomputing them
+        if self._anchor is not None:
+            anchor = day_number(self._anchor)
+            if day == anchor:
+                self._today += seconds
+            if anchor - self._anchor.weekday() <= day <= anchor:
+                self._week += seconds
+
+    def add(self, punch):
+        """Count a new punch (clock out, missed punch)"""
+        self._adjust(punch, 1)
+
+    def remove(self, punch):
+        """Stop counting a punch"""
+        self._adjust(punch, -1)
+
+    def _refresh(self, today):
+        if self._anchor == today:
+            return
+        # New day (or first call): two index lookups
+        self._anchor = today
+        anchor = day_number(today)
+        self._today = self.index.day_seconds(anchor)
+        self._week = self.index.range_seconds(anchor - today.weekday(), anchor)
+
+    def day_seconds(self, day):
+        """Seconds worked on one day"""
+        return self.index.day_seconds(day_number(day))
+
+    def range_seconds(self, start=None, end=None):
+        """Seconds worked between two dates (inclusive, None = open ended)"""
+        return self.index.range_seconds(
+            day_number(start) if start is not None else None,
+            day_number(end) if end is not None else None)
+
+    def today_seconds(self, today=None):
+        """Seconds worked today (finished sessions only)"""
+        self._refresh(today or datetime.date.today())
+        return self._today
+
+    def week_seconds(self, today=None):
+        """Seconds worked from Monday through today (finished sessions only)"""
+        self._refresh(today or datetime.date.today())
+        return self._week
+
+
+class CumulativeColumn:
+    """Running sum down a list, filled in only as far as rows are displayed
+
+    Used by recycled list views: the total for row i is computed the first
+    time row i (or a row below it) scrolls into view.
+    """
+
+    def __init__(self, count, value):
+        self.count = count    # Number of rows
+        self.value = value    # Callable: row index -> seconds for that row
+        self._sums = array('d')
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        sums = self._sums
+        running = sums[-1] if sums else 0.0
+        for i in range(len(sums), index + 1):
+            running += self.value(i)
+            sums.append(running)
+        return sums[index]
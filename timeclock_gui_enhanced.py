@@ -1,16 +1,21 @@
 # Import required libraries
 
 import tkinter as tk # tkinter - for creating the GUI
-from tkinter import ttk, messagebox, filedialog, simpledialog # Create GUI components
+from tkinter import ttk, messagebox # Create GUI components (file/text dialogs are imported when first opened)
 import datetime # datetime - for handling dates and times
-import json # json - for storing data in JSON format
-import os # os - for file operations
 from threading import Thread # Thread - for running background tasks
 import time # time - for time-related functions
-import csv # csv - for exporting data to CSV files
-from collections import defaultdict # defaultdict - for creating dictionaries with default values
+from timeclock_core import TimeClockEngine # TimeClockEngine - users, punches, totals, reports
+from timeclock_core import WriteBehindStorage, open_storage # Storage backend, saved on a background thread
+from timeclock_core import format_timedelta # HH:MM:SS display format
+from timeclock_core.reports import HistoryPager # History view rows, a page at a time
+from timeclock_core.profiling import instrument # Call timings with TIMECLOCK_PROFILE set
+from timeclock_core.sync import changes_from_env # Punch changes for syncing with other devices
 
 class TimeClockGUI: # Main application class
+    HISTORY_PAGE_SIZE = 100  # Rows inserted into the history view per scroll step
+    ROLLOVER_CHECK_MS = 60000  # How often to look for a closed week to archive
+
     def __init__(self, root):
         # Initialize the main window
         self.root = root
@@ -19,31 +24,31 @@ class TimeClockGUI: # Main application class
         self.root.resizable(True, True)  # Allow window resizing
         self.root.minsize(400, 500)  # Smaller minimum size to allow more flexible resizing
 
-        # Define paths for data storage files
-        self.data_file = 'timeclock_data.json'        # Stores current session data
-        self.history_file = 'timeclock_history.json'  # Stores all time entries
-        self.users_file = 'timeclock_users.json'      # Stores user information
+        # Users, clock status, punches and totals (shared with the Kivy app).
+        # Storage is JSON or SQLite (TIMECLOCK_STORAGE=json|sqlite); saves return immediately
+        # Closed weeks are archived when a user is selected and when a new week starts
+        # Punches and note edits are logged for syncing with the phones (TIMECLOCK_SYNC_DIR)
+        self.engine = TimeClockEngine(WriteBehindStorage(open_storage()), auto_rollover=True,
+                                      lazy=True, # Cached totals first, history read in the background
+                                      changes=changes_from_env())
+        instrument(self.engine)
 
-        # Initialize application state variables
-        self.current_user = None              # Currently active user can set default user here
-        self.current_status = None            # Current clock status (in/out)
-        self.clock_in_time = None            # Time when user clocked in
-        self.clock_in_note = None            # Note added during clock in
-        self.total_time_today = datetime.timedelta()  # Total time for today
-        self.history = []                    # List of all time entries
-        self.users = {}                      # Dictionary of all users
+        # Hidden: call timings window (only with TIMECLOCK_PROFILE set)
+        self.root.bind("<Control-Shift-D>", lambda event: self.show_diagnostics())
 
         # Load existing data from files
-        self.load_users()      # Load user information
-        self.load_history()    # Load time entry history
+        self.engine.load_users()      # Load user information
 
         # Set up the visual appearance
         self.setup_styles()
 
+        # Check for a new week once a minute
+        self.root.after(self.ROLLOVER_CHECK_MS, self.check_rollover)
+
         # Start the application
         # If no users exist, create first user
         # Otherwise, show user selection screen
-        if not self.users:
+        if not self.engine.users:
             self.create_first_user()
         else:
             self.show_user_selection()
@@ -94,18 +99,15 @@ class TimeClockGUI: # Main application class
 
     def create_first_user(self):
         """Create the first user when the application is run for the first time"""
+        from tkinter import simpledialog
+
         # Show dialog to get username
         username = simpledialog.askstring("Create User", "Enter your name:")
         
-        if username:
+        if username and username.strip():
             # Create new user record with timestamp
-            self.users[username] = {
-                'created': datetime.datetime.now().isoformat(),
-                'total_hours': 0
-            }
-            self.save_users()              # Save to file
-            self.current_user = username   # Set as current user
-            self.load_user_data()          # Load any existing data
+            username = self.engine.add_user(username)
+            self.select_user(username)     # Load any existing data
             self.create_widgets()          # Create main interface
         else:
             # Exit if no username provided
@@ -149,31 +151,27 @@ class TimeClockGUI: # Main application class
         listbox = tk.Listbox(selection_window, font=("Arial", 12), height=8)
         listbox.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
 
-        for username in self.users.keys():
+        for username in self.engine.users.keys():
             listbox.insert(tk.END, username)
 
         def select_user():
             selection = listbox.curselection()
             if selection:
-                self.current_user = listbox.get(selection[0])
-                self.load_user_data()
+                self.select_user(listbox.get(selection[0]))
                 selection_window.destroy()
                 self.create_widgets()
             else:
                 self.show_message("Warning", "Please select a user!", "warning")
 
         def new_user():
+            from tkinter import simpledialog
+
             username = simpledialog.askstring("New User", "Enter new username:")
-            if username:
-                if username in self.users:
-                    self.show_message("Error", "User already exists!", "error")
-                else:
-                    self.users[username] = {
-                        'created': datetime.datetime.now().isoformat(),
-                        'total_hours': 0
-                    }
-                    self.save_users()
-                    listbox.insert(tk.END, username)
+            if username and username.strip():
+                try:
+                    listbox.insert(tk.END, self.engine.add_user(username))
+                except ValueError as e:
+                    self.show_message("Error", str(e), "error")
 
         btn_frame = tk.Frame(selection_window)
         btn_frame.pack(pady=10)
@@ -186,115 +184,18 @@ class TimeClockGUI: # Main application class
                  bg="#27ae60", fg="white", font=("Arial", 10, "bold"),
                  padx=20, pady=5).pack(side=tk.LEFT, padx=5)
 
-    def load_users(self):
-        """Load users from file"""
-        if os.path.exists(self.users_file):
-            try:
-                with open(self.users_file, 'r') as f:
-                    self.users = json.load(f)
-            except Exception:
-                self.users = {}
-
-    def save_users(self):
-        """Save users to file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
-
-    def load_user_data(self):
-        """Load current user's data"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    user_data = data.get(self.current_user, {})
-
-                    if user_data.get('status') == 'clocked_in':
-                        self.current_status = 'clocked_in'
-                        self.clock_in_time = datetime.datetime.fromisoformat(
-                            user_data['clock_in_time'])
-                        self.clock_in_note = user_data.get('clock_in_note')
-                    else:
-                        self.current_status = 'clocked_out'
-                        self.clock_in_note = None
-
-                    if 'total_time_seconds' in user_data:
-                        self.total_time_today = datetime.timedelta(
-                            seconds=user_data['total_time_seconds'])
-            except Exception:
-                self.current_status = 'clocked_out'
-        else:
-            self.current_status = 'clocked_out'
-
-    def save_user_data(self):
-        """Save current user's data"""
-        all_data = {}
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    all_data = json.load(f)
-            except Exception:
-                pass
-
-        user_data = {
-            'status': self.current_status,
-            'total_time_seconds': self.total_time_today.total_seconds()
-        }
-        if self.current_status == 'clocked_in':
-            user_data['clock_in_time'] = self.clock_in_time.isoformat()
-            if self.clock_in_note:
-                user_data['clock_in_note'] = self.clock_in_note
-
-        all_data[self.current_user] = user_data
-
-        with open(self.data_file, 'w') as f:
-            json.dump(all_data, f, indent=2)
-
-    def load_history(self):
-        """Load history from file"""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    all_history = json.load(f)
-                    self.history = all_history.get(self.current_user, []) if self.current_user else []
-            except Exception:
-                self.history = []
-        else:
-            self.history = []
-
-    def save_history(self):
-        """Save history to file"""
-        all_history = {}
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    all_history = json.load(f)
-            except Exception:
-                pass
-
-        all_history[self.current_user] = self.history
-
-        with open(self.history_file, 'w') as f:
-            json.dump(all_history, f, indent=2)
+    def select_user(self, username):
+        """Make username the current user and load their data"""
+        try:
+            self.engine.select_user(username)
+        except Exception as e:
+            # Damaged files are restored from backup by storage; this means both failed
+            messagebox.showerror("Error", f"Could not load history: {e}")
+        # Sync on the prefetch thread, before the history read, so selecting stays instant
+        self.engine.prefetch(on_error=lambda e: self.root.after(
+            0, lambda: messagebox.showerror("Error", f"Could not load history: {e}")),
+            before=self.sync_in_background)
 
-    def add_history_entry(self, clock_in, clock_out, duration, note=""):
-        """Add entry to history with optional note"""
-        # Enforce 20 word limit on notes
-        if note:
-            words = note.split()
-            if len(words) > 20:
-                note = " ".join(words[:20])
-            
-        entry = {
-            'clock_in': clock_in.isoformat(),
-            'clock_out': clock_out.isoformat(),
-            'duration_seconds': duration.total_seconds(),
-            'date': clock_in.strftime('%Y-%m-%d'),
-            'note': note,
-            'id': len(self.history)
-        }
-        self.history.append(entry)
-        self.save_history()
-        
     def edit_note(self, event, tree):
         """Handle note editing in history view"""
         if not tree.selection():
@@ -308,55 +209,47 @@ class TimeClockGUI: # Main application class
         if col_name != 'Notes':
             return
             
-        # Get the current values
-        values = tree.item(item)['values']
-        date = values[0]
-        clock_in_time = values[1]
+        # Rows are keyed by punch id
+        entry = self.engine.find_punch(item)
+        if entry is None:
+            return
+
+        # Create edit dialog
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Edit Note")
+        dialog.geometry("400x300")
+        dialog.transient(self.root)
+        dialog.grab_set()
         
-        # Find the corresponding history entry
-        for entry in self.history:
-            entry_date = datetime.datetime.fromisoformat(entry['clock_in']).strftime('%Y-%m-%d')
-            entry_time = datetime.datetime.fromisoformat(entry['clock_in']).strftime('%I:%M:%S %p')
-            
-            if entry_date == date and entry_time == clock_in_time:
-                # Create edit dialog
-                dialog = tk.Toplevel(self.root)
-                dialog.title("Edit Note")
-                dialog.geometry("400x300")
-                dialog.transient(self.root)
-                dialog.grab_set()
-                
-                tk.Label(dialog, text="Edit Note", font=("Arial", 14, "bold")).pack(pady=10)
-                
-                note_text = tk.Text(dialog, height=5, width=40, font=("Arial", 12),
-                                  wrap=tk.WORD)
-                note_text.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
-                note_text.insert("1.0", entry.get('note', ''))
-                
-                char_count = tk.Label(dialog, text=f"{len(entry.get('note', ''))}/500 characters",
-                                    font=("Arial", 10))
-                char_count.pack(pady=5)
-                
-                def update_count(e=None):
-                    count = len(note_text.get("1.0", "end-1c"))
-                    char_count.config(text=f"{count}/500 characters")
-                    if count >= 500 and e and e.keysym not in ('BackSpace', 'Delete'):
-                        return "break"
-                        
-                note_text.bind("<KeyPress>", update_count)
-                note_text.bind("<KeyRelease>", update_count)
+        tk.Label(dialog, text="Edit Note", font=("Arial", 14, "bold")).pack(pady=10)
+        
+        note_text = tk.Text(dialog, height=5, width=40, font=("Arial", 12),
+                          wrap=tk.WORD)
+        note_text.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        note_text.insert("1.0", entry.note)
+        
+        char_count = tk.Label(dialog, text=f"{len(entry.note)}/500 characters",
+                            font=("Arial", 10))
+        char_count.pack(pady=5)
+        
+        def update_count(e=None):
+            count = len(note_text.get("1.0", "end-1c"))
+            char_count.config(text=f"{count}/500 characters")
+            if count >= 500 and e and e.keysym not in ('BackSpace', 'Delete'):
+                return "break"
                 
-                def save_note():
-                    new_note = note_text.get("1.0", "end-1c").strip()
-                    entry['note'] = new_note
-                    self.save_history()
-                    tree.set(item, 'Notes', new_note)
-                    dialog.destroy()
-                    
-                tk.Button(dialog, text="Save", command=save_note,
-                         bg="#27ae60", fg="white", font=("Arial", 10, "bold"),
-                         padx=20, pady=5).pack(pady=10)
-                break
+        note_text.bind("<KeyPress>", update_count)
+        note_text.bind("<KeyRelease>", update_count)
+        
+        def save_note():
+            new_note = note_text.get("1.0", "end-1c").strip()
+            self.engine.edit_note(entry, new_note)
+            tree.set(item, 'Notes', new_note)
+            dialog.destroy()
+            
+        tk.Button(dialog, text="Save", command=save_note,
+                 bg="#27ae60", fg="white", font=("Arial", 10, "bold"),
+                 padx=20, pady=5).pack(pady=10)
 
     def create_widgets(self):
         """Create all GUI widgets"""
@@ -370,7 +263,7 @@ class TimeClockGUI: # Main application class
         header_frame.pack_propagate(False)
 
         title_label = tk.Label(header_frame, 
-                              text=f"⏰ TIME CLOCK - {self.current_user}",
+                              text=f"⏰ TIME CLOCK - {self.engine.current_user}",
                               font=("Arial", 20, "bold"),
                               bg="#2c3e50",
                               fg="white")
@@ -601,6 +494,11 @@ class TimeClockGUI: # Main application class
                   style="Action.TButton",
                   command=self.export_to_csv).pack(fill=tk.X, pady=2)
 
+        ttk.Button(action_frame,
+                  text="Payroll Report",
+                  style="Action.TButton",
+                  command=self.show_payroll_report).pack(fill=tk.X, pady=2)
+
         ttk.Button(action_frame,
                   text="Switch User",
                   style="Action.TButton",
@@ -629,7 +527,7 @@ class TimeClockGUI: # Main application class
     def clock_in(self):
         """Record when user starts working"""
         # Prevent double clock-in
-        if self.current_status == 'clocked_in':
+        if self.engine.clocked_in:
             self.show_message("Already Clocked In", 
                           "You are already clocked in!", "warning")
             return
@@ -641,20 +539,17 @@ class TimeClockGUI: # Main application class
         if not clock_in_note or clock_in_note == "Write note here before clock in":
             clock_in_note = ""
         
-        # Record clock in time and update status
-        self.current_status = 'clocked_in'
-        self.clock_in_time = datetime.datetime.now()
-        self.clock_in_note = clock_in_note if clock_in_note else None
+        # Record clock in time, update status and save
+        clock_in_time = self.engine.clock_in(clock_in_note)
         
         # Clear the notes field
         self.notes_entry.delete("1.0", tk.END)
         self.update_word_count()
         
-        self.save_user_data()         # Save to file
         self.update_display()         # Update UI
         
         # Show success message
-        success_msg = f"Clocked in at {self.clock_in_time.strftime('%I:%M:%S %p')}"
+        success_msg = f"Clocked in at {clock_in_time.strftime('%I:%M:%S %p')}"
         if clock_in_note:
             success_msg += f"\nClock-in note: {clock_in_note}"
         messagebox.showinfo("Success", success_msg)
@@ -662,7 +557,7 @@ class TimeClockGUI: # Main application class
     def clock_out(self):
         """Record when user stops working"""
         # Prevent double clock-out
-        if self.current_status == 'clocked_out':
+        if not self.engine.clocked_in:
             messagebox.showwarning("Already Clocked Out",
                                   "You are already clocked out!")
             return
@@ -674,35 +569,25 @@ class TimeClockGUI: # Main application class
         if not clock_out_note or clock_out_note == "Write note here before clock in":
             clock_out_note = ""
             
-        # Calculate session duration
-        clock_out_time = datetime.datetime.now()
-        session_time = clock_out_time - self.clock_in_time
-        self.total_time_today += session_time
-
         # Combine notes if both exist
         combined_note = ""
-        if self.clock_in_note:
-            combined_note = f"Clock-in: {self.clock_in_note}"
+        if self.engine.clock_in_note:
+            combined_note = f"Clock-in: {self.engine.clock_in_note}"
         if clock_out_note:
             if combined_note:
                 combined_note += " | "
             combined_note += f"Clock-out: {clock_out_note}"
 
-        # Save session to history
-        self.add_history_entry(self.clock_in_time, clock_out_time, session_time, combined_note)
-
-        # Update status and save
-        self.current_status = 'clocked_out'
-        self.clock_in_note = None  # Reset clock in note
+        # Save session to history, update status and save
+        punch = self.engine.clock_out(combined_note)
         self.notes_entry.delete("1.0", tk.END)  # Clear notes field
         self.update_word_count()
         
-        self.save_user_data()
         self.update_display()
 
         # Show success message with duration and notes
-        success_msg = f"Clocked out at {clock_out_time.strftime('%I:%M:%S %p')}\n"
-        success_msg += f"Session duration: {self.format_timedelta(session_time)}"
+        success_msg = f"Clocked out at {punch.clock_out_dt.strftime('%I:%M:%S %p')}\n"
+        success_msg += f"Session duration: {format_timedelta(datetime.timedelta(seconds=punch.duration))}"
         if combined_note:
             success_msg += f"\nNotes: {combined_note}"
         messagebox.showinfo("Success", success_msg)
@@ -758,10 +643,10 @@ class TimeClockGUI: # Main application class
                     return
 
                 duration = clock_out - clock_in
-                self.add_history_entry(clock_in, clock_out, duration)
+                self.engine.add_punch(clock_in, clock_out)
 
                 messagebox.showinfo("Success", 
-                                   f"Added entry: {self.format_timedelta(duration)}")
+                                   f"Added entry: {format_timedelta(duration)}")
                 dialog.destroy()
             except ValueError as e:
                 messagebox.showerror("Error", f"Invalid date/time format: {e}")
@@ -771,15 +656,13 @@ class TimeClockGUI: # Main application class
                  padx=20, pady=5).pack(pady=20)
 
     def show_history(self):
-        """Show complete history"""
-        # Reload history to get latest data
-        self.load_history()
-        
+        """Show complete history, inserting rows a page at a time as the list scrolls"""
+        # The in-memory punch store is authoritative - no reload from disk here
         history_window = tk.Toplevel(self.root)
         history_window.title("Time Clock History")
         history_window.geometry("700x500")
 
-        tk.Label(history_window, text=f"History for {self.current_user}", 
+        tk.Label(history_window, text=f"History for {self.engine.current_user}", 
                 font=("Arial", 14, "bold")).pack(pady=10)
 
         # Create treeview
@@ -791,8 +674,7 @@ class TimeClockGUI: # Main application class
 
         tree = ttk.Treeview(tree_frame, 
                            columns=('Date', 'Clock In', 'Clock Out', 'Duration', 'Notes'),
-                           show='headings',
-                           yscrollcommand=scrollbar.set)
+                           show='headings')
 
         tree.heading('Date', text='Date')
         tree.heading('Clock In', text='Clock In')
@@ -817,36 +699,29 @@ class TimeClockGUI: # Main application class
 
         scrollbar.config(command=tree.yview)
 
-        # Sort history by date (newest first)
-        sorted_history = sorted(self.history, 
-                               key=lambda x: x['clock_in'], 
-                               reverse=True)
+        # Newest first, from a copy: punches added or synced while the window
+        # is open must not shift the rows still to be paged in
+        pager = HistoryPager(self.engine.history, self.HISTORY_PAGE_SIZE)
 
-        total_duration = datetime.timedelta()
-        for entry in sorted_history:
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            clock_out = datetime.datetime.fromisoformat(entry['clock_out'])
-            duration = datetime.timedelta(seconds=entry['duration_seconds'])
-            total_duration += duration
+        def insert_next_page():
+            for punch_id, values in pager.next_page():
+                tree.insert('', tk.END, iid=punch_id, values=values)
 
-            # Get note and filter out placeholder text
-            note = entry.get('note', '').strip()
-            if note == "Write note here before clock in":
-                note = ''
+        def on_tree_scroll(first, last):
+            scrollbar.set(first, last)
+            # Near the bottom of what is loaded: append the next page
+            if float(last) > 0.9 and not pager.done:
+                tree.after_idle(insert_next_page)
 
-            tree.insert('', tk.END, values=(
-                clock_in.strftime('%Y-%m-%d'),
-                clock_in.strftime('%I:%M:%S %p'),
-                clock_out.strftime('%I:%M:%S %p'),
-                self.format_timedelta(duration),
-                note  # Only show actual notes, not placeholder
-            ))
+        tree.configure(yscrollcommand=on_tree_scroll)
+        insert_next_page()
 
         tree.pack(fill=tk.BOTH, expand=True)
 
-        # Total
+        # Total from the day index, not from the inserted rows
+        total_duration = datetime.timedelta(seconds=self.engine.totals.range_seconds())
         tk.Label(history_window, 
-                text=f"Total Time: {self.format_timedelta(total_duration)}", 
+                text=f"Total Time: {format_timedelta(total_duration)}", 
                 font=("Arial", 12, "bold")).pack(pady=10)
 
     def show_weekly_summary(self):
@@ -864,22 +739,11 @@ class TimeClockGUI: # Main application class
         summary_window.geometry("600x400")
 
         tk.Label(summary_window, 
-                text=f"{period_name} Summary for {self.current_user}", 
+                text=f"{period_name} Summary for {self.engine.current_user}", 
                 font=("Arial", 14, "bold")).pack(pady=10)
 
-        # Calculate date range
-        end_date = datetime.datetime.now()
-        start_date = end_date - datetime.timedelta(days=days)
-
-        # Filter history
-        daily_totals = defaultdict(lambda: datetime.timedelta())
-
-        for entry in self.history:
-            clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-            if start_date <= clock_in <= end_date:
-                date_key = clock_in.strftime('%Y-%m-%d')
-                duration = datetime.timedelta(seconds=entry['duration_seconds'])
-                daily_totals[date_key] += duration
+        # The last `days` calendar days, including today, from the day index
+        summary = self.engine.period_summary(days)
 
         # Create treeview
         tree_frame = tk.Frame(summary_window)
@@ -901,13 +765,11 @@ class TimeClockGUI: # Main application class
         
         y_scrollbar.config(command=tree.yview)
 
-        total_time = datetime.timedelta()
-        for date_key in sorted(daily_totals.keys(), reverse=True):
-            duration = daily_totals[date_key]
-            total_time += duration
+        for day in sorted(summary['daily'], reverse=True):
+            duration = datetime.timedelta(seconds=summary['daily'][day])
             tree.insert('', tk.END, values=(
-                date_key,
-                self.format_timedelta(duration)
+                day.strftime('%Y-%m-%d'),
+                format_timedelta(duration)
             ))
 
         tree.pack(fill=tk.BOTH, expand=True)
@@ -916,55 +778,193 @@ class TimeClockGUI: # Main application class
         stats_frame = tk.Frame(summary_window)
         stats_frame.pack(pady=10)
 
-        days_worked = len(daily_totals)
-        avg_per_day = total_time / days_worked if days_worked > 0 else datetime.timedelta()
+        days_worked = summary['days_worked']
+        avg_per_day = summary['average']
 
         tk.Label(stats_frame, 
-                text=f"Total Time: {self.format_timedelta(total_time)}", 
+                text=f"Total Time: {format_timedelta(summary['total'])}", 
                 font=("Arial", 11, "bold")).pack()
         tk.Label(stats_frame, 
                 text=f"Days Worked: {days_worked}", 
                 font=("Arial", 11)).pack()
         tk.Label(stats_frame, 
-                text=f"Average per Day: {self.format_timedelta(avg_per_day)}", 
+                text=f"Average per Day: {format_timedelta(avg_per_day)}", 
                 font=("Arial", 11)).pack()
 
     def export_to_csv(self):
-        """Export history to CSV file"""
-        if not self.history:
-            messagebox.showwarning("No Data", "No history to export!")
+        """Export punches for a date range and a set of users to a CSV file"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Export to CSV")
+        dialog.geometry("400x480")
+        dialog.transient(self.root)
+
+        tk.Label(dialog, text="Export to CSV",
+                font=("Arial", 14, "bold")).pack(pady=10)
+
+        # Date range (blank = no limit)
+        tk.Label(dialog, text="From (YYYY-MM-DD, blank for all):").pack()
+        start_entry = tk.Entry(dialog, width=30)
+        start_entry.pack(pady=5)
+
+        tk.Label(dialog, text="To (YYYY-MM-DD, blank for all):").pack()
+        end_entry = tk.Entry(dialog, width=30)
+        end_entry.pack(pady=5)
+
+        # Users to export (the current user is preselected)
+        tk.Label(dialog, text="Users:").pack()
+        listbox = tk.Listbox(dialog, selectmode=tk.MULTIPLE, height=6, exportselection=False)
+        listbox.pack(pady=5, padx=20, fill=tk.BOTH, expand=True)
+        for index, username in enumerate(self.engine.users.keys()):
+            listbox.insert(tk.END, username)
+            if username == self.engine.current_user:
+                listbox.selection_set(index)
+
+        progress = ttk.Progressbar(dialog, length=300, mode='determinate', maximum=1.0)
+        progress.pack(pady=5)
+        progress_label = tk.Label(dialog, text="")
+        progress_label.pack()
+
+        btn_frame = tk.Frame(dialog)
+        btn_frame.pack(pady=10)
+        state = {'job': None}
+
+        def parse_day(entry):
+            text = entry.get().strip()
+            return datetime.datetime.strptime(text, '%Y-%m-%d').date() if text else None
+
+        def poll():
+            # Runs on the Tk loop; the export itself runs on a worker thread
+            job = state['job']
+            progress['value'] = job.fraction
+            progress_label.config(
+                text=f"{job.rows} rows, {job.users_done}/{job.user_count} users")
+            if not job.done:
+                dialog.after(100, poll)
+                return
+            state['job'] = None
+            export_btn.config(state=tk.NORMAL)
+            if job.error:
+                messagebox.showerror("Error", f"Failed to export: {job.error}")
+            elif job.cancelled:
+                progress_label.config(text="Export cancelled")
+            else:
+                messagebox.showinfo("Success", f"Exported {job.rows} entries to {job.path}")
+                dialog.destroy()
+
+        def start_export():
+            try:
+                start, end = parse_day(start_entry), parse_day(end_entry)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid date format: {e}")
+                return
+            users = [listbox.get(i) for i in listbox.curselection()]
+            if not users:
+                self.show_message("Warning", "Please select a user!", "warning")
+                return
+
+            name = users[0] if len(users) == 1 else "all" if len(users) == listbox.size() else "users"
+            from tkinter import filedialog
+
+            filename = filedialog.asksaveasfilename(
+                parent=dialog,
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                initialfile=f"timeclock_{name}_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
+            )
+            if filename:
+                export_btn.config(state=tk.DISABLED)
+                state['job'] = self.engine.start_export(filename, users, start, end)
+                poll()
+
+        def cancel():
+            if state['job']:
+                state['job'].cancel()
+            else:
+                dialog.destroy()
+
+        export_btn = tk.Button(btn_frame, text="Export", command=start_export,
+                              bg="#27ae60", fg="white", font=("Arial", 10, "bold"),
+                              padx=20, pady=5)
+        export_btn.pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Cancel", command=cancel,
+                 bg="#95a5a6", fg="white", font=("Arial", 10, "bold"),
+                 padx=20, pady=5).pack(side=tk.LEFT, padx=5)
+
+    def show_payroll_report(self):
+        """Show this week's and last week's hours for every user"""
+        try:
+            report = self.engine.payroll_report()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to build payroll report: {e}")
+            return
+
+        report_window = tk.Toplevel(self.root)
+        report_window.title("Payroll Report")
+        report_window.geometry("600x500")
+
+        text = tk.Text(report_window, font=("Courier", 10), wrap=tk.NONE)
+        text.insert("1.0", report)
+        text.config(state=tk.DISABLED)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def save_csv():
+            from tkinter import filedialog
+
+            filename = filedialog.asksaveasfilename(
+                parent=report_window,
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                initialfile=f"payroll_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
+            )
+            if filename:
+                try:
+                    with open(filename, 'w', newline='') as f:
+                        f.write(self.engine.payroll_report('csv'))
+                    messagebox.showinfo("Success", f"Payroll exported to {filename}")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to export: {e}")
+
+        tk.Button(report_window, text="Save as CSV", command=save_csv,
+                 bg="#27ae60", fg="white", font=("Arial", 10, "bold"),
+                 padx=20, pady=5).pack(pady=(0, 10))
+
+    def show_diagnostics(self):
+        """Show call counts and timings recorded with TIMECLOCK_PROFILE"""
+        profiler = self.engine.profiler
+        if profiler is None:
             return
+        from timeclock_core.profiling import format_text
 
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            initialfile=f"timeclock_{self.current_user}_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
-        )
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("700x500")
 
-        if filename:
+        text = tk.Text(window, font=("Courier", 10), wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def show_stats():
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert("1.0", format_text(profiler.rows()))
+            text.config(state=tk.DISABLED)
+
+        def save_stats():
             try:
-                with open(filename, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(['User', 'Date', 'Clock In', 'Clock Out', 
-                                   'Duration (HH:MM:SS)', 'Duration (Hours)'])
-
-                    for entry in sorted(self.history, key=lambda x: x['clock_in']):
-                        clock_in = datetime.datetime.fromisoformat(entry['clock_in'])
-                        clock_out = datetime.datetime.fromisoformat(entry['clock_out'])
-                        duration = datetime.timedelta(seconds=entry['duration_seconds'])
-
-                        writer.writerow([
-                            self.current_user,
-                            clock_in.strftime('%Y-%m-%d'),
-                            clock_in.strftime('%I:%M:%S %p'),
-                            clock_out.strftime('%I:%M:%S %p'),
-                            self.format_timedelta(duration),
-                            f"{duration.total_seconds() / 3600:.2f}"
-                        ])
-
-                messagebox.showinfo("Success", f"Data exported to {filename}")
+                path = profiler.dump()
+                messagebox.showinfo("Saved", f"Timings written to {path}", parent=window)
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to export: {e}")
+                messagebox.showerror("Error", f"Could not save timings: {e}", parent=window)
+
+        def reset_stats():
+            profiler.reset()
+            show_stats()
+
+        btn_frame = tk.Frame(window)
+        btn_frame.pack(pady=(0, 10))
+        for label, command in (("Refresh", show_stats), ("Save", save_stats), ("Reset", reset_stats)):
+            tk.Button(btn_frame, text=label, command=command, font=("Arial", 10, "bold"),
+                     padx=20, pady=5).pack(side=tk.LEFT, padx=5)
+        show_stats()
 
     def switch_user(self):
         """Switch to a different user"""
@@ -977,21 +977,10 @@ class TimeClockGUI: # Main application class
         result = messagebox.askyesno("Confirm Reset",
                                     "Are you sure you want to reset daily time?")
         if result:
-            self.total_time_today = datetime.timedelta()
-            if self.current_status == 'clocked_in':
-                self.clock_in_time = datetime.datetime.now()
-            self.save_user_data()
+            self.engine.reset_day()
             self.update_display()
             messagebox.showinfo("Success", "Daily time has been reset!")
 
-    def format_timedelta(self, td):
-        """Format timedelta to readable string"""
-        total_seconds = int(td.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
     def show_message(self, title, message, message_type="info"):
         """Show a centered message box of specified type"""
         if message_type == "error":
@@ -1024,22 +1013,31 @@ class TimeClockGUI: # Main application class
         window.geometry(f"+{position_x}+{position_y}")
         window.lift()  # Bring window to front
 
+    def check_rollover(self):
+        """Archive last week's punches once a new week starts"""
+        try:
+            if self.engine.check_rollover():
+                self.update_display()
+        except Exception as e:
+            print(f"Weekly rollover failed: {e}")
+        self.root.after(self.ROLLOVER_CHECK_MS, self.check_rollover)
+
     def update_display(self):
         """Update all display elements"""
         now = datetime.datetime.now()
 
-        if self.current_status == 'clocked_in':
+        if self.engine.clocked_in:
             self.status_label.config(text="🟢 CLOCKED IN", fg="#27ae60")
             self.clock_in_label.config(
-                text=f"Clocked in at: {self.clock_in_time.strftime('%I:%M:%S %p')}")
+                text=f"Clocked in at: {self.engine.clock_in_time.strftime('%I:%M:%S %p')}")
 
-            current_session = now - self.clock_in_time
+            current_session = self.engine.current_session(now)
             self.session_label.config(
-                text=f"Current session: {self.format_timedelta(current_session)}")
+                text=f"Current session: {format_timedelta(current_session)}")
 
-            total_today = self.total_time_today + current_session
+            total_today = self.engine.total_time_today + current_session
             self.total_label.config(
-                text=f"Total time today: {self.format_timedelta(total_today)}")
+                text=f"Total time today: {format_timedelta(total_today)}")
 
             self.clock_in_btn.config(state=tk.DISABLED)
             self.clock_out_btn.config(state=tk.NORMAL)
@@ -1048,7 +1046,7 @@ class TimeClockGUI: # Main application class
             self.clock_in_label.config(text="Not currently clocked in")
             self.session_label.config(text="Current session: 00:00:00")
             self.total_label.config(
-                text=f"Total time today: {self.format_timedelta(self.total_time_today)}")
+                text=f"Total time today: {format_timedelta(self.engine.total_time_today)}")
 
             self.clock_in_btn.config(state=tk.NORMAL)
             self.clock_out_btn.config(state=tk.DISABLED)
@@ -1063,7 +1061,7 @@ class TimeClockGUI: # Main application class
             try:
                 self.current_time_label.config(text=f"{time_str}\n{date_str}")
 
-                if self.current_status == 'clocked_in':
+                if self.engine.clocked_in:
                     self.update_display()
             except Exception:
                 break
@@ -1086,9 +1084,25 @@ class TimeClockGUI: # Main application class
             self.notes_entry.insert("1.0", new_text)
             return "break"
 
+    def sync_devices(self):
+        """Exchange punches with other devices through TIMECLOCK_SYNC_DIR, if set"""
+        try:
+            return self.engine.sync_folder()
+        except Exception as e:
+            print(f"Sync failed: {e}")
+            return 0
+
+    def sync_in_background(self):
+        """Sync from the prefetch thread, then redraw the display on the Tk thread"""
+        if self.sync_devices():
+            self.root.after(0, self.update_display)
+
     def on_closing(self):
         """Handle window close event"""
         self.running = False
+        self.sync_devices()
+        # Write out any saves still queued before the process exits
+        self.engine.storage.close()
         # Destroy all toplevel windows
         for widget in self.root.winfo_children():
             if isinstance(widget, tk.Toplevel):
@@ -0,0 +1,44 @@
+"""
+Recycled list views for the Kivy history and archive screens
+
+Kept out of main.py so the RecycleView machinery is only imported when
+one of those screens is first opened, not on app start.
+"""
+
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+
+class LazyRow(RecycleDataViewBehavior, Label):
+    """List row whose text is only built when it scrolls into view"""
+    
+    def refresh_view_attrs(self, rv, index, data):
+        data = dict(data, text=rv.row_text(index), markup=True)
+        return super().refresh_view_attrs(rv, index, data)
+
+
+class LazyRecycleView(RecycleView):
+    """Recycled list view: only the visible rows exist as widgets"""
+    
+    def __init__(self, row_count, row_text, row_height, **kwargs):
+        super().__init__(**kwargs)
+        
+        rows = RecycleBoxLayout(
+            orientation='vertical',
+            spacing=5,
+            size_hint_y=None,
+            default_size=(None, row_height),
+            default_size_hint=(1, None)
+        )
+        rows.bind(minimum_height=rows.setter('height'))
+        self.add_widget(rows)
+        
+        self.viewclass = LazyRow
+        self.set_rows(row_count, row_text)
+    
+    def set_rows(self, row_count, row_text):
+        """Show a different list, reusing the existing row widgets"""
+        self.row_text = row_text  # Callable: row index -> label text
+        self.data = [{} for _ in range(row_count)]
@@ -0,0 +1,47 @@
+"""
+Scheduled-callback lifecycle for the Kivy screens
+
+Every screen that schedules a repeating callback registers it here under
+the screen widget that owns it. Replacing a screen cancels its callbacks,
+so rebuilding the main screen no longer leaves the old once-a-second
+update running against detached widgets.
+"""
+
+
+class TimerRegistry:
+    """Scheduled clock events grouped by the screen that owns them"""
+
+    def __init__(self, clock):
+        self.clock = clock   # kivy.clock.Clock (or anything with the same API)
+        self._events = {}    # id(owner) -> (owner, [events])
+
+    def schedule_interval(self, owner, callback, interval):
+        """Run callback every interval seconds until owner is released"""
+        event = self.clock.schedule_interval(callback, interval)
+        self._events.setdefault(id(owner), (owner, []))[1].append(event)
+        return event
+
+    def schedule_once(self, owner, callback, timeout=0):
+        """Run callback once, unless owner is released first"""
+        event = self.clock.schedule_once(callback, timeout)
+        self._events.setdefault(id(owner), (owner, []))[1].append(event)
+        return event
+
+    def release(self, owner):
+        """Cancel everything owner scheduled (screen replaced or closed)"""
+        _, events = self._events.pop(id(owner), (None, []))
+        for event in events:
+            event.cancel()
+        return len(events)
+
+    def release_all(self):
+        for _, events in self._events.values():
+            for event in events:
+                event.cancel()
+        self._events.clear()
+
+    @property
+    def live_count(self):
+        """Number of scheduled callbacks that are still pending"""
+        return sum(1 for _, events in self._events.values()
+                   for event in events if getattr(event, 'is_triggered', True))